@@ -0,0 +1,201 @@
+from __future__ import annotations
+import json
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metricas as prom
+
+# Dimensões aceitas em group_by -> expressão sobre o fato (vw_analytics f) e a UF (cu)
+DIMENSOES = {
+    'uf': "COALESCE(cu.uf_sigla, 'Não informado')",
+    'tipo': "COALESCE(f.tipo, 'Não informado')",
+    'tipo_servico': "COALESCE(f.tipo_servico, 'Não informado')",
+    'fase': "COALESCE(f.fase, 'Não informado')",
+    'zona_portuaria': 'f.zona_portuaria',
+    'porto': "f.zona_portuaria || ' - ' || f.obj_concessao",
+}
+
+# Medidas -> (coluna de vw_analytics, grão). Medidas do porto se repetem em cada linha
+# de serviço e por isso só são contadas uma vez por porto dentro de cada grupo.
+MEDIDAS = {
+    'capex_total': ('capex_total', 'porto'),
+    'capex_executado': ('capex_executado', 'porto'),
+    'progress': ('progresso', 'porto'),
+    'ports': ('cadastro_id', 'porto'),
+    'capex_servico': ('capex_servico', 'servico'),
+    'perc_capex': ('perc_capex', 'servico'),
+    'valor_executado': ('valor_executado', 'servico'),
+    'perc_executada': ('perc_executada', 'servico'),
+    'services': ('servico_id', 'servico'),
+}
+
+FUNCOES = ('sum', 'avg', 'min', 'max', 'count')
+
+# Níveis do cubo pré-calculados a cada revisão dos dados, com as métricas padrão
+METRICAS_PADRAO = (
+    'count(ports)', 'count(services)', 'sum(capex_total)', 'sum(capex_executado)',
+    'avg(progress)', 'sum(capex_servico)', 'sum(valor_executado)', 'avg(perc_executada)',
+)
+NIVEIS_CUBO = (
+    (), ('uf',), ('tipo',), ('tipo_servico',), ('fase',),
+    ('uf', 'tipo'), ('tipo', 'tipo_servico'), ('tipo_servico', 'fase'),
+    ('uf', 'tipo', 'tipo_servico', 'fase'),
+)
+
+_METRICA = re.compile(r'^(\w+)\((\w+|\*)\)$')
+
+def parse_group_by(texto: Optional[str]) -> Tuple[str, ...]:
+    """'uf,tipo' -> ('uf', 'tipo'). Levanta ValueError para dimensões desconhecidas ou repetidas."""
+    dims = tuple(d.strip().lower() for d in (texto or '').split(',') if d.strip())
+    for d in dims:
+        if d not in DIMENSOES:
+            raise ValueError(f'dimensão inválida: {d} (use {", ".join(DIMENSOES)})')
+    if len(set(dims)) != len(dims):
+        raise ValueError('dimensão repetida em group_by')
+    return dims
+
+def parse_metrics(texto: Optional[str]) -> Tuple[str, ...]:
+    """'sum(capex_total),avg(progress)' -> métricas normalizadas. Levanta ValueError se inválidas."""
+    if not texto:
+        return METRICAS_PADRAO
+    metricas = []
+    for bruto in re.split(r',(?![^(]*\))', texto):
+        metrica = re.sub(r'\s+', '', bruto).lower()
+        m = _METRICA.match(metrica)
+        if not m or m.group(1) not in FUNCOES or (m.group(2) not in MEDIDAS and metrica != 'count(*)'):
+            raise ValueError(f'métrica inválida: {bruto.strip()} (use <{"|".join(FUNCOES)}>(<{"|".join(MEDIDAS)}>))')
+        if metrica not in metricas:
+            metricas.append(metrica)
+    return tuple(metricas)
+
+def compilar(dims: Sequence[str], metricas: Sequence[str]) -> str:
+    """Monta a consulta: um único GROUP BY sobre vw_analytics.
+
+    A UF só entra na consulta quando pedida: um porto com várias UFs aparece
+    em cada uma delas (atribuição integral), mas nunca é contado duas vezes
+    dentro do mesmo grupo nem quando a UF não faz parte do agrupamento.
+    O mesmo vale para tipo_servico/fase em relação às medidas do porto.
+    """
+    grupos = [f'd{i}' for i in range(len(dims))]
+    chaves = ''.join(f'{DIMENSOES[d]} AS d{i}, ' for i, d in enumerate(dims))
+    particao = ', '.join([DIMENSOES[d] for d in dims] + ['f.cadastro_id'])
+    join_uf = 'LEFT JOIN cadastro_uf cu ON cu.cadastro_id = f.cadastro_id' if 'uf' in dims else ''
+
+    colunas = []
+    for metrica in metricas:
+        funcao, medida = _METRICA.match(metrica).groups()
+        if metrica == 'count(*)':
+            expr = 'COUNT(*)'
+        else:
+            coluna, grao = MEDIDAS[medida]
+            valor = f'CASE WHEN primeiro_do_porto THEN {coluna} END' if grao == 'porto' else coluna
+            expr = f'{funcao.upper()}({valor})'
+        colunas.append(f'{expr} AS "{metrica}"')
+
+    agrupamento = f"GROUP BY {', '.join(grupos)} ORDER BY {', '.join(grupos)}" if dims else ''
+    return f"""
+SELECT {', '.join(grupos + colunas)}
+FROM (
+    SELECT f.*, {chaves}ROW_NUMBER() OVER (PARTITION BY {particao}) = 1 AS primeiro_do_porto
+    FROM vw_analytics f
+    {join_uf}
+)
+{agrupamento}
+"""
+
+def executar(conn: sqlite3.Connection, dims: Sequence[str], metricas: Sequence[str]) -> List[dict]:
+    """Roda a consulta compilada e devolve uma linha (dict) por grupo."""
+    linhas = []
+    for row in conn.execute(compilar(dims, metricas)):
+        linha = dict(zip(dims, row[:len(dims)]))
+        linha.update(zip(metricas, row[len(dims):]))
+        linhas.append(linha)
+    return linhas
+
+def revisao(conn: sqlite3.Connection) -> int:
+    """Revisão atual dos dados (incrementada pelos triggers de db.init_db)."""
+    row = conn.execute('SELECT valor FROM revisao_dados WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+def _identidade(conn: sqlite3.Connection) -> Tuple[str, str]:
+    """Arquivo e época do banco: a revisão recomeça do zero quando o banco é recriado."""
+    arquivo = conn.execute('PRAGMA database_list').fetchone()[2]
+    row = conn.execute('SELECT epoca FROM revisao_dados WHERE id = 1').fetchone()
+    return arquivo, row[0] if row else ''
+
+def precomputar(conn: sqlite3.Connection) -> int:
+    """Calcula todos os níveis do cubo para a revisão atual (se ainda não
+    calculados) e descarta os de revisões antigas. Retorna a revisão.
+
+    Chamado no caminho de escrita (db.save_* e db.save_all_diferencial, depois
+    do commit); as consultas só leem o cubo.
+    """
+    rev = revisao(conn)
+    if conn.execute('SELECT 1 FROM analytics_cubo WHERE revisao = ? LIMIT 1', (rev,)).fetchone():
+        return rev
+    niveis = [(rev, ','.join(dims), json.dumps(executar(conn, dims, METRICAS_PADRAO))) for dims in NIVEIS_CUBO]
+    conn.execute('DELETE FROM analytics_cubo WHERE revisao <> ?', (rev,))
+    conn.executemany('INSERT OR REPLACE INTO analytics_cubo (revisao, group_by, resultado) VALUES (?, ?, ?)', niveis)
+    conn.commit()
+    return rev
+
+def _do_cubo(conn: sqlite3.Connection, rev: int, dims: Tuple[str, ...], metricas: Tuple[str, ...]) -> Optional[List[dict]]:
+    """Resultado de um nível pré-calculado, se a consulta puder ser atendida por ele."""
+    if dims not in NIVEIS_CUBO or not set(metricas) <= set(METRICAS_PADRAO):
+        return None
+    row = conn.execute('SELECT resultado FROM analytics_cubo WHERE revisao = ? AND group_by = ?',
+                       (rev, ','.join(dims))).fetchone()
+    if row is None:
+        return None  # cubo ainda não calculado para esta revisão (ex.: alteração fora de db.py)
+    return [{**{d: l[d] for d in dims}, **{m: l[m] for m in metricas}} for l in json.loads(row[0])]
+
+
+class _Cache:
+    """LRU em memória de resultados por (consulta, revisão dos dados)."""
+
+    def __init__(self, tamanho: int = 128):
+        self.tamanho = tamanho
+        self.itens: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, chave):
+        with self.lock:
+            if chave in self.itens:
+                self.itens.move_to_end(chave)
+                return self.itens[chave]
+        return None
+
+    def put(self, chave, valor):
+        with self.lock:
+            self.itens[chave] = valor
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.tamanho:
+                self.itens.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.itens.clear()
+
+
+cache = _Cache()
+
+def consultar(conn: sqlite3.Connection, dims: Sequence[str], metricas: Sequence[str]) -> Dict:
+    """Consulta analítica com cache: memória -> cubo pré-calculado -> SQL."""
+    dims, metricas = tuple(dims), tuple(metricas)
+    rev = revisao(conn)
+    chave = (_identidade(conn), dims, metricas, rev)
+    linhas = cache.get(chave)
+    origem = 'memoria'
+    prom.cache('analytics', linhas is not None)
+    if linhas is None:
+        linhas = _do_cubo(conn, rev, dims, metricas)
+        origem = 'cubo'
+        prom.cache('analytics_cubo', linhas is not None)
+        if linhas is None:
+            linhas = executar(conn, dims, metricas)
+            origem = 'sql'
+        cache.put(chave, linhas)
+    return {'revision': rev, 'source': origem, 'rows': linhas}
@@ -1,15 +1,53 @@
 from __future__ import annotations
 import sqlite3
+import csv
+import io
 import json
 import os
+import queue
+import time
 from pathlib import Path
-from flask import Flask, jsonify, request
+from datetime import date
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import db
+import clusters
+import spatial
+import search
+import rollup
+import kpis
+import analytics
+import changes
+import events
+import importacao
+import consultas
+import metricas as prom
+import perfilador
+import trechos
 
 app = Flask(__name__)
 CORS(app)
 
+# Fotografias diárias de KPIs em segundo plano (ex.: no gunicorn, KPI_SNAPSHOT_INTERVAL=3600)
+if os.environ.get('KPI_SNAPSHOT_INTERVAL'):
+    kpis.iniciar_agendador(float(os.environ['KPI_SNAPSHOT_INTERVAL']))
+
+# Comandos SQL e tempo de cada requisição no log (JSON), com aviso de N+1
+if os.environ.get('SQL_CONTADOR'):
+    consultas.registrar_flask(app, 'api')
+
+# Relatório do perfil de consultas (SQL_PERFIL=1) em /debug/sql, protegido por DEBUG_TOKEN
+consultas.registrar_debug(app)
+
+# Métricas Prometheus em /metrics, somadas entre os workers com METRICAS_DIR;
+# METRICAS_SQL=1 inclui tempo e comandos de SQL por requisição
+if os.environ.get('METRICAS_SQL'):
+    consultas.instalar()
+prom.registrar_flask(app, 'api', bancos=lambda: {'portos': db.DB_PATH})
+
+# Perfil de uma requisição sob demanda (?__profile=1|resumo|pilhas), só com DEBUG_TOKEN
+perfilador.registrar(app, 'api')
+
 @app.route('/')
 def home():
     """Health check simples na raiz"""
@@ -28,99 +66,440 @@ def health_check():
         'version': '1.0.0'
     })
 
+def _project_from_row(row) -> dict:
+    """Converte uma linha de db.SQL_PORTOS no formato do dashboard"""
+    return {
+        'id': str(row['id']),
+        'name': row['name'] or f"Porto {row['id']}",
+        'description': row['description'] or '',
+        'sector': 'Portos',
+        'status': db.status_progresso(row['progress_percentage']),
+        'progress': float(row['progress_percentage'] or 0) * 100,
+        'investment': float(row['investment'] or 0),
+        'contractDate': row['contract_date'] or '',
+        'fullDescription': row['full_description'] or '',
+        'projectType': row['project_type'] or 'Concessão',
+        'states': row['ufs'].split(',') if row['ufs'] else [],
+        'totalServices': row['total_services'] or 0,
+        'totalUpdates': row['total_updates'] or 0,
+        'coordinates': {
+            'utm_e': row['coord_e_utm'],
+            'utm_n': row['coord_s_utm'],
+            'fuso': row['fuso'],
+            'lat': row['latitude'],
+            'lon': row['longitude']
+        }
+    }
+
+def _as_of_param():
+    """Valor de ?as_of=AAAA-MM-DD (None se ausente). Levanta ValueError se inválido."""
+    texto = request.args.get('as_of')
+    return rollup.parse_data(texto) if texto else None
+
+def _aplicar_as_of(conn, rows, as_of) -> list:
+    """Troca progresso e total de atualizações das linhas de db.SQL_PORTOS pelos valores na data as_of"""
+    progresso = rollup.progresso_em(conn, as_of)
+    atualizacoes = dict(conn.execute(db.SQL_ATUALIZACOES_POR_PORTO_EM, {'data': as_of}).fetchall())
+    linhas = []
+    for row in rows:
+        linha = dict(row)
+        linha['progress_percentage'] = progresso.get(row['id'], 0)
+        linha['total_updates'] = atualizacoes.get(row['id'], 0)
+        linhas.append(linha)
+    return linhas
+
 @app.route('/api/portos', methods=['GET'])
 def get_portos():
-    """Retorna todos os portos com dados completos para o dashboard"""
+    """Retorna todos os portos com dados completos para o dashboard.
+    
+    Com ?bbox=oeste,sul,leste,norte retorna apenas os portos visíveis no mapa;
+    com ?as_of=AAAA-MM-DD, o progresso como estava naquela data.
+    """
+    try:
+        bbox = spatial.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetro bbox inválido: use bbox=oeste,sul,leste,norte'}), 400
+    try:
+        as_of = _as_of_param()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro as_of inválido: use as_of=AAAA-MM-DD'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.row_factory = sqlite3.Row
+        
+        if bbox:
+            query = db.SQL_PORTOS.format(where=spatial.bbox_filter(conn), order='c.id')
+            params = spatial.bbox_params(bbox)
+        else:
+            query, params = db.SQL_PORTOS.format(where='1', order=db.PORTOS_ORDEM_NOME), ()
+        
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchall()
+        if as_of:
+            rows = _aplicar_as_of(conn, rows, as_of)
+        conn.close()
+        
+        projects = [_project_from_row(row) for row in rows]
+        return jsonify(projects)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/portos/nearest', methods=['GET'])
+def get_portos_nearest():
+    """Retorna os k portos mais próximos de um ponto (?lat=&lon=&k=5)"""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        k = int(request.args.get('k', 5))
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or k < 1:
+            raise ValueError
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Parâmetros inválidos: use lat, lon e k (k >= 1)'}), 400
+    
     try:
         conn = sqlite3.connect(db.DB_PATH)
         conn.row_factory = sqlite3.Row
         
-        query = """
-        SELECT 
-            c.id,
-            c.zona_portuaria as name,
-            c.obj_concessao as description,
-            c.tipo as project_type,
-            c.capex_total as investment,
-            c.data_ass_contrato as contract_date,
-            c.descricao as full_description,
-            c.coord_e_utm,
-            c.coord_s_utm,
-            c.fuso,
-            GROUP_CONCAT(DISTINCT uf.sigla) as ufs,
-            COUNT(DISTINCT s.id) as total_services,
-            COUNT(DISTINCT a.id) as total_updates,
-            COALESCE(MAX(a.perc_executada), 0) as progress_percentage,
-            CASE 
-                WHEN MAX(a.perc_executada) >= 0.9 THEN 'Concluído'
-                WHEN MAX(a.perc_executada) > 0 THEN 'Em Andamento'
-                ELSE 'Planejamento'
-            END as status
-        FROM cadastro c
-        LEFT JOIN cadastro_uf cu ON c.id = cu.cadastro_id
-        LEFT JOIN uf uf ON cu.uf_sigla = uf.sigla
-        LEFT JOIN servico s ON c.id = s.cadastro_id
-        LEFT JOIN acompanhamento a ON s.id = a.servico_id
-        GROUP BY c.id
-        ORDER BY c.zona_portuaria
-        """
+        vizinhos = spatial.nearest(conn, lat, lon, min(k, 100))
+        if not vizinhos:
+            conn.close()
+            return jsonify([])
         
-        cursor = conn.execute(query)
+        distancias = dict(vizinhos)
+        placeholders = ','.join('?' * len(distancias))
+        cursor = conn.execute(db.SQL_PORTOS.format(where=f'c.id IN ({placeholders})', order='c.id'), list(distancias))
         rows = cursor.fetchall()
         conn.close()
         
         projects = []
         for row in rows:
-            project = {
-                'id': str(row['id']),
-                'name': row['name'] or f"Porto {row['id']}",
-                'description': row['description'] or '',
-                'sector': 'Portos',
-                'status': row['status'] or 'Planejamento',
-                'progress': float(row['progress_percentage'] or 0) * 100,
-                'investment': float(row['investment'] or 0),
-                'contractDate': row['contract_date'] or '',
-                'fullDescription': row['full_description'] or '',
-                'projectType': row['project_type'] or 'Concessão',
-                'states': row['ufs'].split(',') if row['ufs'] else [],
-                'totalServices': row['total_services'] or 0,
-                'totalUpdates': row['total_updates'] or 0,
-                'coordinates': {
-                    'utm_e': row['coord_e_utm'],
-                    'utm_n': row['coord_s_utm'],
-                    'fuso': row['fuso']
-                }
-            }
+            project = _project_from_row(row)
+            project['distanceKm'] = round(distancias[row['id']], 3)
             projects.append(project)
-        
+        projects.sort(key=lambda p: p['distanceKm'])
         return jsonify(projects)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/portos/clusters', methods=['GET'])
+def get_portos_clusters():
+    """Retorna clusters/portos visíveis para um bbox e zoom (mapa de todas as concessões)"""
+    try:
+        bbox = [float(v) for v in request.args.get('bbox', '-180,-90,180,90').split(',')]
+        zoom = float(request.args.get('zoom', 4))
+        if len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos: use bbox=oeste,sul,leste,norte&zoom=<n>'}), 400
+    
+    try:
+        features = clusters.get_index().get_clusters(tuple(bbox), zoom)
+        return jsonify({'zoom': zoom, 'features': features})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/portos/rollup', methods=['GET'])
+def get_portos_rollup():
+    """Progresso ponderado por CAPEX agregado por portfólio, UF ou tipo (?by=portfolio|uf|tipo&as_of=AAAA-MM-DD)"""
+    por = request.args.get('by', 'portfolio')
+    if por not in rollup.DIMENSOES:
+        return jsonify({'error': f'Parâmetro inválido: use by={"|".join(rollup.DIMENSOES)}'}), 400
+    try:
+        as_of = _as_of_param()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro as_of inválido: use as_of=AAAA-MM-DD'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        linhas = rollup.rollup(conn, por, as_of)
+        conn.close()
+        return jsonify({'by': por, 'asOf': as_of, 'groups': [{
+            'key': l['chave'],
+            'ports': l['portos'],
+            'progress': (l['progresso'] or 0) * 100,
+            'unweightedProgress': (l['progresso_simples'] or 0) * 100,
+            'capexTotal': l['capex_total'] or 0,
+        } for l in linhas]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/portos/history', methods=['GET'])
+def get_portos_history():
+    """Progresso ponderado mês a mês a partir das fotografias mensais.
+    
+    ?from=AAAA-MM&to=AAAA-MM (padrão: os últimos 60 meses) e, opcionalmente,
+    ?porto=<id> para a série de um único porto.
+    """
+    try:
+        hoje = date.today()
+        ate = rollup.parse_mes(request.args.get('to', hoje.strftime('%Y-%m')))
+        ano, mes = map(int, ate.split('-'))
+        inicio = ano * 12 + mes - 1 - 59
+        inicio_padrao = f'{inicio // 12:04d}-{inicio % 12 + 1:02d}'
+        de = rollup.parse_mes(request.args.get('from', inicio_padrao))
+        porto_id = int(request.args['porto']) if request.args.get('porto') else None
+        if de > ate:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos: use from=AAAA-MM&to=AAAA-MM (from <= to)&porto=<id>'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        serie = rollup.serie_mensal(conn, de, ate, porto_id)
+        conn.close()
+        return jsonify({'from': de, 'to': ate, 'porto': porto_id, 'points': [
+            {'month': p['mes'], 'progress': (p['progresso'] or 0) * 100} for p in serie
+        ]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/kpis/trend', methods=['GET'])
+def get_kpis_trend():
+    """Série dos KPIs do dashboard lida de kpi_snapshot (diária, semanal e mensal).
+    
+    ?dimension=portfolio|uf|tipo&key=<UF ou tipo>&from=AAAA-MM-DD&to=AAAA-MM-DD
+    """
+    dimensao = request.args.get('dimension', 'portfolio')
+    chave = request.args.get('key', 'Portfólio' if dimensao == 'portfolio' else '')
+    try:
+        if dimensao not in rollup.DIMENSOES or not chave:
+            raise ValueError
+        de = rollup.parse_data(request.args['from']) if request.args.get('from') else '0000-01-01'
+        ate = rollup.parse_data(request.args['to']) if request.args.get('to') else '9999-12-31'
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos: use dimension=portfolio|uf|tipo&key=<valor>&from=AAAA-MM-DD&to=AAAA-MM-DD'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        serie = kpis.tendencia(conn, dimensao, chave, de, ate)
+        conn.close()
+        return jsonify({'dimension': dimensao, 'key': chave, 'points': [{
+            'date': p['periodo'],
+            'granularity': p['granularidade'],
+            'totalProjects': p['portos'],
+            'totalInvestment': p['investimento'],
+            'averageProgress': (p['progresso'] or 0) * 100,
+            'totalServices': p['servicos'],
+        } for p in serie]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Tabela dinâmica: ?group_by=uf,tipo&metrics=sum(capex_total),avg(progress)
+    
+    Dimensões: uf, tipo, tipo_servico, fase, zona_portuaria, porto.
+    Métricas: sum/avg/min/max/count de capex_total, capex_executado, progress,
+    ports, capex_servico, perc_capex, valor_executado, perc_executada, services.
+    """
+    try:
+        dims = analytics.parse_group_by(request.args.get('group_by'))
+        metricas = analytics.parse_metrics(request.args.get('metrics'))
+    except ValueError as e:
+        return jsonify({'error': f'Parâmetros inválidos: {e}'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        resultado = analytics.consultar(conn, dims, metricas)
+        conn.close()
+        return jsonify({'groupBy': list(dims), 'metrics': list(metricas), **resultado})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Sincronização incremental: linhas alteradas desde ?since=<revisão> (padrão 0).
+    
+    Portos vêm no mesmo formato de /api/portos. Com reset=true o cliente deve
+    recarregar tudo; com has_more=true, repetir a chamada com since=revision.
+    """
+    try:
+        desde = int(request.args.get('since', 0))
+        limite = min(int(request.args.get('limit', changes.LIMITE_PADRAO)), changes.LIMITE_PADRAO)
+        if desde < 0 or limite <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos: use since=<revisão>&limit=<n>'}), 400
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        resultado = changes.alteracoes(conn, desde, limite)
+        conn.close()
+        for alteracao in resultado['changes']:
+            if alteracao['table'] == 'cadastro' and alteracao['row'] is not None:
+                alteracao['row'] = _project_from_row(alteracao['row'])
+        return jsonify({
+            'epoch': resultado['epoch'],
+            'since': resultado['since'],
+            'revision': resultado['revision'],
+            'reset': resultado['reset'],
+            'hasMore': resultado['has_more'],
+            'changes': resultado['changes'],
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Banco do present_tela (CRUD de projetos), vigiado só se configurado. Sem log de
+# alterações, suas gravações chegam como 'summary' com reset=true.
+_notificadores = [events.notificador]
+if os.environ.get('PRESENT_TELA_DB'):
+    _notificadores.append(events.Notificador(os.environ['PRESENT_TELA_DB'], fonte='present_tela'))
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events: 'port' (porto alterado) e 'summary' (resumo alterado).
+    
+    O id de cada evento é a revisão dos dados; ao reconectar, o navegador envia
+    Last-Event-ID (ou ?since=<revisão>) e recebe o que perdeu. A conexão fecha
+    depois de events.DURACAO_MAXIMA segundos e o EventSource reconecta; com
+    gunicorn, use workers gthread (-k gthread --threads N, como no Dockerfile):
+    cada conexão aberta ocupa uma thread, e workers sync seriam mortos pelo --timeout.
+    """
+    try:
+        desde = request.headers.get('Last-Event-ID') or request.args.get('since')
+        desde = int(desde) if desde not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetro inválido: since=<revisão>'}), 400
+    
+    # Assina antes de ler o atraso: o que for gravado entre a leitura e a
+    # assinatura chega pela fila (eventos já cobertos pelo atraso são pulados)
+    fila = queue.Queue()
+    for notificador in _notificadores:
+        notificador.assinar(fila)
+    try:
+        pendentes = []
+        if desde is not None:
+            conn = sqlite3.connect(db.DB_PATH)
+            pendentes = events.eventos_desde(conn, desde)
+            conn.close()
+    except Exception as e:
+        for notificador in _notificadores:
+            notificador.cancelar(fila)
+        return jsonify({'error': str(e)}), 500
+    visto = pendentes[-1]['id'] if pendentes else desde
+    
+    def gerar():
+        fim = time.monotonic() + events.DURACAO_MAXIMA
+        try:
+            yield 'retry: 3000\n\n'
+            for evento in pendentes:
+                yield events.formatar(evento)
+            while (restante := fim - time.monotonic()) > 0:
+                try:
+                    evento = fila.get(timeout=min(events.KEEPALIVE, restante))
+                    if visto is not None and evento.get('id') is not None and evento['id'] <= visto:
+                        continue
+                    yield events.formatar(evento)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            for notificador in _notificadores:
+                notificador.cancelar(fila)
+    
+    return Response(gerar(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _job_json(job: dict) -> dict:
+    """Estado de um job de importação no formato da API."""
+    resultado = dict(job['resultado'])
+    erros = resultado.pop('erros', None)
+    trechos_job = resultado.pop('trechos', [])
+    return {
+        'id': job['id'],
+        'type': job['tipo'],
+        'filename': job['arquivo'],
+        'status': job['situacao'],
+        'stage': job['etapa'],
+        'stages': job['etapas'],
+        'error': job['erro'],
+        'createdAt': job['criado_em'],
+        'startedAt': job['iniciado_em'],
+        'finishedAt': job['concluido_em'],
+        'result': resultado,
+        'errorsUrl': f"/api/jobs/{job['id']}/errors" if erros is not None else None,
+        'timings': trechos.para_api(trechos_job),
+    }
+
+@app.route('/api/import', methods=['POST'])
+def import_excel():
+    """Importa uma planilha completa (Tabelas 00, 01 e 02) em segundo plano.
+    
+    Responde 202 com o id do job; o progresso por etapa fica em /api/jobs/<id>.
+    O mesmo arquivo já importado, sem alterações nos dados desde então, responde
+    200 com skipped=true (custo: só o hash do conteúdo).
+    """
+    arquivo = request.files.get('file')
+    if arquivo is None or not arquivo.filename:
+        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+    if not arquivo.filename.lower().endswith('.xlsx'):
+        return jsonify({'error': 'Tipo de arquivo não permitido (use .xlsx)'}), 400
+    
+    try:
+        conteudo = arquivo.read()
+        anterior = importacao.ja_importado(importacao.hash_conteudo(conteudo))
+        if anterior is not None:
+            return jsonify({
+                'skipped': True,
+                'revision': anterior['revisao'],
+                'importedAt': anterior['importado_em'],
+                'jobId': anterior['job_id'],
+                'statusUrl': f"/api/jobs/{anterior['job_id']}",
+            })
+        job_id = importacao.fila.submeter('excel', importacao.importar_excel, conteudo, arquivo=arquivo.filename)
+        return jsonify({'skipped': False, 'jobId': job_id, 'statusUrl': f'/api/jobs/{job_id}'}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Estado de um job de importação: situação, etapa atual e progresso de cada etapa"""
+    try:
+        job = importacao.fila.obter(job_id)
+        if job is None:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        return jsonify(_job_json(job))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/errors', methods=['GET'])
+def get_job_errors(job_id):
+    """Erros de validação do job (?format=csv para download, padrão JSON)"""
+    try:
+        job = importacao.fila.obter(job_id)
+        if job is None:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        erros = job['resultado'].get('erros')
+        if erros is None:
+            return jsonify({'error': 'Validação ainda não concluída'}), 409
+        if request.args.get('format') == 'csv':
+            saida = io.StringIO()
+            escritor = csv.DictWriter(saida, fieldnames=importacao.COLUNAS_ERROS)
+            escritor.writeheader()
+            escritor.writerows(erros)
+            return Response(saida.getvalue(), mimetype='text/csv', headers={
+                'Content-Disposition': f'attachment; filename=erros_{job_id}.csv'
+            })
+        return jsonify({'id': job_id, 'errors': erros})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/portos/<int:porto_id>', methods=['GET'])
 def get_porto_detail(porto_id):
-    """Retorna detalhes completos de um porto específico"""
+    """Retorna detalhes completos de um porto específico (com ?as_of=AAAA-MM-DD, como estava na data)"""
+    try:
+        as_of = _as_of_param()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro as_of inválido: use as_of=AAAA-MM-DD'}), 400
+    
     try:
         conn = sqlite3.connect(db.DB_PATH)
         conn.row_factory = sqlite3.Row
         
         # Dados principais do porto
-        cursor = conn.execute("""
-        SELECT 
-            c.id,
-            c.zona_portuaria as name,
-            c.obj_concessao as description,
-            c.tipo as project_type,
-            c.capex_total as investment,
-            c.data_ass_contrato as contract_date,
-            c.descricao as full_description,
-            c.coord_e_utm,
-            c.coord_s_utm,
-            c.fuso
-        FROM cadastro c
-        WHERE c.id = ?
-        """, (porto_id,))
+        cursor = conn.execute(db.SQL_PORTO, (porto_id,))
         
         porto = cursor.fetchone()
         if not porto:
@@ -128,33 +507,11 @@ def get_porto_detail(porto_id):
             return jsonify({'error': 'Porto não encontrado'}), 404
         
         # UFs do porto
-        cursor = conn.execute("""
-        SELECT uf.sigla FROM uf uf
-        JOIN cadastro_uf cu ON uf.sigla = cu.uf_sigla
-        WHERE cu.cadastro_id = ?
-        """, (porto_id,))
+        cursor = conn.execute(db.SQL_PORTO_UFS, (porto_id,))
         ufs = [row['sigla'] for row in cursor.fetchall()]
         
         # Serviços do porto
-        cursor = conn.execute("""
-        SELECT 
-            s.id,
-            s.tipo_servico,
-            s.fase,
-            s.servico,
-            s.descricao_servico,
-            s.prazo_inicio_anos,
-            s.data_inicio,
-            s.prazo_final_anos,
-            s.data_final,
-            s.fonte_prazo,
-            s.perc_capex,
-            s.capex_servico,
-            s.fonte_perc_capex
-        FROM servico s
-        WHERE s.cadastro_id = ?
-        ORDER BY s.tipo_servico, s.fase
-        """, (porto_id,))
+        cursor = conn.execute(db.SQL_PORTO_SERVICOS, (porto_id,))
         services = []
         for row in cursor.fetchall():
             service = dict(row)
@@ -162,25 +519,11 @@ def get_porto_detail(porto_id):
                 service['perc_capex'] = float(service['perc_capex']) * 100
             services.append(service)
         
-        # Acompanhamentos mais recentes
-        cursor = conn.execute("""
-        SELECT 
-            a.descricao,
-            a.perc_executada,
-            a.capex_reaj,
-            a.valor_executado,
-            a.data_atualizacao,
-            a.responsavel,
-            a.cargo,
-            a.setor,
-            a.risco_tipo,
-            a.risco_descricao
-        FROM acompanhamento a
-        JOIN servico s ON a.servico_id = s.id
-        WHERE s.cadastro_id = ?
-        ORDER BY a.data_atualizacao DESC
-        LIMIT 10
-        """, (porto_id,))
+        # Acompanhamentos mais recentes (até as_of, se informado)
+        if as_of:
+            cursor = conn.execute(db.SQL_PORTO_ATUALIZACOES_ATE, (porto_id, as_of))
+        else:
+            cursor = conn.execute(db.SQL_PORTO_ULTIMAS_ATUALIZACOES, (porto_id,))
         updates = []
         for row in cursor.fetchall():
             update = dict(row)
@@ -188,6 +531,13 @@ def get_porto_detail(porto_id):
                 update['perc_executada'] = float(update['perc_executada']) * 100
             updates.append(update)
         
+        # Progresso ponderado por CAPEX (atual ou na data as_of)
+        if as_of:
+            progresso = rollup.progresso_em(conn, as_of).get(porto_id, 0)
+        else:
+            row = conn.execute('SELECT progresso FROM progresso_porto WHERE cadastro_id = ?', (porto_id,)).fetchone()
+            progresso = row['progresso'] if row else 0
+        
         conn.close()
         
         project_detail = {
@@ -203,8 +553,13 @@ def get_porto_detail(porto_id):
             'coordinates': {
                 'utm_e': porto['coord_e_utm'],
                 'utm_n': porto['coord_s_utm'],
-                'fuso': porto['fuso']
+                'fuso': porto['fuso'],
+                'lat': porto['latitude'],
+                'lon': porto['longitude']
             },
+            'status': db.status_progresso(progresso),
+            'progress': float(progresso) * 100,
+            'asOf': as_of,
             'services': services,
             'recentUpdates': updates,
             'totalServices': len(services),
@@ -216,9 +571,33 @@ def get_porto_detail(porto_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_text():
+    """Busca textual em descrições, serviços e riscos (?q=dragagem&limit=20)"""
+    q = request.args.get('q', '').strip()
+    try:
+        limit = max(1, min(100, int(request.args.get('limit', 20))))
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit inválido'}), 400
+    if not q:
+        return jsonify({'query': q, 'results': []})
+    
+    try:
+        conn = sqlite3.connect(db.DB_PATH)
+        results = search.search(conn, q, limit)
+        conn.close()
+        return jsonify({'query': q, 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/portos/summary', methods=['GET'])
 def get_portos_summary():
-    """Retorna dados resumidos para o dashboard"""
+    """Retorna dados resumidos para o dashboard (com ?as_of=AAAA-MM-DD, como estavam na data)"""
+    try:
+        as_of = _as_of_param()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro as_of inválido: use as_of=AAAA-MM-DD'}), 400
+    
     try:
         conn = sqlite3.connect(db.DB_PATH)
         
@@ -226,35 +605,23 @@ def get_portos_summary():
         cursor = conn.execute("SELECT COUNT(*) as total FROM cadastro")
         total_portos = cursor.fetchone()[0]
         
-        # Por status - simplificado
-        cursor = conn.execute("""
-        SELECT 
-            CASE 
-                WHEN a.perc_executada >= 0.9 THEN 'Concluído'
-                WHEN a.perc_executada > 0 THEN 'Em Andamento'
-                ELSE 'Planejamento'
-            END as status,
-            COUNT(*) as count
-        FROM acompanhamento a
-        GROUP BY status
-        """)
-        status_counts = dict(cursor.fetchall())
+        # Por status: estado atual (último acompanhamento) de cada serviço
+        if as_of:
+            resumo = conn.execute(db.SQL_RESUMO_SERVICOS_EM, {'data': as_of}).fetchone()
+        else:
+            resumo = conn.execute(db.SQL_RESUMO_SERVICOS).fetchone()
+        status_counts = {
+            'Concluído': resumo[2] or 0,
+            'Em Andamento': resumo[3] or 0,
+            'Planejamento': resumo[4] or 0,
+        }
+        # Progresso médio: ponderado pelo CAPEX de serviços e portos
+        avg_progress = (rollup.progresso_portfolio(conn, as_of) or 0) * 100
         
         # Investimento total
         cursor = conn.execute("SELECT SUM(capex_total) as total FROM cadastro WHERE capex_total IS NOT NULL")
         total_investment = cursor.fetchone()[0] or 0
         
-        # Progresso médio - simplificado
-        cursor = conn.execute("""
-        SELECT AVG(CASE 
-            WHEN a.perc_executada IS NULL THEN 0
-            ELSE a.perc_executada
-        END) as avg_progress
-        FROM acompanhamento a
-        """)
-        result = cursor.fetchone()
-        avg_progress = (result[0] or 0) * 100 if result else 0
-        
         conn.close()
         
         summary = {
@@ -262,6 +629,7 @@ def get_portos_summary():
             'statusCounts': status_counts,
             'totalInvestment': total_investment,
             'averageProgress': avg_progress,
+            'asOf': as_of,
             'sector': 'Portos'
         }
         
@@ -273,5 +641,7 @@ def get_portos_summary():
 if __name__ == '__main__':
     # Inicializar o banco de dados
     db.init_db()
+    if not os.environ.get('KPI_SNAPSHOT_INTERVAL'):
+        kpis.iniciar_agendador()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import html
+import time
 import streamlit as st
 import pandas as pd
 from io import BytesIO
@@ -10,6 +12,13 @@ from streamlit_folium import st_folium
 import services as svc
 import io_utils as iox
 import db
+import clusters
+import search
+import rollup
+import kpis
+import importacao
+import jobs
+import trechos
 
 # Inicializar banco de dados
 db.init_db()
@@ -26,6 +35,104 @@ pagina = st.sidebar.selectbox(
     ["📊 Dashboard", "📋 Planilha 00 - Cadastro", "📋 Planilha 01 - Serviços", "📋 Planilha 02 - Acompanhamento"]
 )
 
+def mostrar_trechos(registros, onde=st):
+    """Tempo de parede, CPU e pico de memória de cada etapa (trechos.py)."""
+    if not registros:
+        return
+    df = pd.DataFrame(registros).rename(columns={
+        'trecho': 'Etapa', 'linhas': 'Linhas', 'parede_ms': 'Tempo (ms)', 'cpu_ms': 'CPU (ms)',
+        'memoria_pico_mb': 'Pico de memória (MB)', 'erro': 'Erro'})
+    onde.expander('⏱️ Tempo por etapa').dataframe(df, hide_index=True, use_container_width=True)
+
+# Importação de planilha completa em segundo plano (importacao.fila)
+def _submeter_importacao(uploaded_file):
+    return importacao.fila.submeter('excel', importacao.importar_excel, uploaded_file.getvalue(), False,
+                                    arquivo=uploaded_file.name, guardar_retorno=True,
+                                    etapas=importacao.ETAPAS_SEM_GRAVAR)
+
+def importar_excel_completo(uploaded_file, chave):
+    """Envia o arquivo para a fila de importações uma única vez, mostra o progresso
+    por etapa e carrega os frames nos editores quando o job termina.
+
+    O arquivo é identificado pelo hash do conteúdo: reruns da página e o reenvio
+    da mesma planilha já lida custam só o hash."""
+    hash_ = importacao.hash_conteudo(uploaded_file.getvalue())
+    registro = st.session_state.get(f'job_{chave}')
+    if registro is None or registro['hash'] != hash_:
+        em_cache = importacao.planilha_em_cache(hash_)
+        if em_cache is not None:
+            frames, erros = em_cache
+            st.session_state.df00, st.session_state.df01, st.session_state.df02 = frames
+            registro = {'hash': hash_, 'job': None, 'carregado': True, 'erros': erros,
+                        'linhas': {'00': len(frames[0]), '01': len(frames[1]), '02': len(frames[2])}}
+        else:
+            registro = {'hash': hash_, 'job': _submeter_importacao(uploaded_file), 'carregado': False}
+        st.session_state[f'job_{chave}'] = registro
+        if registro['carregado']:
+            st.rerun()  # editores acima já foram desenhados com os frames anteriores
+
+    if not registro['carregado']:
+        barra = st.progress(0.0, text='Importação na fila...')
+        prazo = time.monotonic() + jobs.DURACAO_MAXIMA
+        while True:
+            job = importacao.fila.obter(registro['job'])
+            if job is None or job['situacao'] in ('concluido', 'erro') or time.monotonic() > prazo:
+                break
+            concluidas = sum(e['situacao'] == 'concluida' for e in job['etapas'].values())
+            barra.progress(concluidas / len(job['etapas']), text=f"Importando: {job['etapa'] or 'na fila'}")
+            time.sleep(0.5)
+        barra.empty()
+        if job is None:
+            # Sem registro, o próximo rerun com o mesmo arquivo envia de novo
+            del st.session_state[f'job_{chave}']
+            st.error('Erro ao importar arquivo: a importação não foi encontrada.')
+            return
+        if job['situacao'] != 'concluido':
+            if job['situacao'] == 'erro':
+                st.error(f"Erro ao importar arquivo: {job['erro']}")
+                mostrar_trechos(job['resultado'].get('trechos'))
+            else:
+                st.error('Erro ao importar arquivo: a importação não terminou no prazo.')
+            return
+        frames = importacao.fila.retirar(registro['job'])
+        if frames is None:
+            # Retorno descartado (acima de MAX_RETORNOS) ou job de outro processo
+            em_cache = importacao.planilha_em_cache(hash_)
+            if em_cache is not None:
+                frames = em_cache[0]
+            elif not registro.get('reenviado'):
+                registro.update(job=_submeter_importacao(uploaded_file), reenviado=True)
+                st.rerun()
+            else:
+                del st.session_state[f'job_{chave}']
+                st.error('Erro ao importar arquivo: os dados lidos não estão mais disponíveis. Envie o arquivo de novo.')
+                return
+        st.session_state.df00, st.session_state.df01, st.session_state.df02 = frames
+        registro.update(carregado=True, linhas=job['resultado'].get('linhas', {}),
+                        trechos=job['resultado'].get('trechos', []),
+                        erros=pd.DataFrame(job['resultado'].get('erros', []), columns=importacao.COLUNAS_ERROS))
+        st.rerun()
+
+    linhas, erros = registro['linhas'], registro['erros']
+    st.success(f"Arquivo importado com sucesso! {linhas.get('00', 0)} cadastros, "
+               f"{linhas.get('01', 0)} serviços, {linhas.get('02', 0)} acompanhamentos")
+    mostrar_trechos(registro.get('trechos'))
+    if not erros.empty:
+        st.warning(f"{len(erros)} erro(s) de validação na planilha.")
+        st.download_button('Baixar erros de validação (CSV)', erros.to_csv(index=False).encode('utf-8'),
+                           file_name='erros_validacao.csv', mime='text/csv', key=f'erros_{chave}')
+
+def importar_planilha_individual(uploaded_file, tabela, dtypes):
+    """Carrega uma única planilha no editor da tabela. Só lê o arquivo (e reroda
+    a página) quando o conteúdo muda: o uploader continua preenchido nos reruns."""
+    hash_ = importacao.hash_conteudo(uploaded_file.getvalue())
+    if st.session_state.get(f'hash_planilha_{tabela}') != hash_:
+        df = pd.read_excel(uploaded_file)
+        st.session_state[f'df{tabela}'] = iox.apply_dtypes(df, dtypes)
+        st.session_state[f'hash_planilha_{tabela}'] = hash_
+        st.rerun()  # editores acima já foram desenhados com o frame anterior
+    st.success(f"Planilha {tabela} importada com sucesso!")
+
 # Função para mostrar detalhes do porto
 def show_porto_details(porto_id):
     """Exibe detalhes completos de um porto específico com mapa"""
@@ -34,23 +141,7 @@ def show_porto_details(porto_id):
         conn = db.sqlite3.connect(db.DB_PATH)
         
         # Dados principais do porto
-        query_porto = """
-        SELECT 
-            c.id,
-            c.local as name,
-            c.obj_concessao as description,
-            c.tipo as project_type,
-            c.capex_total as investment,
-            c.data_ass_contrato as contract_date,
-            c.descricao as full_description,
-            c.coord_e_utm,
-            c.coord_s_utm,
-            c.fuso
-        FROM cadastro c
-        WHERE c.id = ?
-        """
-        
-        porto = pd.read_sql_query(query_porto, conn, params=(porto_id,))
+        porto = pd.read_sql_query(db.SQL_PORTO, conn, params=(porto_id,))
         
         if porto.empty:
             st.error(f"Porto não encontrado (ID: {porto_id})")
@@ -60,59 +151,14 @@ def show_porto_details(porto_id):
         porto = porto.iloc[0]
         
         # UFs do porto
-        query_ufs = """
-        SELECT uf.sigla FROM uf uf
-        JOIN cadastro_uf cu ON uf.sigla = cu.uf_sigla
-        WHERE cu.cadastro_id = ?
-        """
-        
-        df_ufs = pd.read_sql_query(query_ufs, conn, params=(porto_id,))
+        df_ufs = pd.read_sql_query(db.SQL_PORTO_UFS, conn, params=(porto_id,))
         ufs = df_ufs['sigla'].tolist()
         
         # Serviços do porto
-        query_servicos = """
-        SELECT 
-            s.id,
-            s.tipo_servico,
-            s.fase,
-            s.servico,
-            s.descricao_servico,
-            s.prazo_inicio_anos,
-            s.data_inicio,
-            s.prazo_final_anos,
-            s.data_final,
-            s.fonte_prazo,
-            s.perc_capex,
-            s.capex_servico,
-            s.fonte_perc_capex
-        FROM servico s
-        WHERE s.cadastro_id = ?
-        ORDER BY s.tipo_servico, s.fase
-        """
-        
-        df_servicos = pd.read_sql_query(query_servicos, conn, params=(porto_id,))
+        df_servicos = pd.read_sql_query(db.SQL_PORTO_SERVICOS, conn, params=(porto_id,))
         
         # Acompanhamentos mais recentes
-        query_acompanhamentos = """
-        SELECT 
-            a.descricao,
-            a.perc_executada,
-            a.capex_reaj,
-            a.valor_executado,
-            a.data_atualizacao,
-            a.responsavel,
-            a.cargo,
-            a.setor,
-            a.risco_tipo,
-            a.risco_descricao
-        FROM acompanhamento a
-        JOIN servico s ON a.servico_id = s.id
-        WHERE s.cadastro_id = ?
-        ORDER BY a.data_atualizacao DESC
-        LIMIT 10
-        """
-        
-        df_acompanhamentos = pd.read_sql_query(query_acompanhamentos, conn, params=(porto_id,))
+        df_acompanhamentos = pd.read_sql_query(db.SQL_PORTO_ULTIMAS_ATUALIZACOES, conn, params=(porto_id,))
         
         conn.close()
         
@@ -143,35 +189,19 @@ def show_porto_details(porto_id):
             st.write("**Descrição Completa:**")
             st.write(porto['full_description'])
         
-        # Mapa
-        if pd.notna(porto['coord_e_utm']) and pd.notna(porto['coord_s_utm']):
+        # Mapa (latitude/longitude gravadas no cadastro, convertidas do UTM ao salvar)
+        if pd.notna(porto['latitude']) and pd.notna(porto['longitude']):
             st.write("**🗺️ Localização:**")
             
-            # Conversão UTM para lat/lng (aproximada para o Brasil)
-            # Usando uma conversão simplificada para demonstração
-            utm_e = float(porto['coord_e_utm'])
-            utm_n = float(porto['coord_s_utm'])
-            fuso = int(porto['fuso']) if pd.notna(porto['fuso']) else 23
-            
-            # Conversão aproximada (simplificada)
-            # Para precisão real, seria necessário usar bibliotecas como pyproj
-            # Esta é uma aproximação para o território brasileiro
-            
-            # Fórmula simplificada para conversão UTM -> lat/lng
-            # Considerando o datum SIRGAS2000 (comum no Brasil)
-            lat = -15.0 + (utm_n - 8300000) / 110000  # Aproximação para latitude
-            lng = -60.0 + (utm_e - 500000) / 110000 + (fuso - 21) * 6  # Aproximação para longitude
-            
-            # Ajustes finos para melhor precisão
-            lat = max(-33.75, min(5.27, lat))  # Limites do Brasil
-            lng = max(-73.99, min(-28.85, lng))  # Limites do Brasil
+            lat = float(porto['latitude'])
+            lng = float(porto['longitude'])
             
             # Criar dados para o mapa
             map_data = pd.DataFrame({
                 'lat': [lat],
                 'lon': [lng],
                 'name': [porto['name']],
-                'description': [f"Coordenadas UTM: E={utm_e}, N={utm_n}, Fuso={fuso}<br>Lat/Lng: {lat:.4f}, {lng:.4f}"]
+                'description': [f"Lat/Lng: {lat:.6f}, {lng:.6f}"]
             })
             
             # Criar mapa com Plotly
@@ -193,14 +223,7 @@ def show_porto_details(porto_id):
             
             st.plotly_chart(fig_map, use_container_width=True)
             
-            # Informações de coordenadas
-            col1, col2 = st.columns(2)
-            with col1:
-                st.info(f"📍 **Coordenadas UTM:**<br>E: {utm_e}<br>N: {utm_n}<br>Fuso: {fuso}")
-            with col2:
-                st.info(f"🌍 **Coordenadas Geográficas:**<br>Latitude: {lat:.6f}°<br>Longitude: {lng:.6f}°")
-            
-            st.info("📍 **Nota:** Conversão UTM para lat/lng é aproximada. Para precisão cartográfica, seria necessária biblioteca especializada como pyproj.")
+            st.info(f"🌍 **Coordenadas Geográficas (SIRGAS2000):**<br>Latitude: {lat:.6f}°<br>Longitude: {lng:.6f}°")
         else:
             st.warning("📍 Coordenadas não disponíveis para este porto.")
         
@@ -265,40 +288,17 @@ if pagina == "📊 Dashboard":
         conn = db.sqlite3.connect(db.DB_PATH)
         
         # Dados principais dos portos
-        query_portos = """
-        SELECT 
-            c.id,
-            c.local as name,
-            c.obj_concessao as description,
-            c.tipo as project_type,
-            c.capex_total as investment,
-            c.data_ass_contrato as contract_date,
-            c.descricao as full_description,
-            GROUP_CONCAT(DISTINCT uf.sigla) as ufs,
-            COUNT(DISTINCT s.id) as total_services,
-            COUNT(DISTINCT a.id) as total_updates,
-            COALESCE(MAX(a.perc_executada), 0) as progress_percentage,
-            CASE 
-                WHEN MAX(a.perc_executada) >= 0.9 THEN 'Concluído'
-                WHEN MAX(a.perc_executada) > 0 THEN 'Em Andamento'
-                ELSE 'Planejamento'
-            END as status
-        FROM cadastro c
-        LEFT JOIN cadastro_uf cu ON c.id = cu.cadastro_id
-        LEFT JOIN uf uf ON cu.uf_sigla = uf.sigla
-        LEFT JOIN servico s ON c.id = s.cadastro_id
-        LEFT JOIN acompanhamento a ON s.id = a.servico_id
-        GROUP BY c.id
-        ORDER BY c.local
-        """
-        
-        df_portos = pd.read_sql_query(query_portos, conn)
+        df_portos = pd.read_sql_query(db.SQL_PORTOS.format(where='1', order=db.PORTOS_ORDEM_NOME), conn)
+        df_portos['status'] = df_portos['progress_percentage'].map(db.status_progresso)
         
         # Dados resumidos
         total_portos = len(df_portos)
         total_investment = df_portos['investment'].fillna(0).sum()
-        avg_progress = (df_portos['progress_percentage'].fillna(0) * 100).mean()
+        avg_progress = (rollup.progresso_portfolio(conn) or 0) * 100
         total_services = df_portos['total_services'].fillna(0).sum()
+        df_rollup_uf = pd.DataFrame(rollup.rollup(conn, 'uf'))
+        df_rollup_tipo = pd.DataFrame(rollup.rollup(conn, 'tipo'))
+        df_tendencia = pd.DataFrame(kpis.tendencia(conn))
         
         conn.close()
         
@@ -306,6 +306,25 @@ if pagina == "📊 Dashboard":
         st.error(f"Erro ao carregar dados: {e}")
         df_portos = pd.DataFrame()
     
+    # Busca textual (FTS5) em descrições, serviços e riscos
+    termo = st.text_input("🔎 Buscar em descrições, serviços e riscos", placeholder="ex.: dragagem, licenciamento")
+    if termo.strip():
+        conn = db.sqlite3.connect(db.DB_PATH)
+        resultados = search.search(conn, termo)
+        conn.close()
+        if not resultados:
+            st.caption("Nenhum resultado encontrado.")
+        for r in resultados:
+            col_txt, col_btn = st.columns([5, 1])
+            with col_txt:
+                # O trecho já vem escapado por search(); o título vem cru do banco
+                st.markdown(f"**{html.escape(r['title'] or '')}** · _{r['type']}_<br>{r['snippet']}",
+                            unsafe_allow_html=True)
+            with col_btn:
+                if st.button("Ver porto", key=f"busca_{r['type']}_{r['id']}"):
+                    st.session_state.selected_porto_id = r['portoId']
+                    st.rerun()
+    
     # Se não houver dados, mostrar mensagem
     if df_portos.empty:
         st.info("📝 Nenhum dado encontrado. Adicione portos através das abas 'Planilha 00', 'Planilha 01' e 'Planilha 02'.")
@@ -323,7 +342,8 @@ if pagina == "📊 Dashboard":
             )
         
         with col3:
-            st.metric(label="📈 Progresso Médio", value=f"{avg_progress:.1f}%")
+            st.metric(label="📈 Progresso Médio", value=f"{avg_progress:.1f}%",
+                      help="Ponderado pelo % de CAPEX de cada serviço e pelo CAPEX total de cada porto")
         
         with col4:
             st.metric(label="⚙️ Serviços Ativos", value=int(total_services))
@@ -344,6 +364,62 @@ if pagina == "📊 Dashboard":
         )
         st.plotly_chart(fig, use_container_width=True)
         
+        # Progresso ponderado por UF e por tipo de contrato
+        st.subheader("📈 Progresso Ponderado por CAPEX")
+        col_uf, col_tipo = st.columns(2)
+        for col, df_r, titulo in ((col_uf, df_rollup_uf, "Por UF"), (col_tipo, df_rollup_tipo, "Por Tipo")):
+            with col:
+                if df_r.empty:
+                    st.caption(f"{titulo}: sem dados.")
+                    continue
+                fig = px.bar(df_r, x='chave', y=df_r['progresso'] * 100, title=titulo,
+                             labels={'chave': '', 'y': 'Progresso (%)'}, hover_data=['portos'])
+                st.plotly_chart(fig, use_container_width=True)
+        
+        # Evolução dos KPIs (fotografias diárias; semanais/mensais no histórico antigo)
+        st.subheader("📉 Evolução do Portfólio")
+        if df_tendencia.empty:
+            st.caption("Ainda não há fotografias de KPIs. Elas são gravadas diariamente pela API (kpis.py).")
+        else:
+            df_tendencia['progresso'] = df_tendencia['progresso'] * 100
+            fig = px.line(df_tendencia, x='periodo', y='progresso', markers=True,
+                          labels={'periodo': 'Data', 'progresso': 'Progresso ponderado (%)'},
+                          hover_data=['granularidade', 'portos', 'servicos'])
+            st.plotly_chart(fig, use_container_width=True)
+        
+        # Mapa de todas as concessões (clusters calculados no servidor)
+        st.subheader("🗺️ Mapa das Concessões")
+        view = st.session_state.get('mapa_view', {'center': [-15.8, -52.0], 'zoom': 4, 'bbox': (-75.0, -35.0, -28.0, 6.0)})
+        features = clusters.get_index().get_clusters(view['bbox'], view['zoom'])
+        
+        mapa = folium.Map(location=view['center'], zoom_start=view['zoom'], tiles='OpenStreetMap')
+        for f in features:
+            if f['type'] == 'cluster':
+                folium.Marker(
+                    location=[f['lat'], f['lon']],
+                    tooltip=f"{f['count']} concessões",
+                    icon=folium.DivIcon(html=(
+                        '<div style="background:#2E4E8C;color:#fff;border-radius:50%;width:32px;height:32px;'
+                        f'line-height:32px;text-align:center;font-weight:bold">{f["count"]}</div>'
+                    )),
+                ).add_to(mapa)
+            else:
+                folium.Marker(location=[f['lat'], f['lon']], tooltip=f['name']).add_to(mapa)
+        
+        map_state = st_folium(mapa, height=450, use_container_width=True,
+                              returned_objects=['bounds', 'zoom'], key='mapa_portos')
+        bounds = (map_state or {}).get('bounds') or {}
+        if map_state and map_state.get('zoom') is not None and bounds.get('_southWest'):
+            sw, ne = bounds['_southWest'], bounds['_northEast']
+            new_view = {
+                'center': [round((sw['lat'] + ne['lat']) / 2, 4), round((sw['lng'] + ne['lng']) / 2, 4)],
+                'zoom': int(map_state['zoom']),
+                'bbox': (sw['lng'], sw['lat'], ne['lng'], ne['lat']),
+            }
+            if (new_view['zoom'], new_view['center']) != (view['zoom'], view['center']):
+                st.session_state.mapa_view = new_view
+                st.rerun()
+        
         # Tabela de portos
         st.subheader("📋 Lista de Portos")
         
@@ -404,10 +480,16 @@ elif pagina == "📋 Planilha 00 - Cadastro":
 
     st.sidebar.header('Banco de Dados')
     if st.sidebar.button('💾 Salvar no banco de dados', use_container_width=True):
-        if db.save_all(st.session_state.df00, st.session_state.df01, st.session_state.df02):
+        with trechos.medir('salvar') as medicao:
+            resumo = db.save_all_diferencial(st.session_state.df00, st.session_state.df01, st.session_state.df02)
+        if resumo is not None:
             st.sidebar.success('Dados salvos com sucesso!')
+            for tabela, n in resumo.items():
+                st.sidebar.caption(f"{tabela}: {n['inseridas']} inseridas, {n['atualizadas']} atualizadas, "
+                                   f"{n['removidas']} removidas, {n['inalteradas']} inalteradas")
         else:
             st.sidebar.error('Erro ao salvar dados.')
+        mostrar_trechos(medicao.registros, st.sidebar)
 
     if st.sidebar.button('📥 Carregar do banco de dados', use_container_width=True):
         df00, df01, df02 = db.load_all()
@@ -419,31 +501,20 @@ elif pagina == "📋 Planilha 00 - Cadastro":
 
     # Interface da Planilha 00
     st.subheader("Cadastro de Portos")
-    edited_df = st.data_editor(st.session_state.df00, num_rows="dynamic", key="editor_00")
-    st.session_state.df00 = edited_df
+    edited_df = st.data_editor(iox.para_edicao(st.session_state.df00), num_rows="dynamic", key="editor_00")
+    st.session_state.df00 = iox.apply_dtypes(edited_df, iox.DTYPES_00)
 
     # Botões de importação/exportação
     col1, col2 = st.columns(2)
     with col1:
         uploaded_file = st.file_uploader("Importar Excel (todas as planilhas)", type=['xlsx'], key="upload_completo")
         if uploaded_file:
-            try:
-                df00, df01, df02 = iox.read_excel(uploaded_file)
-                st.session_state.df00 = df00
-                st.session_state.df01 = df01
-                st.session_state.df02 = df02
-                st.success(f"Arquivo importado com sucesso! {len(df00)} cadastros, {len(df01)} serviços, {len(df02)} acompanhamentos")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Erro ao importar arquivo: {e}")
+            importar_excel_completo(uploaded_file, "upload_completo")
         
         st.markdown("**Ou importar planilha individual:**")
         uploaded_file_00 = st.file_uploader("Planilha 00 apenas", type=['xlsx'], key="upload_00")
         if uploaded_file_00:
-            df = pd.read_excel(uploaded_file_00)
-            st.session_state.df00 = df
-            st.success("Planilha 00 importada com sucesso!")
-            st.rerun()
+            importar_planilha_individual(uploaded_file_00, '00', iox.DTYPES_00)
 
     with col2:
         if st.button("Exportar Excel (completo)"):
@@ -466,31 +537,20 @@ elif pagina == "📋 Planilha 01 - Serviços":
             st.session_state.df01 = pd.DataFrame(columns=iox.COLS_01)
 
     st.subheader("Serviços Portuários")
-    edited_df = st.data_editor(st.session_state.df01, num_rows="dynamic", key="editor_01")
-    st.session_state.df01 = edited_df
+    edited_df = st.data_editor(iox.para_edicao(st.session_state.df01), num_rows="dynamic", key="editor_01")
+    st.session_state.df01 = iox.apply_dtypes(edited_df, iox.DTYPES_01)
 
     # Botões de importação/exportação
     col1, col2 = st.columns(2)
     with col1:
         uploaded_file = st.file_uploader("Importar Excel (todas as planilhas)", type=['xlsx'], key="upload_completo_01")
         if uploaded_file:
-            try:
-                df00, df01, df02 = iox.read_excel(uploaded_file)
-                st.session_state.df00 = df00
-                st.session_state.df01 = df01
-                st.session_state.df02 = df02
-                st.success(f"Arquivo importado com sucesso! {len(df00)} cadastros, {len(df01)} serviços, {len(df02)} acompanhamentos")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Erro ao importar arquivo: {e}")
+            importar_excel_completo(uploaded_file, "upload_completo_01")
         
         st.markdown("**Ou importar planilha individual:**")
         uploaded_file_01 = st.file_uploader("Planilha 01 apenas", type=['xlsx'], key="upload_01")
         if uploaded_file_01:
-            df = pd.read_excel(uploaded_file_01)
-            st.session_state.df01 = df
-            st.success("Planilha 01 importada com sucesso!")
-            st.rerun()
+            importar_planilha_individual(uploaded_file_01, '01', iox.DTYPES_01)
 
     with col2:
         if st.button("Exportar Excel (completo)"):
@@ -513,31 +573,20 @@ elif pagina == "📋 Planilha 02 - Acompanhamento":
             st.session_state.df02 = pd.DataFrame(columns=iox.COLS_02)
 
     st.subheader("Acompanhamento de Obras")
-    edited_df = st.data_editor(st.session_state.df02, num_rows="dynamic", key="editor_02")
-    st.session_state.df02 = edited_df
+    edited_df = st.data_editor(iox.para_edicao(st.session_state.df02), num_rows="dynamic", key="editor_02")
+    st.session_state.df02 = iox.apply_dtypes(edited_df, iox.DTYPES_02)
 
     # Botões de importação/exportação
     col1, col2 = st.columns(2)
     with col1:
         uploaded_file = st.file_uploader("Importar Excel (todas as planilhas)", type=['xlsx'], key="upload_completo_02")
         if uploaded_file:
-            try:
-                df00, df01, df02 = iox.read_excel(uploaded_file)
-                st.session_state.df00 = df00
-                st.session_state.df01 = df01
-                st.session_state.df02 = df02
-                st.success(f"Arquivo importado com sucesso! {len(df00)} cadastros, {len(df01)} serviços, {len(df02)} acompanhamentos")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Erro ao importar arquivo: {e}")
+            importar_excel_completo(uploaded_file, "upload_completo_02")
         
         st.markdown("**Ou importar planilha individual:**")
         uploaded_file_02 = st.file_uploader("Planilha 02 apenas", type=['xlsx'], key="upload_02")
         if uploaded_file_02:
-            df = pd.read_excel(uploaded_file_02)
-            st.session_state.df02 = df
-            st.success("Planilha 02 importada com sucesso!")
-            st.rerun()
+            importar_planilha_individual(uploaded_file_02, '02', iox.DTYPES_02)
 
     with col2:
         if st.button("Exportar Excel (completo)"):
@@ -550,6 +599,18 @@ elif pagina == "📋 Planilha 02 - Acompanhamento":
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
+# Memória dos DataFrames mantidos na sessão
+if all(k in st.session_state for k in ('df00', 'df01', 'df02')):
+    with st.sidebar.expander("🧮 Memória dos dados"):
+        st.dataframe(
+            iox.memory_report(
+                cadastro=st.session_state.df00,
+                servicos=st.session_state.df01,
+                acompanhamento=st.session_state.df02,
+            ),
+            hide_index=True,
+        )
+
 # Rodapé
 st.sidebar.markdown("---")
 st.sidebar.markdown("### ℹ️ Informações")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Benchmarks de ponta a ponta sobre dados sintéticos (sintetico.py).
+
+Para cada fator de escala: write_excel, read_excel, services.validate_*,
+db.save_all, db.load_all e os endpoints de api.py e present_tela. Cada passo
+registra tempo de parede (mediana das repetições), pico de RSS e número de
+comandos SQL (consultas.py, só deste processo). As execuções vão para um
+histórico JSON; `comparar` aponta os passos que pioraram além do limite em
+relação à execução anterior.
+
+    python benchmark.py executar --escalas 0.1 1 --repeticoes 5
+    python benchmark.py comparar --limite 0.2
+"""
+from __future__ import annotations
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import consultas
+import db
+import io_utils as iox
+import paralelo
+import services as svc
+import sintetico
+
+HISTORICO = Path(__file__).parent / 'benchmark_historico.json'
+LIMITE_REGRESSAO = 0.20
+# Passos mais rápidos que isso oscilam mais do que o limite; não entram na comparação de tempo
+TEMPO_MINIMO = 0.005
+INTERVALO_RSS = 0.005
+
+# --- Medição ----------------------------------------------------------------
+
+def _rss() -> int:
+    """RSS atual do processo em bytes (pico do processo onde não há /proc)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        fator = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * fator
+
+class _PicoRSS(threading.Thread):
+    """Amostra o RSS enquanto um passo roda."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pico = _rss()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(INTERVALO_RSS):
+            self.pico = max(self.pico, _rss())
+
+    def parar(self) -> int:
+        self._parar.set()
+        self.join()
+        return max(self.pico, _rss())
+
+def medir(funcao: Callable, repeticoes: int = 1) -> dict:
+    """Tempo (mediana e mínimo), pico de RSS e comandos SQL por execução de funcao()."""
+    tempos, picos, comandos = [], [], []
+    for _ in range(repeticoes):
+        amostrador = _PicoRSS()
+        amostrador.start()
+        with consultas.medir() as contagem:
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        comandos.append(contagem.comandos)
+        picos.append(amostrador.parar())
+    return {
+        'tempo_s': round(statistics.median(tempos), 6),
+        'tempo_min_s': round(min(tempos), 6),
+        'rss_pico_mb': round(max(picos) / 2**20, 1),
+        'sql': max(comandos),
+    }
+
+# --- Cenário ----------------------------------------------------------------
+
+def _present_tela():
+    """present_tela/app.py como módulo (o nome app já é o do Streamlit)."""
+    caminho = Path(__file__).parent / 'present_tela' / 'app.py'
+    spec = importlib.util.spec_from_file_location('present_tela_app', caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def _get(client, url: str):
+    resposta = client.get(url)
+    if resposta.status_code != 200:
+        raise RuntimeError(f'{url}: HTTP {resposta.status_code} {resposta.get_data(as_text=True)[:200]}')
+    return resposta
+
+def cenario(escala: float, repeticoes: int = 3, pasta: Optional[Path] = None, **tamanho) -> dict:
+    """Mede todos os passos numa escala; bancos temporários em `pasta`.
+    `tamanho` (servicos, atualizacoes) vai para sintetico.gerar."""
+    import api
+    pasta = Path(pasta or tempfile.mkdtemp(prefix='benchmark_'))
+    df00, df01, df02 = sintetico.gerar(escala, **tamanho)
+    r = {}
+    planilha = io.BytesIO()
+    r['write_excel'] = medir(lambda: iox.write_excel(planilha, df00, df01, df02))
+    conteudo = planilha.getvalue()
+
+    lidas = []
+    r['read_excel'] = medir(lambda: lidas.append(iox.read_excel(conteudo)))
+    l00, l01, l02 = lidas[-1]
+    r['validate_cadastro'] = medir(lambda: svc.validate_cadastro(l00))
+    r['validate_servicos'] = medir(lambda: svc.validate_servicos(l01, l00))
+    r['validate_acompanhamento'] = medir(lambda: svc.validate_acompanhamento(l02, l01))
+
+    caminho_original = db.DB_PATH
+    db.DB_PATH = pasta / f'portos_sf{escala:g}.db'
+    try:
+        db.init_db()
+        r['save_all'] = medir(lambda: db.save_all(l00, l01, l02) or sys.exit('save_all falhou'))
+        r['load_all'] = medir(db.load_all, repeticoes)
+
+        client = api.app.test_client()
+        porto_id = _get(client, '/api/portos').get_json()[0]['id']
+        for nome, url in (('api_portos', '/api/portos'), ('api_porto', f'/api/portos/{porto_id}'),
+                          ('api_portos_summary', '/api/portos/summary')):
+            r[nome] = medir(lambda: _get(client, url), repeticoes)
+    finally:
+        db.DB_PATH = caminho_original
+
+    present = _present_tela()
+    present.DATABASE = str(pasta / f'present_sf{escala:g}.db')
+    present.JSON_FILE = str(pasta / f'present_sf{escala:g}.json')
+    sintetico.salvar((df00, df01, df02), 'json', Path(present.JSON_FILE))
+    present.init_db()
+    present.import_from_json()
+    client = present.app.test_client()
+    r['present_api_projects'] = medir(lambda: _get(client, '/api/projects'), repeticoes)
+    return r
+
+# --- Histórico e comparação -------------------------------------------------
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def carregar_historico(caminho: Path = HISTORICO) -> list:
+    if not Path(caminho).exists():
+        return []
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def executar(escalas, repeticoes: int = 3, caminho: Path = HISTORICO, **tamanho) -> dict:
+    """Roda os cenários e acrescenta a execução ao histórico."""
+    consultas.instalar()
+    try:
+        with tempfile.TemporaryDirectory(prefix='benchmark_') as pasta:
+            resultados = {f'sf{e:g}': cenario(e, repeticoes, Path(pasta), **tamanho) for e in escalas}
+    finally:
+        consultas.desinstalar()
+        paralelo.encerrar()
+    execucao = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'processos': paralelo.PROCESSOS,
+        'resultados': resultados,
+    }
+    historico = carregar_historico(caminho)
+    historico.append(execucao)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(historico, f, ensure_ascii=False, indent=2)
+    return execucao
+
+def comparar(atual: dict, base: dict, limite: float = LIMITE_REGRESSAO) -> list:
+    """Passos de `atual` que pioraram mais que `limite` (fração) em relação a `base`:
+    [(escala, passo, métrica, antes, depois)]."""
+    regressoes = []
+    for escala, passos in atual['resultados'].items():
+        for passo, m in passos.items():
+            b = base['resultados'].get(escala, {}).get(passo)
+            if b is None:
+                continue
+            for metrica in ('tempo_s', 'rss_pico_mb', 'sql'):
+                antes, depois = b.get(metrica), m.get(metrica)
+                if antes is None or depois is None:
+                    continue
+                if metrica == 'tempo_s' and max(antes, depois) < TEMPO_MINIMO:
+                    continue
+                if depois > antes * (1 + limite) and depois - antes > (0 if metrica == 'sql' else 1e-9):
+                    regressoes.append((escala, passo, metrica, antes, depois))
+    return regressoes
+
+def _imprimir(execucao: dict) -> None:
+    for escala, passos in execucao['resultados'].items():
+        print(f'\n{escala}')
+        print(f'  {"passo":<26}{"tempo (s)":>12}{"RSS pico (MB)":>15}{"SQL":>10}')
+        for passo, m in passos.items():
+            print(f'  {passo:<26}{m["tempo_s"]:>12.4f}{m["rss_pico_mb"]:>15.1f}{m["sql"]:>10}')
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks de importação, gravação, leitura e API.')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p = sub.add_parser('executar', help='roda os cenários e grava no histórico')
+    p.add_argument('--escalas', type=float, nargs='+', default=[0.1, 1])
+    p.add_argument('--repeticoes', type=int, default=3)
+    p.add_argument('--historico', type=Path, default=HISTORICO)
+    c = sub.add_parser('comparar', help='compara a última execução com uma anterior')
+    c.add_argument('--limite', type=float, default=LIMITE_REGRESSAO, help='piora tolerada (0.2 = 20%%)')
+    c.add_argument('--base', type=int, default=-2, help='índice da execução de referência no histórico')
+    c.add_argument('--historico', type=Path, default=HISTORICO)
+    args = parser.parse_args(argv)
+
+    if args.comando == 'executar':
+        _imprimir(executar(args.escalas, args.repeticoes, args.historico))
+        return 0
+
+    historico = carregar_historico(args.historico)
+    if len(historico) < 2:
+        print('❌ O histórico precisa de pelo menos duas execuções')
+        return 1
+    atual, base = historico[-1], historico[args.base]
+    regressoes = comparar(atual, base, args.limite)
+    print(f"Comparando {atual['data']} ({atual['commit']}) com {base['data']} ({base['commit']})")
+    for escala, passo, metrica, antes, depois in regressoes:
+        print(f'  ⚠️  {escala} {passo} {metrica}: {antes} -> {depois} (+{(depois / antes - 1) * 100:.0f}%)'
+              if antes else f'  ⚠️  {escala} {passo} {metrica}: {antes} -> {depois}')
+    if not regressoes:
+        print(f'✅ Nenhuma regressão acima de {args.limite:.0%}')
+    return 1 if regressoes else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
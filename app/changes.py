@@ -0,0 +1,119 @@
+from __future__ import annotations
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+LIMITE_PADRAO = 1000
+RETENCAO_EXCLUSOES_DIAS = 7
+# Entradas redundantes (além de uma por linha viva) que disparam compactar_se_necessario
+MAX_EXCEDENTE = int(os.environ.get('CHANGE_LOG_MAX', 10000))
+TABELAS = ('cadastro', 'servico', 'acompanhamento')
+
+def estado(conn: sqlite3.Connection) -> Tuple[int, str, int]:
+    """(revisão atual, época do banco, horizonte da compactação)."""
+    row = conn.execute('SELECT valor, epoca, horizonte FROM revisao_dados WHERE id = 1').fetchone()
+    return tuple(row) if row else (0, '', 0)
+
+def _carregar(conn: sqlite3.Connection, tabela: str, ids: List[int]) -> Dict[int, dict]:
+    """Estado atual das linhas alteradas (portos no formato de db.SQL_PORTOS)."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row  # só neste cursor: a conexão é de quem chamou
+    linhas = {}
+    for i in range(0, len(ids), 500):
+        lote = ids[i:i + 500]
+        marcadores = ', '.join('?' * len(lote))
+        if tabela == 'cadastro':
+            sql = db.SQL_PORTOS.format(where=f'c.id IN ({marcadores})', order='c.id')
+        else:
+            sql = f'SELECT * FROM {tabela} WHERE id IN ({marcadores})'
+        for row in cursor.execute(sql, lote):
+            linhas[row['id']] = dict(row)
+    return linhas
+
+def alteracoes(conn: sqlite3.Connection, desde: int, limite: int = LIMITE_PADRAO) -> dict:
+    """Linhas alteradas depois da revisão `desde`, uma entrada por linha (a mais recente).
+
+    Cada entrada traz a operação e, se a linha ainda existe, seu estado atual;
+    linhas que não existem mais saem como 'D'. Se `desde` é anterior ao
+    horizonte da compactação, devolve reset=True: o cliente precisa recarregar tudo.
+    Com mais de `limite` entradas no log, devolve uma página e has_more=True;
+    o cliente continua a partir de `revision`.
+    """
+    propria = not conn.in_transaction
+    if propria:
+        conn.execute('BEGIN')  # leitura consistente do log e das linhas
+    try:
+        revisao, epoca, horizonte = estado(conn)
+        resposta = {'epoch': epoca, 'since': desde, 'revision': revisao, 'reset': False,
+                    'has_more': False, 'changes': []}
+        if desde < horizonte or desde > revisao:
+            resposta['reset'] = True
+            return resposta
+
+        log = conn.execute('''
+            SELECT revisao, tabela, registro_id, op FROM change_log
+            WHERE revisao > ? ORDER BY revisao LIMIT ?
+        ''', (desde, limite + 1)).fetchall()
+        if len(log) > limite:
+            log = log[:limite]
+            resposta['has_more'] = True
+            resposta['revision'] = log[-1][0]
+
+        ultimas = {}
+        for rev, tabela, registro_id, op in log:
+            ultimas[(tabela, registro_id)] = (rev, op)
+        atuais = {
+            tabela: _carregar(conn, tabela, [i for (t, i), (_, op) in ultimas.items() if t == tabela and op != 'D'])
+            for tabela in TABELAS
+        }
+        for (tabela, registro_id), (rev, op) in sorted(ultimas.items(), key=lambda item: item[1][0]):
+            linha = atuais.get(tabela, {}).get(registro_id)
+            resposta['changes'].append({
+                'revision': rev,
+                'table': tabela,
+                'id': registro_id,
+                'op': op if linha is not None else 'D',
+                'row': linha,
+            })
+        return resposta
+    finally:
+        if propria:
+            conn.rollback()
+
+def compactar(conn: sqlite3.Connection, retencao_dias: int = RETENCAO_EXCLUSOES_DIAS) -> dict:
+    """Compacta o log: mantém só a entrada mais recente de cada linha e remove
+    exclusões mais antigas que `retencao_dias` (avançando o horizonte). Não faz commit."""
+    duplicadas = conn.execute('''
+        DELETE FROM change_log
+        WHERE revisao < (
+            SELECT MAX(c2.revisao) FROM change_log c2
+            WHERE c2.tabela = change_log.tabela AND c2.registro_id = change_log.registro_id
+        )
+    ''').rowcount
+    limite = f'-{int(retencao_dias)} days'
+    novo_horizonte = conn.execute(
+        "SELECT MAX(revisao) FROM change_log WHERE op = 'D' AND criado_em < datetime('now', ?)", (limite,)
+    ).fetchone()[0]
+    exclusoes = 0
+    if novo_horizonte is not None:
+        exclusoes = conn.execute(
+            "DELETE FROM change_log WHERE op = 'D' AND revisao <= ?", (novo_horizonte,)
+        ).rowcount
+        conn.execute('UPDATE revisao_dados SET horizonte = MAX(horizonte, ?) WHERE id = 1', (novo_horizonte,))
+    return {'duplicadas': duplicadas, 'exclusoes': exclusoes, 'horizonte': estado(conn)[2]}
+
+def compactar_se_necessario(conn: sqlite3.Connection, maximo: Optional[int] = None) -> Optional[dict]:
+    """Compacta (com commit) quando o log tem mais de `maximo` entradas além de
+    uma por linha viva; chamada pelas gravações de db.save_*. Devolve o
+    resultado de compactar(), ou None se não foi preciso."""
+    excedente = conn.execute(
+        'SELECT (SELECT COUNT(*) FROM change_log) - '
+        + ' - '.join(f'(SELECT COUNT(*) FROM {tabela})' for tabela in TABELAS)
+    ).fetchone()[0]
+    if excedente <= (MAX_EXCEDENTE if maximo is None else maximo):
+        return None
+    resultado = compactar(conn)
+    conn.commit()
+    return resultado
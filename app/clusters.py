@@ -0,0 +1,199 @@
+from __future__ import annotations
+import math
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import changes
+import db
+
+# Tamanho do tile (px) e raio de agrupamento (px) em cada nível de zoom
+TILE_SIZE = 256
+CLUSTER_RADIUS = 60
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+
+def _project(lat: float, lon: float) -> Tuple[float, float]:
+    """Lat/lon -> coordenadas Web Mercator normalizadas em [0, 1]."""
+    sin = math.sin(math.radians(max(-85.0511, min(85.0511, lat))))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+def _cell(x: float, y: float, zoom: int) -> Tuple[int, int]:
+    scale = TILE_SIZE * (2 ** zoom) / CLUSTER_RADIUS
+    return int(x * scale), int(y * scale)
+
+
+class ClusterIndex:
+    """Índice de agrupamento em grade por nível de zoom (estilo supercluster).
+
+    Cada nível guarda, por célula da grade, a contagem, a soma das coordenadas
+    e os ids dos portos, de modo que inserir, mover ou remover um porto custa
+    O(número de níveis) — o índice nunca precisa ser reconstruído do zero.
+    Alterações e consultas são serializadas pelo lock do índice (as threads de
+    um worker consultam enquanto outra sincroniza).
+    """
+
+    def __init__(self, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.lock = threading.RLock()
+        self.points: Dict[int, dict] = {}
+        self.levels: Dict[int, Dict[Tuple[int, int], dict]] = {
+            z: {} for z in range(min_zoom, max_zoom + 1)
+        }
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, point_id: int, lat: float, lon: float, **props):
+        with self.lock:
+            self._add(point_id, lat, lon, **props)
+
+    def remove(self, point_id: int):
+        with self.lock:
+            self._remove(point_id)
+
+    def _add(self, point_id: int, lat: float, lon: float, **props):
+        if point_id in self.points:
+            self._remove(point_id)
+        x, y = _project(lat, lon)
+        self.points[point_id] = {'id': point_id, 'lat': lat, 'lon': lon, 'x': x, 'y': y, **props}
+        for z, cells in self.levels.items():
+            cell = cells.setdefault(_cell(x, y, z), {'count': 0, 'lat': 0.0, 'lon': 0.0, 'ids': set()})
+            cell['count'] += 1
+            cell['lat'] += lat
+            cell['lon'] += lon
+            cell['ids'].add(point_id)
+
+    def _remove(self, point_id: int):
+        point = self.points.pop(point_id, None)
+        if point is None:
+            return
+        for z, cells in self.levels.items():
+            key = _cell(point['x'], point['y'], z)
+            cell = cells[key]
+            cell['count'] -= 1
+            cell['lat'] -= point['lat']
+            cell['lon'] -= point['lon']
+            cell['ids'].discard(point_id)
+            if not cell['ids']:
+                del cells[key]
+
+    def sync(self, rows: List[Tuple]) -> int:
+        """Aplica ao índice apenas as diferenças em relação a rows
+        (id, lat, lon, name), a lista completa dos portos. Retorna o número de
+        portos alterados."""
+        with self.lock:
+            return self.aplicar(list(self.points) + [r[0] for r in rows], rows)
+
+    def aplicar(self, ids, rows: List[Tuple]) -> int:
+        """Atualiza só os portos `ids` a partir de rows (id, lat, lon, name): os
+        que não estão em rows saem do índice. Retorna o número de alterados."""
+        current = {point_id: (lat, lon, name) for point_id, lat, lon, name in rows}
+        changed = 0
+        with self.lock:
+            for point_id in dict.fromkeys(ids):
+                old = self.points.get(point_id)
+                novo = current.get(point_id)
+                if novo is None:
+                    if old is not None:
+                        self._remove(point_id)
+                        changed += 1
+                elif old is None or (old['lat'], old['lon'], old['name']) != novo:
+                    lat, lon, name = novo
+                    self._add(point_id, lat, lon, name=name)
+                    changed += 1
+        return changed
+
+    def get_clusters(self, bbox: Tuple[float, float, float, float], zoom: float) -> List[dict]:
+        """Clusters e portos visíveis em bbox (oeste, sul, leste, norte) no zoom dado."""
+        with self.lock:
+            return self._get_clusters(bbox, zoom)
+
+    def _get_clusters(self, bbox: Tuple[float, float, float, float], zoom: float) -> List[dict]:
+        west, south, east, north = bbox
+        zoom = int(max(self.min_zoom, min(self.max_zoom + 1, math.floor(zoom))))
+        features = []
+        if zoom > self.max_zoom:
+            for p in self.points.values():
+                if south <= p['lat'] <= north and west <= p['lon'] <= east:
+                    features.append(self._point_feature(p))
+            return features
+        for cell in self.levels[zoom].values():
+            lat = cell['lat'] / cell['count']
+            lon = cell['lon'] / cell['count']
+            if not (south <= lat <= north and west <= lon <= east):
+                continue
+            if cell['count'] == 1:
+                features.append(self._point_feature(self.points[next(iter(cell['ids']))]))
+            else:
+                features.append({
+                    'type': 'cluster',
+                    'count': cell['count'],
+                    'lat': lat,
+                    'lon': lon,
+                    'expansionZoom': self._expansion_zoom(cell['ids'], zoom),
+                })
+        return features
+
+    def _expansion_zoom(self, ids, zoom: int) -> int:
+        """Primeiro zoom em que o cluster se divide."""
+        point = self.points[next(iter(ids))]
+        for z in range(zoom + 1, self.max_zoom + 1):
+            if self.levels[z][_cell(point['x'], point['y'], z)]['count'] < len(ids):
+                return z
+        return self.max_zoom + 1
+
+    @staticmethod
+    def _point_feature(p: dict) -> dict:
+        return {'type': 'porto', 'id': p['id'], 'name': p.get('name'), 'lat': p['lat'], 'lon': p['lon']}
+
+
+SQL_PORTOS_MAPA = """
+    SELECT id, latitude, longitude, zona_portuaria || ' - ' || obj_concessao
+    FROM cadastro
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+"""
+
+_index: Optional[ClusterIndex] = None
+_versao: Optional[Tuple[str, str, int]] = None  # (arquivo, época, revisão) já aplicados ao índice
+_lock = threading.Lock()
+
+def get_index(conn: Optional[sqlite3.Connection] = None) -> ClusterIndex:
+    """Índice do processo, sincronizado com as coordenadas do cadastro.
+
+    Sem alteração nos dados desde a última chamada (revisao_dados), custa uma
+    leitura da revisão. Com alterações, só os portos registrados em change_log
+    depois da revisão já aplicada são relidos; o cadastro inteiro só é lido na
+    primeira vez, quando o banco muda (arquivo ou época) ou quando a
+    compactação do log já removeu as revisões necessárias.
+    """
+    global _index, _versao
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(db.DB_PATH)
+    try:
+        with _lock:
+            arquivo = conn.execute('PRAGMA database_list').fetchone()[2]
+            revisao, epoca, horizonte = changes.estado(conn)
+            if (_index is None or _versao is None or _versao[:2] != (arquivo, epoca)
+                    or _versao[2] < horizonte or revisao < _versao[2]):
+                indice = ClusterIndex()
+                indice.sync(conn.execute(SQL_PORTOS_MAPA).fetchall())
+                _index = indice
+            elif revisao != _versao[2]:
+                ids = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT registro_id FROM change_log WHERE tabela = 'cadastro' AND revisao > ?",
+                    (_versao[2],))]
+                for i in range(0, len(ids), 500):
+                    lote = ids[i:i + 500]
+                    rows = conn.execute(f"{SQL_PORTOS_MAPA} AND id IN ({', '.join('?' * len(lote))})",
+                                        lote).fetchall()
+                    _index.aplicar(lote, rows)
+            _versao = (arquivo, epoca, revisao)
+            return _index
+    finally:
+        if own:
+            conn.close()
@@ -0,0 +1,22 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco novo e vazio (db.init_db) no diretório do teste, apontado por db.DB_PATH."""
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'portos.db')
+    db.init_db()
+    return db.DB_PATH
+
+
+@pytest.fixture
+def conn(banco):
+    """Conexão com o banco de teste. Os módulos que precisam de dados redefinem
+    `conn` pedindo esta e inserindo só o seu conjunto de dados."""
+    conn = sqlite3.connect(banco)
+    yield conn
+    conn.close()
@@ -0,0 +1,474 @@
+from __future__ import annotations
+import bisect
+import contextlib
+import hmac
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# Contagem de comandos SQL por requisição ou por importação, com detector de N+1,
+# e perfil de consultas do processo (log de consultas lentas e histogramas).
+#
+# instalar() troca sqlite3.connect por uma versão que abre as conexões com
+# Conexao/Cursor, que contam e cronometram cada execute/executemany/fetch nas
+# contagens ativas do contexto atual (medir()). Sem instalar(), nada muda nas
+# conexões: custo zero. Conta só este processo (os blocos convertidos nos
+# processos de paralelo não entram).
+#
+# A contagem é feita no cursor e não por set_trace_callback: o callback também
+# é chamado para cada trigger disparado, repetindo o texto do comando original
+# (um INSERT em cadastro apareceria várias vezes), e não informa duração.
+
+# Mesmo comando (normalizado) executado a partir de tantas vezes numa medição = N+1 provável
+LIMITE_N_MAIS_1 = 10
+
+logger = logging.getLogger('consultas')
+
+_ativas: ContextVar[Tuple['Contagem', ...]] = ContextVar('consultas_ativas', default=())
+_connect_original = None
+_lock = threading.Lock()
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+def normalizar(sql: str) -> str:
+    """Texto do comando sem literais nem espaços extras: agrupa execuções do mesmo comando."""
+    sql = _LITERAIS.sub('?', sql)
+    sql = _LISTAS.sub('(?)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+class Contagem:
+    """Comandos e tempo de SQL acumulados numa medição."""
+
+    def __init__(self):
+        self.comandos = 0
+        self.tempo_s = 0.0
+        self.por_sql: Counter = Counter()
+
+    def repetidos(self, minimo: int = LIMITE_N_MAIS_1) -> List[Tuple[str, int]]:
+        """Comandos de leitura executados `minimo` vezes ou mais (padrão N+1)."""
+        return [(sql, n) for sql, n in self.por_sql.most_common()
+                if n >= minimo and sql.upper().startswith(('SELECT', 'WITH'))]
+
+    def resumo(self) -> dict:
+        return {'comandos': self.comandos, 'tempo_ms': round(self.tempo_s * 1000, 2)}
+
+# --- Perfil de consultas (opt-in) ---------------------------------------------
+# Com perfilar() (ou SQL_PERFIL=1 no ambiente), cada execução é acumulada por
+# comando normalizado: chamadas, tempo total e máximo, linhas devolvidas e
+# histograma de duração. A duração de uma execução soma o execute e a leitura
+# das linhas; execuções acima de LIMITE_LENTA_MS vão para o log de consultas
+# lentas (logger consultas.lentas, JSON por linha; arquivo em SQL_LENTA_LOG).
+
+LIMITE_LENTA_MS = float(os.environ.get('SQL_LENTA_MS', 100))
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima de 1000"
+FAIXAS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+logger_lentas = logging.getLogger('consultas.lentas')
+
+class Estatistica:
+    __slots__ = ('chamadas', 'total_s', 'max_s', 'linhas', 'faixas')
+
+    def __init__(self):
+        self.chamadas = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.linhas = 0
+        self.faixas = [0] * (len(FAIXAS_MS) + 1)
+
+class Perfil:
+    """Estatísticas por comando normalizado, compartilhadas pelas threads do processo."""
+
+    def __init__(self, limite_lenta_ms: float = LIMITE_LENTA_MS):
+        self.limite_lenta_ms = limite_lenta_ms
+        self.por_sql = {}
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+
+    def registrar(self, sql: str, duracao: float, linhas: int) -> None:
+        ms = duracao * 1000
+        faixa = bisect.bisect_left(FAIXAS_MS, ms)
+        with self._lock:
+            e = self.por_sql.get(sql)
+            if e is None:
+                e = self.por_sql[sql] = Estatistica()
+            e.chamadas += 1
+            e.total_s += duracao
+            e.max_s = max(e.max_s, duracao)
+            e.linhas += linhas
+            e.faixas[faixa] += 1
+        if ms >= self.limite_lenta_ms:
+            logger_lentas.warning(json.dumps({
+                'quando': datetime.now().isoformat(timespec='milliseconds'),
+                'pid': os.getpid(),
+                'sql': sql,
+                'duracao_ms': round(ms, 3),
+                'linhas': linhas,
+            }, ensure_ascii=False))
+
+    def relatorio(self, ordem: str = 'total', limite: Optional[int] = 20) -> List[dict]:
+        """Comandos ordenados por tempo 'total', 'max', 'media' ou 'chamadas' (decrescente)."""
+        with self._lock:
+            itens = [(sql, e.chamadas, e.total_s, e.max_s, e.linhas, list(e.faixas))
+                     for sql, e in self.por_sql.items()]
+        linhas = [{
+            'sql': sql,
+            'chamadas': chamadas,
+            'total_ms': round(total * 1000, 3),
+            'media_ms': round(total * 1000 / chamadas, 3),
+            'max_ms': round(maximo * 1000, 3),
+            'linhas': n_linhas,
+            'histograma': dict(zip([f'<={f}ms' for f in FAIXAS_MS] + [f'>{FAIXAS_MS[-1]}ms'], faixas)),
+        } for sql, chamadas, total, maximo, n_linhas, faixas in itens]
+        chave = {'total': 'total_ms', 'max': 'max_ms', 'media': 'media_ms', 'chamadas': 'chamadas'}[ordem]
+        linhas.sort(key=lambda l: l[chave], reverse=True)
+        return linhas[:limite] if limite else linhas
+
+    def limpar(self) -> None:
+        with self._lock:
+            self.por_sql.clear()
+            self.inicio = time.time()
+
+perfil: Optional[Perfil] = None
+
+def perfilar(limite_lenta_ms: Optional[float] = None, arquivo_lentas: Optional[str] = None) -> Perfil:
+    """Liga o perfil de consultas neste processo (instala a instrumentação)."""
+    global perfil
+    instalar()
+    if arquivo_lentas and not any(isinstance(h, logging.FileHandler) for h in logger_lentas.handlers):
+        handler = logging.FileHandler(arquivo_lentas, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger_lentas.addHandler(handler)
+    perfil = Perfil(LIMITE_LENTA_MS if limite_lenta_ms is None else limite_lenta_ms)
+    return perfil
+
+def parar_perfil() -> None:
+    global perfil
+    perfil = None
+
+# --- Instrumentação das conexões -------------------------------------------
+
+class Cursor(sqlite3.Cursor):
+    """Cursor que conta cada comando e cronometra execução e leitura das linhas.
+
+    Com o perfil ligado, guarda a execução em andamento ([sql, duração, linhas])
+    e a entrega ao perfil quando as linhas acabam, no próximo execute ou quando
+    o cursor é fechado/descartado.
+    """
+    _execucao = None
+
+    def _medido(self, sql, inicio: float, linhas: int = 0, fim: bool = False) -> None:
+        duracao = time.perf_counter() - inicio
+        ativas = _ativas.get()
+        normalizado = normalizar(sql) if sql is not None and (ativas or perfil is not None) else None
+        for contagem in ativas:
+            contagem.tempo_s += duracao
+            if sql is not None:
+                contagem.comandos += 1
+                contagem.por_sql[normalizado] += 1
+        if perfil is None:
+            return
+        if sql is not None:
+            self._concluir()
+            self._execucao = [normalizado, duracao, linhas]
+        elif self._execucao is not None:
+            self._execucao[1] += duracao
+            self._execucao[2] += linhas
+        if fim:
+            self._concluir()
+
+    def _concluir(self) -> None:
+        execucao, self._execucao = self._execucao, None
+        if execucao is not None and perfil is not None:
+            perfil.registrar(*execucao)
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._medido(sql, inicio)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self._medido(sql, inicio, fim=True)
+
+    def executescript(self, script):
+        inicio = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self._medido(script, inicio, fim=True)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = None
+        try:
+            linha = super().fetchone()
+            return linha
+        finally:
+            self._medido(None, inicio, linha is not None, fim=linha is None)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        tamanho = self.arraysize if size is None else size
+        linhas = []
+        try:
+            linhas = super().fetchmany(tamanho)
+            return linhas
+        finally:
+            self._medido(None, inicio, len(linhas), fim=len(linhas) < tamanho)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = []
+        try:
+            linhas = super().fetchall()
+            return linhas
+        finally:
+            self._medido(None, inicio, len(linhas), fim=True)
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._medido(None, inicio, fim=True)
+            raise
+        self._medido(None, inicio, 1)
+        return linha
+
+    def close(self):
+        self._concluir()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._concluir()
+        except Exception:
+            pass
+
+class Conexao(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os atalhos conn.execute*) são Cursor."""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or Cursor)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+def instalar() -> None:
+    """Passa a abrir com Conexao toda conexão de sqlite3.connect (idempotente)."""
+    global _connect_original
+    with _lock:
+        if _connect_original is not None:
+            return
+        _connect_original = connect = sqlite3.connect
+
+        def connect_contando(*args, **kwargs):
+            kwargs.setdefault('factory', Conexao)
+            return connect(*args, **kwargs)
+        sqlite3.connect = connect_contando
+
+def desinstalar() -> None:
+    """Volta ao sqlite3.connect original (as conexões já abertas continuam contando)."""
+    global _connect_original
+    with _lock:
+        if _connect_original is not None:
+            sqlite3.connect, _connect_original = _connect_original, None
+
+def instalado() -> bool:
+    return _connect_original is not None
+
+@contextlib.contextmanager
+def medir():
+    """Contagem dos comandos executados no bloco (neste contexto/thread).
+    Medições aninhadas somam nas duas."""
+    contagem = Contagem()
+    token = _ativas.set(_ativas.get() + (contagem,))
+    try:
+        yield contagem
+    finally:
+        _ativas.reset(token)
+
+@contextlib.contextmanager
+def no_maximo(k: int):
+    """Para testes: falha se o bloco executar mais de `k` comandos.
+
+        with consultas.no_maximo(3):
+            client.get('/api/portos')
+    """
+    ja_instalado = instalado()
+    instalar()
+    try:
+        with medir() as contagem:
+            yield contagem
+    finally:
+        if not ja_instalado:
+            desinstalar()
+    if contagem.comandos > k:
+        detalhes = '\n'.join(f'  {n}x {sql}' for sql, n in contagem.por_sql.most_common(10))
+        raise AssertionError(f'{contagem.comandos} comandos SQL (máximo {k}):\n{detalhes}')
+
+def _configurar_log() -> None:
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+def registrar_flask(app, nome: Optional[str] = None) -> None:
+    """Conta o SQL de cada requisição de `app` e registra uma linha JSON por
+    requisição (rota, status, duração, comandos e tempo de SQL), mais um aviso
+    quando um mesmo comando se repete LIMITE_N_MAIS_1 vezes ou mais."""
+    from flask import g, request
+    instalar()
+    _configurar_log()
+    nome = nome or app.name
+
+    @app.before_request
+    def _iniciar_contagem():
+        g._consultas = Contagem()
+        g._consultas_token = _ativas.set(_ativas.get() + (g._consultas,))
+        g._consultas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _registrar_contagem(response):
+        contagem = g.get('_consultas')
+        if contagem is None:
+            return response
+        registro = {
+            'app': nome,
+            'metodo': request.method,
+            'rota': request.url_rule.rule if request.url_rule else request.path,
+            'status': response.status_code,
+            'duracao_ms': round((time.perf_counter() - g._consultas_inicio) * 1000, 2),
+            'sql': contagem.comandos,
+            'sql_ms': round(contagem.tempo_s * 1000, 2),
+        }
+        repetidos = contagem.repetidos()
+        if repetidos:
+            registro['n_mais_1'] = [{'sql': sql, 'vezes': n} for sql, n in repetidos]
+            logger.warning(json.dumps(registro, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(registro, ensure_ascii=False))
+        return response
+
+    @app.teardown_request
+    def _encerrar_contagem(_erro=None):
+        token = g.pop('_consultas_token', None)
+        if token is not None:
+            _ativas.reset(token)
+
+def registrar_debug(app) -> None:
+    """GET /debug/sql: relatório do perfil de consultas deste processo.
+
+    Só existe com DEBUG_TOKEN no ambiente (404 sem ele) e exige o token no
+    cabeçalho X-Debug-Token (nunca na URL, que vai para logs de acesso e de
+    proxies). Parâmetros: ordem (total, max,
+    media, chamadas), limite e reset=1 (zera o perfil depois de responder).
+    """
+    from flask import abort, jsonify, request
+
+    @app.route('/debug/sql', methods=['GET'])
+    def debug_sql():
+        esperado = os.environ.get('DEBUG_TOKEN')
+        if not esperado:
+            abort(404)
+        informado = request.headers.get('X-Debug-Token', '')
+        if not hmac.compare_digest(informado.encode(), esperado.encode()):
+            return jsonify({'error': 'token inválido'}), 403
+        try:
+            ordem = request.args.get('ordem', 'total')
+            limite = request.args.get('limite', 20, type=int)
+            if ordem not in ('total', 'max', 'media', 'chamadas'):
+                return jsonify({'error': f'ordem inválida: {ordem}'}), 400
+            atual = perfil
+            if atual is None:
+                return jsonify({'pid': os.getpid(), 'active': False, 'queries': []})
+            itens = [{
+                'sql': c['sql'],
+                'calls': c['chamadas'],
+                'totalMs': c['total_ms'],
+                'avgMs': c['media_ms'],
+                'maxMs': c['max_ms'],
+                'rows': c['linhas'],
+                'histogram': c['histograma'],
+            } for c in atual.relatorio(ordem, limite)]
+            resposta = {
+                'pid': os.getpid(),
+                'active': True,
+                'since': datetime.fromtimestamp(atual.inicio).isoformat(timespec='seconds'),
+                'slowThresholdMs': atual.limite_lenta_ms,
+                'queries': itens,
+            }
+            if request.args.get('reset') == '1':
+                atual.limpar()
+            return jsonify(resposta)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+def agregar_lentas(linhas) -> List[dict]:
+    """Agrupa as linhas JSON do log de consultas lentas por comando."""
+    por_sql = {}
+    for linha in linhas:
+        linha = linha.strip()
+        if not linha.startswith('{'):
+            continue
+        try:
+            r = json.loads(linha)
+        except ValueError:
+            continue
+        e = por_sql.setdefault(r['sql'], {'sql': r['sql'], 'vezes': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                          'linhas': 0, 'ultima': None})
+        e['vezes'] += 1
+        e['total_ms'] = round(e['total_ms'] + r['duracao_ms'], 3)
+        e['max_ms'] = max(e['max_ms'], r['duracao_ms'])
+        e['linhas'] += r.get('linhas', 0)
+        e['ultima'] = max(e['ultima'] or '', r.get('quando', ''))
+    return list(por_sql.values())
+
+def main(argv=None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Relatório do log de consultas lentas (SQL_LENTA_LOG).')
+    parser.add_argument('log', help='arquivo gerado com SQL_PERFIL=1 SQL_LENTA_LOG=...')
+    parser.add_argument('--ordem', choices=['total', 'max', 'vezes'], default='total')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with open(args.log, encoding='utf-8') as f:
+        resultado = agregar_lentas(f)
+    chave = {'total': 'total_ms', 'max': 'max_ms', 'vezes': 'vezes'}[args.ordem]
+    resultado.sort(key=lambda r: r[chave], reverse=True)
+    print(f'{"vezes":>7}{"total ms":>12}{"máx ms":>10}{"linhas":>9}  sql')
+    for r in resultado[:args.top]:
+        sql = r['sql'] if len(r['sql']) <= 100 else r['sql'][:97] + '...'
+        print(f'{r["vezes"]:>7}{r["total_ms"]:>12.1f}{r["max_ms"]:>10.1f}{r["linhas"]:>9}  {sql}')
+    return 0
+
+# Perfil ligado pelo ambiente: vale para qualquer processo que importe este módulo
+# (db.py, api.py, present_tela)
+if os.environ.get('SQL_PERFIL'):
+    perfilar(arquivo_lentas=os.environ.get('SQL_LENTA_LOG'))
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
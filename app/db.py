@@ -1,10 +1,19 @@
 from __future__ import annotations
+import hashlib
 import sqlite3
 import pandas as pd
 from pathlib import Path
 from typing import Optional, Tuple
 import io_utils as iox
 import services as svc
+import consultas  # SQL_PERFIL=1 liga o perfil de consultas também no Streamlit
+import geo
+import rollup
+import analytics
+import changes
+import events
+import paralelo
+import trechos
 
 DB_PATH = Path(__file__).parent / 'portos.db'
 
@@ -26,6 +35,250 @@ def _schema_atualizado(cursor) -> bool:
     return 'servico_id' in colunas
 
 
+def _migrar_cadastro(cursor):
+    """Atualiza bancos antigos de cadastro (coluna local, sem UTM) sem perder dados."""
+    cursor.execute('PRAGMA table_info(cadastro)')
+    colunas = [row[1] for row in cursor.fetchall()]
+    if not colunas:
+        return
+    if 'local' in colunas and 'zona_portuaria' not in colunas:
+        cursor.execute('ALTER TABLE cadastro RENAME COLUMN local TO zona_portuaria')
+    for coluna, tipo in (('coord_e_utm', 'REAL'), ('coord_s_utm', 'REAL'), ('fuso', 'INTEGER')):
+        if coluna not in colunas:
+            cursor.execute(f'ALTER TABLE cadastro ADD COLUMN {coluna} {tipo}')
+
+
+def _migrar_acompanhamento(cursor):
+    """Adiciona acompanhamento.cadastro_id (desnormalizado de servico) em bancos antigos."""
+    cursor.execute('PRAGMA table_info(acompanhamento)')
+    colunas = [row[1] for row in cursor.fetchall()]
+    if 'cadastro_id' not in colunas:
+        cursor.execute('ALTER TABLE acompanhamento ADD COLUMN cadastro_id INTEGER')
+        cursor.execute('''
+            UPDATE acompanhamento
+            SET cadastro_id = (SELECT s.cadastro_id FROM servico s WHERE s.id = acompanhamento.servico_id)
+        ''')
+
+
+def _migrar_hash_linha(cursor):
+    """Adiciona hash_linha (impressão digital da linha, ver hash_linhas) em bancos antigos.
+    Linhas sem hash contam como alteradas na primeira importação diferencial."""
+    for tabela in ('cadastro', 'servico', 'acompanhamento'):
+        cursor.execute(f'PRAGMA table_info({tabela})')
+        if 'hash_linha' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN hash_linha INTEGER')
+
+
+def _criar_indice_espacial(cursor) -> bool:
+    """Cria a R*Tree cadastro_rtree e os triggers que a mantêm em sincronia
+    com cadastro.latitude/longitude. Retorna False se o SQLite não tiver R*Tree."""
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS cadastro_rtree
+            USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+        ''')
+    except sqlite3.OperationalError:
+        return False
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tr_cadastro_rtree_ins AFTER INSERT ON cadastro
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO cadastro_rtree VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tr_cadastro_rtree_upd AFTER UPDATE OF latitude, longitude ON cadastro
+        BEGIN
+            DELETE FROM cadastro_rtree WHERE id = OLD.id;
+            INSERT INTO cadastro_rtree
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tr_cadastro_rtree_del AFTER DELETE ON cadastro
+        BEGIN
+            DELETE FROM cadastro_rtree WHERE id = OLD.id;
+        END
+    ''')
+    # Bancos existentes: indexar linhas gravadas antes da R*Tree existir
+    cursor.execute('''
+        INSERT OR REPLACE INTO cadastro_rtree
+        SELECT c.id, c.latitude, c.latitude, c.longitude, c.longitude
+        FROM cadastro c
+        WHERE c.latitude IS NOT NULL AND c.longitude IS NOT NULL
+          AND c.id NOT IN (SELECT id FROM cadastro_rtree)
+    ''')
+    return True
+
+# Tabelas FTS5 (conteúdo externo): tabela de origem -> colunas indexadas
+FTS_TABLES = {
+    'cadastro': ('descricao', 'obj_concessao'),
+    'servico': ('servico', 'descricao_servico'),
+    'acompanhamento': ('descricao', 'risco_descricao'),
+}
+
+def _criar_busca_textual(cursor) -> bool:
+    """Cria as tabelas <tabela>_fts e os triggers que as mantêm em sincronia.
+    Retorna False se o SQLite não tiver FTS5."""
+    for tabela, colunas in FTS_TABLES.items():
+        fts = f'{tabela}_fts'
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,))
+        existia = cursor.fetchone() is not None
+        cols = ', '.join(colunas)
+        new = ', '.join(f'NEW.{c}' for c in colunas)
+        old = ', '.join(f'OLD.{c}' for c in colunas)
+        try:
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {cols}, content='{tabela}', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tr_{fts}_ins AFTER INSERT ON {tabela} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.id, {new});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tr_{fts}_del AFTER DELETE ON {tabela} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tr_{fts}_upd AFTER UPDATE OF {cols} ON {tabela} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.id, {new});
+            END
+        ''')
+        if not existia:
+            # Indexar linhas gravadas antes da tabela FTS existir
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
+
+def _criar_progresso_porto(cursor):
+    """Cria as tabelas progresso_porto (progresso ponderado por CAPEX de cada
+    porto) e progresso_mensal (fotografias mensais), e os triggers que marcam em
+    progresso_porto_pendente os portos afetados por qualquer alteração em
+    cadastro, servico ou acompanhamento. O recálculo em si fica em
+    rollup.recalcular, chamado por quem grava."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progresso_porto (
+            cadastro_id INTEGER PRIMARY KEY,
+            progresso REAL NOT NULL,
+            peso_total REAL NOT NULL,
+            servicos INTEGER NOT NULL,
+            servicos_com_peso INTEGER NOT NULL,
+            atualizado_em TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progresso_porto_pendente (
+            cadastro_id INTEGER PRIMARY KEY
+        )
+    ''')
+    # Fotografias mensais do progresso (mes = 'AAAA-MM'), para consultas históricas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progresso_mensal (
+            cadastro_id INTEGER NOT NULL,
+            mes TEXT NOT NULL,
+            progresso REAL NOT NULL,
+            PRIMARY KEY (cadastro_id, mes)
+        ) WITHOUT ROWID
+    ''')
+    marcar = 'INSERT OR IGNORE INTO progresso_porto_pendente (cadastro_id) SELECT {id} WHERE {id} IS NOT NULL;'
+    gatilhos = {
+        'tr_progresso_cadastro_ins': ('AFTER INSERT ON cadastro', marcar.format(id='NEW.id')),
+        'tr_progresso_cadastro_del': ('AFTER DELETE ON cadastro',
+                                      'DELETE FROM progresso_porto WHERE cadastro_id = OLD.id;'
+                                      'DELETE FROM progresso_mensal WHERE cadastro_id = OLD.id;'),
+        'tr_progresso_servico_ins': ('AFTER INSERT ON servico', marcar.format(id='NEW.cadastro_id')),
+        'tr_progresso_servico_upd': ('AFTER UPDATE OF cadastro_id, perc_capex ON servico',
+                                     marcar.format(id='OLD.cadastro_id') + marcar.format(id='NEW.cadastro_id')),
+        'tr_progresso_servico_del': ('AFTER DELETE ON servico', marcar.format(id='OLD.cadastro_id')),
+        # cadastro_id ainda pode estar NULL aqui (preenchido por tr_acomp_cadastro_ins)
+        'tr_progresso_acomp_ins': ('AFTER INSERT ON acompanhamento', marcar.format(
+            id='COALESCE(NEW.cadastro_id, (SELECT cadastro_id FROM servico WHERE id = NEW.servico_id))')),
+        'tr_progresso_acomp_upd': ('AFTER UPDATE OF servico_id, cadastro_id, perc_executada, data_atualizacao ON acompanhamento',
+                                   marcar.format(id='OLD.cadastro_id') + marcar.format(id='NEW.cadastro_id')),
+        'tr_progresso_acomp_del': ('AFTER DELETE ON acompanhamento', marcar.format(id='OLD.cadastro_id')),
+    }
+    # Recriados sempre, como as views, para acompanhar mudanças nas regras
+    for nome, (evento, corpo) in gatilhos.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {nome}')
+        cursor.execute(f'CREATE TRIGGER {nome} {evento} BEGIN {corpo} END')
+
+def _criar_revisao(cursor):
+    """Cria revisao_dados (contador incrementado por qualquer alteração em
+    cadastro, cadastro_uf, servico ou acompanhamento) e change_log, que registra
+    (revisão, tabela, id, operação) de cada alteração para a sincronização
+    incremental de /api/changes. A época muda quando o banco é recriado, para que
+    caches e clientes não confundam revisões de bancos diferentes; horizonte é a
+    última revisão removida pela compactação (changes.compactar). cadastro_id é o
+    porto da linha no momento da alteração: depois de uma exclusão não há mais
+    de onde lê-lo (events.py)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revisao_dados (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            valor INTEGER NOT NULL,
+            epoca TEXT NOT NULL,
+            horizonte INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('PRAGMA table_info(revisao_dados)')
+    if 'horizonte' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE revisao_dados ADD COLUMN horizonte INTEGER NOT NULL DEFAULT 0')
+    cursor.execute("INSERT OR IGNORE INTO revisao_dados (id, valor, epoca) VALUES (1, 0, lower(hex(randomblob(8))))")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            revisao INTEGER PRIMARY KEY,
+            tabela TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('I', 'U', 'D')),
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            cadastro_id INTEGER
+        )
+    ''')
+    cursor.execute('PRAGMA table_info(change_log)')
+    if 'cadastro_id' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE change_log ADD COLUMN cadastro_id INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_change_log_registro ON change_log(tabela, registro_id, revisao)')
+    
+    registrar = '''
+        UPDATE revisao_dados SET valor = valor + 1 WHERE id = 1;
+        INSERT INTO change_log (revisao, tabela, registro_id, op, cadastro_id)
+        VALUES ((SELECT valor FROM revisao_dados WHERE id = 1), '{tabela}', {registro}, '{op}', {cadastro});
+    '''
+    porto = {
+        'cadastro': '{linha}.id',
+        'servico': '{linha}.cadastro_id',
+        'acompanhamento': '(SELECT cadastro_id FROM servico WHERE id = {linha}.servico_id)',
+    }
+    # Triggers sempre recriados: bancos antigos ganham a coluna cadastro_id no log
+    for tabela in ('cadastro', 'servico', 'acompanhamento'):
+        for evento, linha in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'DROP TRIGGER IF EXISTS tr_revisao_{tabela}_{evento.lower()}')
+            cursor.execute(f'DROP TRIGGER IF EXISTS tr_changelog_{tabela}_{evento.lower()}')
+            cursor.execute(f'''
+                CREATE TRIGGER tr_changelog_{tabela}_{evento.lower()} AFTER {evento} ON {tabela}
+                BEGIN {registrar.format(tabela=tabela, registro=f'{linha}.id', op=evento[0],
+                                        cadastro=porto[tabela].format(linha=linha))} END
+            ''')
+    # As UFs fazem parte do porto: alterá-las é uma alteração do cadastro (exceto
+    # quando a remoção vem em cascata do próprio cadastro, já registrado como 'D')
+    for evento, linha in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'DROP TRIGGER IF EXISTS tr_revisao_cadastro_uf_{evento.lower()}')
+        cursor.execute(f'DROP TRIGGER IF EXISTS tr_changelog_cadastro_uf_{evento.lower()}')
+        cursor.execute(f'''
+            CREATE TRIGGER tr_changelog_cadastro_uf_{evento.lower()} AFTER {evento} ON cadastro_uf
+            WHEN EXISTS (SELECT 1 FROM cadastro WHERE id = {linha}.cadastro_id)
+            BEGIN {registrar.format(tabela='cadastro', registro=f'{linha}.cadastro_id', op='U',
+                                    cadastro=f'{linha}.cadastro_id')} END
+        ''')
+
 def init_db():
     """Inicializa o banco de dados criando as tabelas se não existirem."""
     conn = sqlite3.connect(DB_PATH)
@@ -42,11 +295,26 @@ def init_db():
         cursor.execute('DROP TABLE IF EXISTS cadastro_uf')
         cursor.execute('DROP TABLE IF EXISTS cadastro')
         cursor.execute('DROP TABLE IF EXISTS uf')
+        cursor.execute('DROP TABLE IF EXISTS progresso_porto')
+        cursor.execute('DROP TABLE IF EXISTS progresso_porto_pendente')
+        cursor.execute('DROP TABLE IF EXISTS progresso_mensal')
+        cursor.execute('DROP TABLE IF EXISTS analytics_cubo')
+        cursor.execute('DROP TABLE IF EXISTS revisao_dados')
+        cursor.execute('DROP TABLE IF EXISTS change_log')
+        cursor.execute('DROP TABLE IF EXISTS importacao_arquivo')
         cursor.execute('PRAGMA foreign_keys = ON')
         conn.commit()
     
     cursor.execute('PRAGMA foreign_keys = ON')
     
+    # Views são sempre recriadas para acompanhar o schema atual
+    cursor.execute('DROP VIEW IF EXISTS vw_analytics')
+    cursor.execute('DROP VIEW IF EXISTS vw_acompanhamento_atual')
+    cursor.execute('DROP VIEW IF EXISTS vw_tabela_02_acompanhamento')
+    cursor.execute('DROP VIEW IF EXISTS vw_tabela_01_servicos')
+    cursor.execute('DROP VIEW IF EXISTS vw_tabela_00_cadastro')
+    _migrar_cadastro(cursor)
+    
     # 1. Tabela de UFs (domínio controlado)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS uf (
@@ -63,7 +331,7 @@ def init_db():
         CREATE TABLE IF NOT EXISTS cadastro (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             setor TEXT,
-            local TEXT NOT NULL,
+            zona_portuaria TEXT NOT NULL,
             uf_texto TEXT,
             obj_concessao TEXT NOT NULL,
             tipo TEXT CHECK(tipo IN ('Concessão', 'Arrendamento', 'Autorização') OR tipo IS NULL),
@@ -74,9 +342,13 @@ def init_db():
             descricao TEXT,
             latitude REAL,
             longitude REAL,
+            coord_e_utm REAL,
+            coord_s_utm REAL,
+            fuso INTEGER,
+            hash_linha INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(local, obj_concessao)
+            UNIQUE(zona_portuaria, obj_concessao)
         )
     ''')
     
@@ -114,6 +386,7 @@ def init_db():
             capex_servico_exec REAL,
             perc_capex_exec REAL CHECK(perc_capex_exec IS NULL OR (perc_capex_exec >= 0 AND perc_capex_exec <= 1)),
             fonte_perc_capex TEXT,
+            hash_linha INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (cadastro_id) REFERENCES cadastro(id) ON DELETE CASCADE,
@@ -126,6 +399,7 @@ def init_db():
         CREATE TABLE IF NOT EXISTS acompanhamento (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             servico_id INTEGER NOT NULL,
+            cadastro_id INTEGER,
             setor TEXT,
             local TEXT,
             uf TEXT,
@@ -143,27 +417,59 @@ def init_db():
             setor2 TEXT,
             risco_tipo TEXT,
             risco_descricao TEXT,
+            hash_linha INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (servico_id) REFERENCES servico(id) ON DELETE CASCADE
         )
     ''')
     
-    # Criar índices
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_cadastro_local ON cadastro(local)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_cadastro_obj ON cadastro(obj_concessao)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_servico_cadastro ON servico(cadastro_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_servico_natural ON servico(tipo_servico, fase, servico)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_acompanhamento_servico ON acompanhamento(servico_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS ix_acomp_data ON acompanhamento(data_atualizacao)')
+    _migrar_acompanhamento(cursor)
+    _migrar_hash_linha(cursor)
+    
+    # acompanhamento.cadastro_id é preenchido a partir do serviço
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tr_acomp_cadastro_ins AFTER INSERT ON acompanhamento
+        WHEN NEW.cadastro_id IS NULL
+        BEGIN
+            UPDATE acompanhamento
+            SET cadastro_id = (SELECT cadastro_id FROM servico WHERE id = NEW.servico_id)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tr_acomp_cadastro_upd AFTER UPDATE OF servico_id ON acompanhamento
+        BEGIN
+            UPDATE acompanhamento
+            SET cadastro_id = (SELECT cadastro_id FROM servico WHERE id = NEW.servico_id)
+            WHERE id = NEW.id;
+        END
+    ''')
+    
+    # Criar índices. As chaves naturais já são atendidas pelos índices dos UNIQUE:
+    #   cadastro(zona_portuaria, obj_concessao) -> busca por chave e listagem ordenada
+    #   servico(cadastro_id, tipo_servico, fase, servico, ...) -> busca por chave e
+    #   serviços de um porto já ordenados por tipo/fase
+    for obsoleto in ('ix_cadastro_local', 'ix_cadastro_zona', 'ix_cadastro_obj', 'ix_servico_cadastro',
+                     'ix_servico_natural', 'ix_acompanhamento_servico', 'ix_acomp_data', 'ix_acomp_servico_data'):
+        cursor.execute(f'DROP INDEX IF EXISTS {obsoleto}')
+    # Histórico por serviço (último acompanhamento) e por porto (últimas atualizações).
+    # O id desempata acompanhamentos da mesma data (vale o último gravado).
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_acomp_servico_atual ON acompanhamento(servico_id, data_atualizacao DESC, id DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_acomp_cadastro_data ON acompanhamento(cadastro_id, data_atualizacao DESC)')
+    
+    # Índice espacial (R*Tree) sobre latitude/longitude do cadastro
+    _criar_indice_espacial(cursor)
+    
+    # Busca textual (FTS5) sobre descrições e riscos
+    _criar_busca_textual(cursor)
     
     # Criar views para exportação (compatíveis com planilhas)
     cursor.execute('''
         CREATE VIEW IF NOT EXISTS vw_tabela_00_cadastro AS
         SELECT
             c.id AS "ID",
-            c.setor AS "Setor",
-            c.local AS "Local",
+            c.zona_portuaria AS "Zona portuária",
             c.uf_texto AS "UF",
             c.obj_concessao AS "Obj. de Concessão",
             c.tipo AS "Tipo",
@@ -173,7 +479,10 @@ def init_db():
             c.data_ass_contrato AS "Data de assinatura do contrato",
             c.descricao AS "Descrição",
             c.latitude AS "Latitude",
-            c.longitude AS "Longitude"
+            c.longitude AS "Longitude",
+            c.coord_e_utm AS "Coordenada E (UTM)",
+            c.coord_s_utm AS "Coordenada S (UTM)",
+            c.fuso AS "Fuso"
         FROM cadastro c
     ''')
     
@@ -229,9 +538,272 @@ def init_db():
         JOIN cadastro c ON c.id = s.cadastro_id
     ''')
     
+    # Estado atual de cada serviço: o acompanhamento mais recente (uma busca no
+    # índice ix_acomp_servico_atual por serviço). É a base de todo cálculo de progresso.
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS vw_acompanhamento_atual AS
+        SELECT
+            s.id AS servico_id,
+            s.cadastro_id,
+            a.id AS acompanhamento_id,
+            a.perc_executada,
+            a.valor_executado,
+            a.capex_reaj,
+            a.data_atualizacao,
+            a.risco_tipo,
+            a.risco_descricao
+        FROM servico s
+        JOIN acompanhamento a ON a.id = (
+            SELECT a2.id FROM acompanhamento a2
+            WHERE a2.servico_id = s.id
+            ORDER BY a2.data_atualizacao DESC, a2.id DESC
+            LIMIT 1
+        )
+    ''')
+    
+    # Série diária de KPIs (portfólio, UF e tipo), compactada em semanas e meses por kpis.compactar
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS kpi_snapshot (
+            granularidade TEXT NOT NULL CHECK(granularidade IN ('dia', 'semana', 'mes')),
+            dimensao TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            periodo TEXT NOT NULL,
+            portos INTEGER,
+            investimento REAL,
+            progresso REAL,
+            servicos INTEGER,
+            PRIMARY KEY (dimensao, chave, periodo)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_kpi_granularidade ON kpi_snapshot(granularidade, periodo)')
+    
+    # Progresso ponderado por CAPEX e fotografias mensais, mantidos incrementalmente por porto
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='progresso_mensal'")
+    existia = cursor.fetchone() is not None
+    _criar_progresso_porto(cursor)
+    if not existia:
+        rollup.marcar_todos(conn)
+    rollup.recalcular(conn)
+    
+    # Modelo estrela para /api/analytics: um fato por serviço (portos sem serviço
+    # aparecem uma vez, com as colunas de serviço nulas) com as dimensões do
+    # porto e o último acompanhamento. A UF (N:N) é juntada só quando pedida.
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS vw_analytics AS
+        SELECT
+            c.id AS cadastro_id,
+            c.zona_portuaria,
+            c.obj_concessao,
+            c.tipo,
+            c.capex_total,
+            c.capex_executado,
+            COALESCE(pp.progresso, 0) AS progresso,
+            s.id AS servico_id,
+            s.tipo_servico,
+            s.fase,
+            s.perc_capex,
+            s.capex_servico,
+            a.perc_executada,
+            a.valor_executado
+        FROM cadastro c
+        LEFT JOIN progresso_porto pp ON pp.cadastro_id = c.id
+        LEFT JOIN servico s ON s.cadastro_id = c.id
+        LEFT JOIN acompanhamento a ON a.id = (
+            SELECT a2.id FROM acompanhamento a2
+            WHERE a2.servico_id = s.id
+            ORDER BY a2.data_atualizacao DESC, a2.id DESC
+            LIMIT 1
+        )
+    ''')
+    # Níveis do cubo pré-calculados por analytics.precomputar (JSON por revisão)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_cubo (
+            revisao INTEGER NOT NULL,
+            group_by TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            PRIMARY KEY (revisao, group_by)
+        )
+    ''')
+    _criar_revisao(cursor)
+    
+    # Planilhas já gravadas (sha256 do conteúdo): reenviar o mesmo arquivo sem
+    # alterações nos dados desde então (mesma época e revisão) não reimporta
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS importacao_arquivo (
+            hash TEXT PRIMARY KEY,
+            epoca TEXT NOT NULL,
+            revisao INTEGER NOT NULL,
+            job_id TEXT,
+            importado_em TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
+# --- Consultas compartilhadas (api.py, app.py, db.py) -----------------------
+# Cada uma é atendida por um índice (ver init_db); test_query_plans.py garante
+# que nenhuma cai em SCAN completo ou ordenação em B-tree temporária.
+
+# Chave natural -> id de todos os cadastros/serviços (conversão das Tabelas 01 e
+# 02): colunas da chave seguidas dos ids. A busca pela chave usa um dict montado
+# com uma consulta, e não uma consulta por linha da planilha.
+SQL_CADASTRO_IDS = "SELECT zona_portuaria, obj_concessao, id FROM cadastro"
+SQL_SERVICO_IDS = """
+    SELECT c.zona_portuaria, c.obj_concessao, s.tipo_servico, s.fase, s.servico, s.id, s.cadastro_id
+    FROM cadastro c
+    JOIN servico s ON s.cadastro_id = c.id
+    ORDER BY s.id
+"""
+
+def _ids_por_chave(cursor, sql: str, n: int) -> dict:
+    """{chave natural (n primeiras colunas): ids} de SQL_*_IDS; numa chave repetida vale a primeira linha."""
+    ids = {}
+    for linha in cursor.execute(sql):
+        ids.setdefault(tuple(linha[:n]), tuple(linha[n:]))
+    return ids
+
+# Lista de portos; {where} recebe um filtro sobre c (ex.: bbox ou ids) e {order}
+# a ordenação. Use PORTOS_ORDEM_NOME para a lista completa (percorre o índice
+# da chave natural já ordenado) e 'c.id' para filtros por id/R*Tree.
+PORTOS_ORDEM_NOME = 'c.zona_portuaria, c.obj_concessao'
+
+SQL_PORTOS = """
+SELECT
+    c.id,
+    c.zona_portuaria as name,
+    c.obj_concessao as description,
+    c.tipo as project_type,
+    c.capex_total as investment,
+    c.data_ass_contrato as contract_date,
+    c.descricao as full_description,
+    c.coord_e_utm,
+    c.coord_s_utm,
+    c.fuso,
+    c.latitude,
+    c.longitude,
+    (SELECT GROUP_CONCAT(cu.uf_sigla) FROM cadastro_uf cu WHERE cu.cadastro_id = c.id) as ufs,
+    (SELECT COUNT(*) FROM servico s WHERE s.cadastro_id = c.id) as total_services,
+    (SELECT COUNT(*) FROM acompanhamento a WHERE a.cadastro_id = c.id) as total_updates,
+    COALESCE((SELECT p.progresso FROM progresso_porto p WHERE p.cadastro_id = c.id), 0) as progress_percentage
+FROM cadastro c
+WHERE {where}
+ORDER BY {order}
+"""
+
+# Resumo do portfólio a partir do estado atual de cada serviço
+_COLUNAS_RESUMO_SERVICOS = """
+    COUNT(*) AS servicos,
+    AVG(COALESCE(v.perc_executada, 0)) AS progresso_medio,
+    SUM(v.perc_executada >= 0.9) AS concluidos,
+    SUM(v.perc_executada > 0 AND v.perc_executada < 0.9) AS em_andamento,
+    SUM(COALESCE(v.perc_executada, 0) = 0) AS planejamento"""
+
+SQL_RESUMO_SERVICOS = f"""
+SELECT{_COLUNAS_RESUMO_SERVICOS}
+FROM vw_acompanhamento_atual v
+"""
+
+# O mesmo resumo como estava em :data (último acompanhamento de cada serviço até a data)
+SQL_RESUMO_SERVICOS_EM = f"""
+SELECT{_COLUNAS_RESUMO_SERVICOS}
+FROM servico s
+JOIN acompanhamento v ON v.id = (
+    SELECT a2.id FROM acompanhamento a2
+    WHERE a2.servico_id = s.id AND a2.data_atualizacao <= :data
+    ORDER BY a2.data_atualizacao DESC, a2.id DESC
+    LIMIT 1
+)
+"""
+
+# Acompanhamentos de cada porto até :data (para o total de atualizações "como estava em")
+SQL_ATUALIZACOES_POR_PORTO_EM = """
+SELECT a.cadastro_id, COUNT(*)
+FROM acompanhamento a
+WHERE a.data_atualizacao <= :data
+GROUP BY a.cadastro_id
+"""
+
+def status_progresso(perc) -> str:
+    """Status do porto a partir do progresso (0 a 1)."""
+    if perc is not None and perc >= 0.9:
+        return 'Concluído'
+    if perc is not None and perc > 0:
+        return 'Em Andamento'
+    return 'Planejamento'
+
+SQL_PORTO = """
+SELECT
+    c.id,
+    c.zona_portuaria as name,
+    c.obj_concessao as description,
+    c.tipo as project_type,
+    c.capex_total as investment,
+    c.data_ass_contrato as contract_date,
+    c.descricao as full_description,
+    c.coord_e_utm,
+    c.coord_s_utm,
+    c.fuso,
+    c.latitude,
+    c.longitude
+FROM cadastro c
+WHERE c.id = ?
+"""
+
+SQL_PORTO_UFS = """
+SELECT cu.uf_sigla AS sigla FROM cadastro_uf cu
+WHERE cu.cadastro_id = ?
+"""
+
+SQL_PORTO_SERVICOS = """
+SELECT
+    s.id,
+    s.tipo_servico,
+    s.fase,
+    s.servico,
+    s.descricao_servico,
+    s.prazo_inicio_anos,
+    s.data_inicio,
+    s.prazo_final_anos,
+    s.data_final,
+    s.fonte_prazo,
+    s.perc_capex,
+    s.capex_servico,
+    s.fonte_perc_capex
+FROM servico s
+WHERE s.cadastro_id = ?
+ORDER BY s.tipo_servico, s.fase
+"""
+
+_COLUNAS_ATUALIZACAO = """
+    a.descricao,
+    a.perc_executada,
+    a.capex_reaj,
+    a.valor_executado,
+    a.data_atualizacao,
+    a.responsavel,
+    a.cargo,
+    a.setor,
+    a.risco_tipo,
+    a.risco_descricao"""
+
+SQL_PORTO_ULTIMAS_ATUALIZACOES = f"""
+SELECT{_COLUNAS_ATUALIZACAO}
+FROM acompanhamento a
+WHERE a.cadastro_id = ?
+ORDER BY a.data_atualizacao DESC
+LIMIT 10
+"""
+
+# As 10 últimas atualizações até uma data (consultas "como estava em")
+SQL_PORTO_ATUALIZACOES_ATE = f"""
+SELECT{_COLUNAS_ATUALIZACAO}
+FROM acompanhamento a
+WHERE a.cadastro_id = ? AND a.data_atualizacao <= ?
+ORDER BY a.data_atualizacao DESC
+LIMIT 10
+"""
+
 def _parse_date(val):
     """Converte valor para string de data no formato YYYY-MM-DD."""
     if pd.isna(val) or val == '' or val is None:
@@ -273,13 +845,59 @@ def _normalize_uf_texto(uf_texto: str) -> str:
     valid_ufs = [u for u in ufs if u in UF_LIST]
     return '; '.join(valid_ufs) if valid_ufs else None
 
+def _latlon_cadastro(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+    """Latitude/longitude da Tabela 00, derivadas das coordenadas UTM quando ausentes."""
+    def _num(col):
+        if col not in df.columns:
+            return pd.Series(float('nan'), index=df.index)
+        return pd.to_numeric(df[col], errors='coerce').astype(float)
+
+    lat, lon = _num('Latitude'), _num('Longitude')
+    utm_lat, utm_lon = geo.utm_to_latlon(
+        _num('Coordenada E (UTM)'), _num('Coordenada S (UTM)'), _num('Fuso')
+    )
+    faltando = lat.isna() | lon.isna()
+    lat = lat.mask(faltando, pd.Series(utm_lat, index=df.index))
+    lon = lon.mask(faltando, pd.Series(utm_lon, index=df.index))
+    return lat, lon
+
+# Colunas de negócio gravadas por tabela, na ordem das tuplas de _df_to_db_*.
+# A impressão digital (hash_linha) é calculada sobre essas tuplas.
+COLUNAS_CADASTRO = ('zona_portuaria', 'uf_texto', 'obj_concessao', 'tipo', 'capex_total',
+                    'capex_executado', 'perc_capex_executado', 'data_ass_contrato', 'descricao',
+                    'latitude', 'longitude', 'coord_e_utm', 'coord_s_utm', 'fuso')
+COLUNAS_SERVICO = ('cadastro_id', 'tipo_servico', 'fase', 'servico', 'descricao_servico',
+                   'prazo_inicio_anos', 'data_inicio', 'prazo_final_anos', 'data_final',
+                   'fonte_prazo', 'perc_capex', 'capex_servico', 'capex_servico_exec',
+                   'perc_capex_exec', 'fonte_perc_capex')
+COLUNAS_ACOMPANHAMENTO = ('servico_id', 'cadastro_id', 'descricao', 'perc_executada', 'capex_reaj',
+                          'valor_executado', 'data_atualizacao', 'responsavel', 'cargo', 'setor',
+                          'risco_tipo', 'risco_descricao')
+
+def _sql_insert(tabela: str, colunas: tuple) -> str:
+    """INSERT das colunas de negócio mais hash_linha (tuplas de _com_hash)."""
+    return (f'INSERT INTO {tabela} ({", ".join(colunas)}, hash_linha) '
+            f'VALUES ({", ".join("?" * (len(colunas) + 1))})')
+
+def hash_linhas(rows: list) -> list:
+    """Impressão digital (inteiro de 64 bits) de cada tupla convertida por _df_to_db_*.
+
+    As tuplas já têm tipos normalizados (str, float, int, datas em texto), então
+    a mesma linha gera o mesmo hash venha da planilha ou do editor.
+    """
+    return [int.from_bytes(hashlib.blake2b(repr(row).encode(), digest_size=8).digest(), 'big', signed=True)
+            for row in rows]
+
+def _com_hash(rows: list) -> list:
+    return [row + (h,) for row, h in zip(rows, hash_linhas(rows))]
+
 def _df_to_db_cadastro(df: pd.DataFrame) -> list:
     """Converte DataFrame da Tabela 00 para formato do banco."""
+    lat, lon = _latlon_cadastro(df)
     rows = []
-    for _, row in df.iterrows():
+    for idx, row in df.iterrows():
         rows.append((
-            str(row.get('Setor', '')),
-            str(row.get('Local', '')),
+            str(row.get('Zona portuária', '')),
             _normalize_uf_texto(row.get('UF')),
             str(row.get('Obj. de Concessão', '')),
             str(row.get('Tipo', '')) if pd.notna(row.get('Tipo')) else None,
@@ -288,26 +906,66 @@ def _df_to_db_cadastro(df: pd.DataFrame) -> list:
             svc.normalize_percentage(row.get('% CAPEX Executado')) if pd.notna(row.get('% CAPEX Executado')) else None,
             _parse_date(row.get('Data de assinatura do contrato')),
             str(row.get('Descrição', '')) if pd.notna(row.get('Descrição')) else None,
-            float(row.get('Latitude')) if pd.notna(row.get('Latitude')) else None,
-            float(row.get('Longitude')) if pd.notna(row.get('Longitude')) else None,
+            float(lat[idx]) if pd.notna(lat[idx]) else None,
+            float(lon[idx]) if pd.notna(lon[idx]) else None,
+            float(row.get('Coordenada E (UTM)')) if pd.notna(row.get('Coordenada E (UTM)')) else None,
+            float(row.get('Coordenada S (UTM)')) if pd.notna(row.get('Coordenada S (UTM)')) else None,
+            int(row.get('Fuso')) if pd.notna(row.get('Fuso')) else None,
         ))
     return rows
 
-def _save_cadastro_ufs(conn, cadastro_id: int, uf_texto: str):
-    """Salva relacionamento N:N entre cadastro e UFs."""
-    if not uf_texto:
-        return
+def _save_cadastro_ufs(conn, pares: list, substituir: bool = True):
+    """Salva o relacionamento N:N entre cadastro e UFs para os pares
+    (cadastro_id, uf_texto), em lote: com substituir=True, um DELETE das UFs
+    atuais desses cadastros (por blocos de 500 ids); depois um único executemany."""
     cursor = conn.cursor()
-    # Limpar UFs existentes
-    cursor.execute('DELETE FROM cadastro_uf WHERE cadastro_id = ?', (cadastro_id,))
-    # Adicionar novas UFs
-    ufs = [u.strip() for u in str(uf_texto).replace(',', ';').split(';') if u.strip() and u.strip() in UF_LIST]
-    for uf in ufs:
-        cursor.execute('INSERT OR IGNORE INTO cadastro_uf(cadastro_id, uf_sigla) VALUES (?, ?)', (cadastro_id, uf.strip()))
-
-def save_cadastro(df: pd.DataFrame) -> bool:
-    """Salva o cadastro (Tabela 00) no banco de dados."""
+    if substituir:
+        ids = [cadastro_id for cadastro_id, _ in pares]
+        for i in range(0, len(ids), 500):
+            lote = ids[i:i + 500]
+            cursor.execute(f'DELETE FROM cadastro_uf WHERE cadastro_id IN ({", ".join("?" * len(lote))})', lote)
+    cursor.executemany('INSERT OR IGNORE INTO cadastro_uf(cadastro_id, uf_sigla) VALUES (?, ?)', [
+        (cadastro_id, uf)
+        for cadastro_id, uf_texto in pares if uf_texto
+        for uf in dict.fromkeys(u.strip() for u in str(uf_texto).replace(',', ';').split(';'))
+        if uf in UF_LIST
+    ])
+
+def _inserir_cadastros(cursor, rows: list) -> list:
+    """Insere as linhas (já com hash) em lote e devolve os ids gerados, na mesma
+    ordem: os ids novos são crescentes e maiores que o último já usado."""
+    if not rows:
+        return []
+    ultimo = cursor.execute('''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'cadastro'), 0),
+                   COALESCE((SELECT MAX(id) FROM cadastro), 0))
+    ''').fetchone()[0]
+    cursor.executemany(_sql_insert('cadastro', COLUNAS_CADASTRO), rows)
+    return [r[0] for r in cursor.execute('SELECT id FROM cadastro WHERE id > ? ORDER BY id', (ultimo,))]
+
+def _precomputar_cubo(conn) -> None:
+    """Recalcula o cubo de /api/analytics para a revisão recém-gravada, depois
+    do commit da gravação: uma falha aqui só faz as consultas irem ao SQL."""
+    try:
+        analytics.precomputar(conn)
+    except sqlite3.Error as e:
+        print(f"Erro ao pré-calcular o cubo de analytics: {e}")
+
+def _compactar_log(conn) -> None:
+    """Compacta o change_log quando ele cresceu demais (changes.compactar_se_necessario),
+    depois do commit da gravação: uma falha aqui só adia a compactação."""
+    try:
+        changes.compactar_se_necessario(conn)
+    except sqlite3.Error as e:
+        print(f"Erro ao compactar o log de alterações: {e}")
+
+def save_cadastro(df: pd.DataFrame, cubo: bool = True) -> bool:
+    """Salva o cadastro (Tabela 00) no banco de dados; com cubo=False não
+    pré-calcula o cubo de analytics (save_all faz isso uma vez no fim)."""
     try:
+        # Conversão antes de abrir a escrita; frames grandes vão em blocos para os processos
+        rows = [r for bloco in paralelo.mapear_blocos(_df_to_db_cadastro, df) for r in bloco]
+        
         conn = sqlite3.connect(DB_PATH)
         conn.execute('PRAGMA foreign_keys = ON')
         cursor = conn.cursor()
@@ -316,22 +974,18 @@ def save_cadastro(df: pd.DataFrame) -> bool:
         cursor.execute('DELETE FROM cadastro_uf')
         cursor.execute('DELETE FROM cadastro')
         
-        # Inserir novos dados
-        rows = _df_to_db_cadastro(df)
-        for row in rows:
-            cursor.execute('''
-                INSERT INTO cadastro 
-                (zona_portuaria, uf_texto, obj_concessao, tipo, capex_total, 
-                 capex_executado, perc_capex_executado, data_ass_contrato, descricao, latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', row)
-            cadastro_id = cursor.lastrowid
-            # Salvar relacionamento com UFs
-            if row[2]:  # uf_texto
-                _save_cadastro_ufs(conn, cadastro_id, row[2])
+        # Inserir novos dados e o relacionamento com UFs (uf_texto), em lote
+        rows = _com_hash(rows)
+        ids = _inserir_cadastros(cursor, rows)
+        _save_cadastro_ufs(conn, [(cadastro_id, row[1]) for cadastro_id, row in zip(ids, rows)], substituir=False)
         
+        rollup.recalcular(conn)  # só os portos afetados
         conn.commit()
+        if cubo:
+            _precomputar_cubo(conn)
+        _compactar_log(conn)
         conn.close()
+        events.notificar()  # clientes de /api/stream neste processo
         return True
     except Exception as e:
         print(f"Erro ao salvar cadastro: {e}")
@@ -392,30 +1046,30 @@ def load_cadastro() -> pd.DataFrame:
             if col not in df.columns:
                 df[col] = None
         
-        return df[iox.COLS_00]
+        return iox.apply_dtypes(df[iox.COLS_00], iox.DTYPES_00)
     except Exception as e:
         print(f"Erro ao carregar cadastro: {e}")
         import traceback
         traceback.print_exc()
         return pd.DataFrame(columns=iox.COLS_00)
 
-def _df_to_db_servicos(df: pd.DataFrame) -> list:
-    """Converte DataFrame da Tabela 01 para formato do banco."""
+def _df_to_db_servicos(df: pd.DataFrame, caminho=None) -> list:
+    """Converte DataFrame da Tabela 01 para formato do banco.
+    `caminho` é informado pelos processos de paralelo (que não herdam DB_PATH)."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(caminho or DB_PATH)
         cursor = conn.cursor()
         
+        # Chaves naturais -> id numa consulta só (e não uma por linha)
+        cadastros = _ids_por_chave(cursor, SQL_CADASTRO_IDS, 2)
+        
         rows = []
         for _, row in df.iterrows():
             # Buscar cadastro_id pela chave natural
-            cursor.execute('''
-                SELECT id FROM cadastro 
-                WHERE zona_portuaria = ? AND obj_concessao = ?
-            ''', (
+            cad_result = cadastros.get((
                 str(row.get('Zona portuária', '')),
                 str(row.get('Obj. de Concessão', ''))
             ))
-            cad_result = cursor.fetchone()
             if not cad_result:
                 continue  # Pular se não encontrar cadastro
             
@@ -447,9 +1101,13 @@ def _df_to_db_servicos(df: pd.DataFrame) -> list:
         traceback.print_exc()
         return []
 
-def save_servicos(df: pd.DataFrame) -> bool:
-    """Salva os serviços (Tabela 01) no banco de dados."""
+def save_servicos(df: pd.DataFrame, cubo: bool = True) -> bool:
+    """Salva os serviços (Tabela 01) no banco de dados; com cubo=False não
+    pré-calcula o cubo de analytics (save_all faz isso uma vez no fim)."""
     try:
+        # Conversão antes de abrir a escrita; frames grandes vão em blocos para os processos
+        rows = [r for bloco in paralelo.mapear_blocos(_df_to_db_servicos, df, DB_PATH) for r in bloco]
+        
         conn = sqlite3.connect(DB_PATH)
         conn.execute('PRAGMA foreign_keys = ON')
         cursor = conn.cursor()
@@ -459,18 +1117,16 @@ def save_servicos(df: pd.DataFrame) -> bool:
         cursor.execute('DELETE FROM servico')
         
         # Inserir novos dados
-        rows = _df_to_db_servicos(df)
         if rows:
-            cursor.executemany('''
-                INSERT INTO servico 
-                (cadastro_id, tipo_servico, fase, servico, descricao_servico,
-                 prazo_inicio_anos, data_inicio, prazo_final_anos, data_final,
-                 fonte_prazo, perc_capex, capex_servico_total, capex_servico_exec, perc_capex_exec, fonte_perc_capex)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', rows)
+            cursor.executemany(_sql_insert('servico', COLUNAS_SERVICO), _com_hash(rows))
         
+        rollup.recalcular(conn)  # só os portos afetados
         conn.commit()
+        if cubo:
+            _precomputar_cubo(conn)
+        _compactar_log(conn)
         conn.close()
+        events.notificar()  # clientes de /api/stream neste processo
         return True
     except Exception as e:
         print(f"Erro ao salvar serviços: {e}")
@@ -503,45 +1159,41 @@ def load_servicos() -> pd.DataFrame:
             if col not in df.columns:
                 df[col] = None
         
-        return df[iox.COLS_01]
+        return iox.apply_dtypes(df[iox.COLS_01], iox.DTYPES_01)
     except Exception as e:
         print(f"Erro ao carregar serviços: {e}")
         import traceback
         traceback.print_exc()
         return pd.DataFrame(columns=iox.COLS_01)
 
-def _df_to_db_acompanhamento(df: pd.DataFrame) -> list:
-    """Converte DataFrame da Tabela 02 para formato do banco."""
+def _df_to_db_acompanhamento(df: pd.DataFrame, caminho=None) -> list:
+    """Converte DataFrame da Tabela 02 para formato do banco.
+    `caminho` é informado pelos processos de paralelo (que não herdam DB_PATH)."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(caminho or DB_PATH)
         cursor = conn.cursor()
         
+        # Chaves naturais -> (servico_id, cadastro_id) numa consulta só
+        servicos = _ids_por_chave(cursor, SQL_SERVICO_IDS, 5)
+        
         rows = []
         for _, row in df.iterrows():
             # Buscar servico_id pela chave natural
-            cursor.execute('''
-                SELECT s.id FROM servico s
-                JOIN cadastro c ON c.id = s.cadastro_id
-                WHERE c.zona_portuaria = ? 
-                  AND c.obj_concessao = ?
-                  AND s.tipo_servico = ?
-                  AND s.fase = ?
-                  AND s.servico = ?
-            ''', (
+            serv_result = servicos.get((
                 str(row.get('Zona portuária', '')),
                 str(row.get('Obj. de Concessão', '')),
                 str(row.get('Tipo de Serviço', '')) if pd.notna(row.get('Tipo de Serviço')) else '',
                 str(row.get('Fase', '')) if pd.notna(row.get('Fase')) else '',
                 str(row.get('Serviço', '')) if pd.notna(row.get('Serviço')) else '',
             ))
-            serv_result = cursor.fetchone()
             if not serv_result:
                 continue  # Pular se não encontrar serviço
             
-            servico_id = serv_result[0]
+            servico_id, cadastro_id = serv_result
             
             rows.append((
                 servico_id,
+                cadastro_id,
                 str(row.get('Descrição', '')) if pd.notna(row.get('Descrição')) else None,
                 svc.normalize_percentage(row.get('% executada')) if pd.notna(row.get('% executada')) else None,
                 float(row.get('CAPEX (Reaj.)')) if pd.notna(row.get('CAPEX (Reaj.)')) else None,
@@ -562,9 +1214,13 @@ def _df_to_db_acompanhamento(df: pd.DataFrame) -> list:
         traceback.print_exc()
         return []
 
-def save_acompanhamento(df: pd.DataFrame) -> bool:
-    """Salva o acompanhamento (Tabela 02) no banco de dados."""
+def save_acompanhamento(df: pd.DataFrame, cubo: bool = True) -> bool:
+    """Salva o acompanhamento (Tabela 02) no banco de dados; com cubo=False não
+    pré-calcula o cubo de analytics (save_all faz isso uma vez no fim)."""
     try:
+        # Conversão antes de abrir a escrita; frames grandes vão em blocos para os processos
+        rows = [r for bloco in paralelo.mapear_blocos(_df_to_db_acompanhamento, df, DB_PATH) for r in bloco]
+        
         conn = sqlite3.connect(DB_PATH)
         conn.execute('PRAGMA foreign_keys = ON')
         cursor = conn.cursor()
@@ -573,17 +1229,16 @@ def save_acompanhamento(df: pd.DataFrame) -> bool:
         cursor.execute('DELETE FROM acompanhamento')
         
         # Inserir novos dados
-        rows = _df_to_db_acompanhamento(df)
         if rows:
-            cursor.executemany('''
-                INSERT INTO acompanhamento 
-                (servico_id, descricao, perc_executada, capex_reaj, valor_executado,
-                 data_atualizacao, responsavel, cargo, setor, risco_tipo, risco_descricao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', rows)
+            cursor.executemany(_sql_insert('acompanhamento', COLUNAS_ACOMPANHAMENTO), _com_hash(rows))
         
+        rollup.recalcular(conn)  # só os portos afetados
         conn.commit()
+        if cubo:
+            _precomputar_cubo(conn)
+        _compactar_log(conn)
         conn.close()
+        events.notificar()  # clientes de /api/stream neste processo
         return True
     except Exception as e:
         print(f"Erro ao salvar acompanhamento: {e}")
@@ -616,7 +1271,7 @@ def load_acompanhamento() -> pd.DataFrame:
             if col not in df.columns:
                 df[col] = None
         
-        return df[iox.COLS_02]
+        return iox.apply_dtypes(df[iox.COLS_02], iox.DTYPES_02)
     except Exception as e:
         print(f"Erro ao carregar acompanhamento: {e}")
         import traceback
@@ -626,11 +1281,114 @@ def load_acompanhamento() -> pd.DataFrame:
 def save_all(df00: pd.DataFrame, df01: pd.DataFrame, df02: pd.DataFrame) -> bool:
     """Salva todas as tabelas no banco de dados (na ordem correta devido a FK)."""
     success = True
-    success = save_cadastro(df00) and success
-    success = save_servicos(df01) and success
+    success = save_cadastro(df00, cubo=False) and success
+    success = save_servicos(df01, cubo=False) and success
     success = save_acompanhamento(df02) and success
     return success
 
+# Importação diferencial: compara a impressão digital de cada linha recebida com a
+# gravada, pela chave natural, e aplica só inserções, atualizações e remoções.
+# Linhas inalteradas não são tocadas (nem triggers, nem change_log, nem rollup).
+# Chave natural = posições na tupla convertida; o ordinal entre linhas de mesma
+# chave (acompanhamentos da mesma data, por exemplo) completa a chave.
+CHAVES_NATURAIS = {
+    'cadastro': (0, 2),                # zona_portuaria, obj_concessao
+    'servico': (0, 1, 2, 3, 4),        # cadastro_id, tipo_servico, fase, servico, descricao_servico
+    'acompanhamento': (0, 6),          # servico_id, data_atualizacao
+}
+
+def _com_ordinal(chaves) -> list:
+    """Acrescenta a cada chave sua ocorrência entre as iguais: (chave, n)."""
+    vistas = {}
+    saida = []
+    for chave in chaves:
+        n = vistas.get(chave, 0)
+        vistas[chave] = n + 1
+        saida.append((chave, n))
+    return saida
+
+def _aplicar_diferenca(conn, tabela: str, colunas: tuple, rows: list) -> dict:
+    """Sincroniza `tabela` com as tuplas convertidas `rows`; devolve as contagens."""
+    posicoes = CHAVES_NATURAIS[tabela]
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT id, {", ".join(colunas[i] for i in posicoes)}, hash_linha FROM {tabela} ORDER BY id')
+    gravadas = cursor.fetchall()
+    atuais = dict(zip(_com_ordinal(tuple(r[1:-1]) for r in gravadas), ((r[0], r[-1]) for r in gravadas)))
+    novas = dict(zip(_com_ordinal(tuple(r[i] for i in posicoes) for r in rows), _com_hash(rows)))
+    
+    remover = [(atuais[k][0],) for k in atuais.keys() - novas.keys()]
+    atualizar = [novas[k] + (atuais[k][0],) for k in novas.keys() & atuais.keys() if novas[k][-1] != atuais[k][1]]
+    inserir = [linha for k, linha in novas.items() if k not in atuais]
+    
+    # Remoções primeiro, para liberar chaves UNIQUE reaproveitadas pelas inserções
+    cursor.executemany(f'DELETE FROM {tabela} WHERE id = ?', remover)
+    atribuicoes = ', '.join(f'{c} = ?' for c in colunas + ('hash_linha',))
+    cursor.executemany(f'UPDATE {tabela} SET {atribuicoes}, updated_at = CURRENT_TIMESTAMP WHERE id = ?', atualizar)
+    if tabela == 'cadastro':
+        _save_cadastro_ufs(conn, [(linha[-1], linha[1]) for linha in atualizar])
+        ids = _inserir_cadastros(cursor, inserir)
+        _save_cadastro_ufs(conn, [(cadastro_id, linha[1]) for cadastro_id, linha in zip(ids, inserir)],
+                           substituir=False)
+    else:
+        cursor.executemany(_sql_insert(tabela, colunas), inserir)
+    return {
+        'inseridas': len(inserir),
+        'atualizadas': len(atualizar),
+        'removidas': len(remover),
+        'inalteradas': len(novas) - len(inserir) - len(atualizar),
+    }
+
+def save_all_diferencial(df00: pd.DataFrame, df01: pd.DataFrame, df02: pd.DataFrame,
+                         progresso=None) -> Optional[dict]:
+    """Como save_all, mas aplicando só a diferença em relação ao banco.
+
+    Devolve {tabela: {inseridas, atualizadas, removidas, inalteradas}}, ou None
+    em caso de erro (a tabela em andamento volta ao estado anterior). Cada tabela
+    é gravada na sua transação, como em save_all: a conversão de serviços e
+    acompanhamentos resolve as chaves naturais contra os pais já gravados.
+    `progresso(atual, total)` é chamado antes de cada tabela. Conversão e
+    gravação de cada tabela são trechos da medição ativa (trechos.py).
+    """
+    passos = (
+        ('cadastro', COLUNAS_CADASTRO, _df_to_db_cadastro, df00, ()),
+        ('servico', COLUNAS_SERVICO, _df_to_db_servicos, df01, (DB_PATH,)),
+        ('acompanhamento', COLUNAS_ACOMPANHAMENTO, _df_to_db_acompanhamento, df02, (DB_PATH,)),
+    )
+    resumo = {}
+    try:
+        for i, (tabela, colunas, converter, df, args) in enumerate(passos):
+            if progresso is not None:
+                progresso(i, len(passos))
+            with trechos.trecho(f'convert_{tabela}', linhas=len(df)):
+                rows = [r for bloco in paralelo.mapear_blocos(converter, df, *args) for r in bloco]
+            with trechos.trecho(f'write_{tabela}', linhas=len(rows)):
+                conn = sqlite3.connect(DB_PATH)
+                try:
+                    conn.execute('PRAGMA foreign_keys = ON')
+                    resumo[tabela] = _aplicar_diferenca(conn, tabela, colunas, rows)
+                    rollup.recalcular(conn)  # só os portos afetados
+                    conn.commit()
+                finally:
+                    conn.close()
+        with trechos.trecho('analytics_cubo'):
+            conn = sqlite3.connect(DB_PATH)
+            try:
+                _precomputar_cubo(conn)
+                _compactar_log(conn)
+            finally:
+                conn.close()
+        if progresso is not None:
+            progresso(len(passos), len(passos))
+    except Exception as e:
+        print(f"Erro na importação diferencial: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if resumo:
+            events.notificar()  # clientes de /api/stream neste processo
+    return resumo
+
 def load_all() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """Carrega todas as tabelas do banco de dados."""
     return load_cadastro(), load_servicos(), load_acompanhamento()
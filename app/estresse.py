@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Teste de estresse de leitura/escrita concorrente no SQLite.
+
+Reproduz o cenário de produção: N leitores (threads ou processos, como os
+workers do gunicorn) chamando os endpoints de api.py enquanto um escritor grava
+no mesmo banco, em loop, por db.save_all (botão "Salvar" do Streamlit) ou por
+edições de uma linha. Para cada combinação de journal_mode e busy_timeout,
+informa a latência dos leitores (p50/p95/p99/máx), os erros de banco ocupado
+("database is locked") de leitores e escritor e a vazão do escritor.
+
+    python estresse.py --leitores 4 --modo-leitores processos --escritor save_all \\
+        --journal delete wal --busy-timeout 0 5000 --duracao 10
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import db
+import sintetico
+
+ENDPOINTS = ['/api/portos', '/api/portos/summary', '/api/portos/{porto_id}']
+# Tempo para os leitores subirem (importar api.py nos processos) antes da largada
+AQUECIMENTO = {'threads': 0.2, 'processos': 3.0}
+
+def _ocupado(erro) -> bool:
+    texto = str(erro).lower()
+    return 'locked' in texto or 'busy' in texto
+
+def _aplicar_busy_timeout(busy_timeout_ms: int):
+    """Faz toda conexão aberta por sqlite3.connect usar o busy_timeout informado
+    (api.py e db.py conectam sem timeout, isto é, com os 5 s padrão do módulo).
+    Devolve o connect original."""
+    connect = sqlite3.connect
+
+    def connect_com_timeout(*args, **kwargs):
+        kwargs.setdefault('timeout', busy_timeout_ms / 1000)
+        return connect(*args, **kwargs)
+    sqlite3.connect = connect_com_timeout
+    return connect
+
+def _leitor(caminho: str, urls: List[str], inicio: float, fim: float, busy_timeout_ms: Optional[int]) -> dict:
+    """Chama as urls em rodízio de `inicio` a `fim` (time.time()). De nível de
+    módulo para rodar nos processos; em threads, o timeout já vem do processo."""
+    import api
+    if busy_timeout_ms is not None:
+        db.DB_PATH = Path(caminho)
+        _aplicar_busy_timeout(busy_timeout_ms)
+    client = api.app.test_client()
+    latencias, ocupado, erros = [], 0, 0
+    time.sleep(max(0.0, inicio - time.time()))
+    i = 0
+    while time.time() < fim:
+        url = urls[i % len(urls)]
+        i += 1
+        t0 = time.perf_counter()
+        resposta = client.get(url)
+        latencias.append((time.perf_counter() - t0) * 1000)
+        if resposta.status_code != 200:
+            if _ocupado(resposta.get_data(as_text=True)):
+                ocupado += 1
+            else:
+                erros += 1
+    return {'latencias': latencias, 'ocupado': ocupado, 'erros': erros}
+
+def _escritor(modo: str, frames: tuple, inicio: float, fim: float) -> dict:
+    """Grava em loop até `fim`: db.save_all inteiro ou UPDATE de um acompanhamento por transação."""
+    operacoes, ocupado, erros = 0, 0, 0
+    conn = sqlite3.connect(db.DB_PATH)
+    ids = [r[0] for r in conn.execute('SELECT id FROM acompanhamento')]
+    conn.close()
+    time.sleep(max(0.0, inicio - time.time()))
+    while time.time() < fim:
+        if modo == 'save_all':
+            # save_all não propaga a exceção: a causa da falha vem da mensagem impressa
+            saida = io.StringIO()
+            with contextlib.redirect_stdout(saida), contextlib.redirect_stderr(saida):
+                ok = db.save_all(*frames)
+            if ok:
+                operacoes += 1
+            elif _ocupado(saida.getvalue()):
+                ocupado += 1
+            else:
+                erros += 1
+            continue
+        conn = sqlite3.connect(db.DB_PATH)
+        try:
+            conn.execute('UPDATE acompanhamento SET perc_executada = ? WHERE id = ?',
+                         (round(random.random(), 4), random.choice(ids)))
+            conn.commit()
+            operacoes += 1
+        except sqlite3.OperationalError as e:
+            if _ocupado(e):
+                ocupado += 1
+            else:
+                erros += 1
+        finally:
+            conn.close()
+    return {'operacoes': operacoes, 'ocupado': ocupado, 'erros': erros}
+
+def _percentis(latencias: List[float]) -> dict:
+    if not latencias:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    if len(latencias) == 1:
+        q = latencias * 99
+    else:
+        q = statistics.quantiles(latencias, n=100, method='inclusive')
+    return {'p50_ms': round(q[49], 2), 'p95_ms': round(q[94], 2), 'p99_ms': round(q[98], 2),
+            'max_ms': round(max(latencias), 2)}
+
+def rodada(base: Path, pasta: Path, journal: str, busy_timeout_ms: int, leitores: int = 4,
+           modo_leitores: str = 'threads', escritor: str = 'save_all', duracao: float = 10.0) -> dict:
+    """Uma configuração (journal_mode, busy_timeout) sobre uma cópia do banco `base`."""
+    caminho = pasta / f'estresse_{journal}_{busy_timeout_ms}.db'
+    shutil.copy(base, caminho)
+    conn = sqlite3.connect(caminho)
+    conn.execute(f'PRAGMA journal_mode = {journal}')  # persiste no arquivo (WAL) para todas as conexões
+    porto_id = conn.execute('SELECT MIN(id) FROM cadastro').fetchone()[0]
+    conn.close()
+    urls = [u.format(porto_id=porto_id) for u in ENDPOINTS]
+
+    caminho_original = db.DB_PATH
+    db.DB_PATH = caminho
+    connect = _aplicar_busy_timeout(busy_timeout_ms)
+    try:
+        frames = db.load_all()
+        if modo_leitores == 'processos':
+            contexto = multiprocessing.get_context(
+                'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+            executor = ProcessPoolExecutor(max_workers=leitores, mp_context=contexto)
+            timeout_leitor = busy_timeout_ms
+        else:
+            executor = ThreadPoolExecutor(max_workers=leitores)
+            timeout_leitor = None
+        inicio = time.time() + AQUECIMENTO[modo_leitores]
+        fim = inicio + duracao
+        with executor:
+            futuros = [executor.submit(_leitor, str(caminho), urls, inicio, fim, timeout_leitor)
+                       for _ in range(leitores)]
+            escrita = _escritor(escritor, frames, inicio, fim)
+            leituras = [f.result() for f in futuros]
+    finally:
+        sqlite3.connect = connect
+        db.DB_PATH = caminho_original
+
+    latencias = [l for r in leituras for l in r['latencias']]
+    return {
+        'journal_mode': journal,
+        'busy_timeout_ms': busy_timeout_ms,
+        'leitores': leitores,
+        'modo_leitores': modo_leitores,
+        'escritor': escritor,
+        'leituras': len(latencias),
+        'leituras_por_s': round(len(latencias) / duracao, 1),
+        **_percentis(latencias),
+        'leituras_ocupado': sum(r['ocupado'] for r in leituras),
+        'leituras_erro': sum(r['erros'] for r in leituras),
+        'escritas': escrita['operacoes'],
+        'escritas_por_s': round(escrita['operacoes'] / duracao, 2),
+        'escritas_ocupado': escrita['ocupado'],
+        'escritas_erro': escrita['erros'],
+    }
+
+def executar(journals=('delete', 'wal'), busy_timeouts=(0, 5000), escala: float = 0.1, **opcoes) -> list:
+    """Todas as combinações de journal_mode x busy_timeout sobre o mesmo conjunto sintético."""
+    with tempfile.TemporaryDirectory(prefix='estresse_') as pasta:
+        pasta = Path(pasta)
+        base = pasta / 'base.db'
+        sintetico.salvar(sintetico.gerar(escala), 'sqlite', base)
+        return [rodada(base, pasta, j, t, **opcoes) for j in journals for t in busy_timeouts]
+
+def _imprimir(resultados: list) -> None:
+    colunas = [('journal_mode', 9), ('busy_timeout_ms', 8), ('leituras_por_s', 9), ('p50_ms', 9),
+               ('p95_ms', 9), ('p99_ms', 9), ('max_ms', 9), ('leituras_ocupado', 9),
+               ('escritas_por_s', 9), ('escritas_ocupado', 9)]
+    titulos = ['journal', 'busy ms', 'leit/s', 'p50 ms', 'p95 ms', 'p99 ms', 'máx ms', 'leit ocup',
+               'escr/s', 'escr ocup']
+    print(''.join(f'{t:>{w + 2}}' for t, (_, w) in zip(titulos, colunas)))
+    for r in resultados:
+        print(''.join(f'{str(r[c]):>{w + 2}}' for c, w in colunas))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Leitores na API x escritor no mesmo banco SQLite.')
+    parser.add_argument('--leitores', type=int, default=4)
+    parser.add_argument('--modo-leitores', choices=['threads', 'processos'], default='processos')
+    parser.add_argument('--escritor', choices=['save_all', 'linha'], default='save_all')
+    parser.add_argument('--journal', nargs='+', default=['delete', 'wal'],
+                        choices=['delete', 'truncate', 'persist', 'wal'])
+    parser.add_argument('--busy-timeout', type=int, nargs='+', default=[0, 5000], help='em milissegundos')
+    parser.add_argument('--duracao', type=float, default=10.0, help='segundos por configuração')
+    parser.add_argument('--escala', type=float, default=0.1, help='fator de escala de sintetico.py')
+    parser.add_argument('--json', type=Path, help='grava os resultados neste arquivo')
+    args = parser.parse_args(argv)
+
+    resultados = executar(args.journal, args.busy_timeout, args.escala, leitores=args.leitores,
+                          modo_leitores=args.modo_leitores, escritor=args.escritor, duracao=args.duracao)
+    _imprimir(resultados)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
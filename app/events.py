@@ -0,0 +1,141 @@
+from __future__ import annotations
+import json
+import queue
+import sqlite3
+import threading
+from typing import List, Optional
+
+import db
+
+INTERVALO_VIGIA = 1.0   # segundos entre leituras de PRAGMA data_version
+KEEPALIVE = 15.0        # comentário SSE para manter proxies com a conexão aberta
+DURACAO_MAXIMA = 300.0  # o cliente reconecta sozinho (EventSource) com Last-Event-ID
+LIMITE_PORTOS = 100     # acima disto (ex.: importação completa) só vai o resumo, com reset
+
+# Porto de cada linha do log de alterações: o gravado pelo trigger (inclusive
+# de linhas já excluídas); entradas anteriores à coluna cadastro_id caem na linha atual
+SQL_PORTOS_ALTERADOS = """
+SELECT DISTINCT COALESCE(l.cadastro_id, CASE l.tabela
+    WHEN 'cadastro' THEN l.registro_id
+    WHEN 'servico' THEN (SELECT s.cadastro_id FROM servico s WHERE s.id = l.registro_id)
+    ELSE (SELECT s.cadastro_id FROM acompanhamento a JOIN servico s ON s.id = a.servico_id
+          WHERE a.id = l.registro_id)
+END)
+FROM change_log l
+WHERE l.revisao > ? AND l.revisao <= ?
+"""
+
+def _revisao(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT valor FROM revisao_dados WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+def eventos_desde(conn: sqlite3.Connection, desde: int, fonte: str = 'portos') -> List[dict]:
+    """Eventos para um cliente que viu os dados até a revisão `desde`:
+    um 'port' por porto alterado e um 'summary' ao final.
+
+    Sem log de alterações (banco do present_tela) ou com muitos portos
+    alterados, vai só o 'summary' com reset=True: o cliente recarrega tudo.
+    """
+    if fonte != 'portos':
+        return [{'event': 'summary', 'source': fonte, 'reset': True}]
+    revisao = _revisao(conn)
+    if revisao == desde:
+        return []
+    horizonte = conn.execute('SELECT horizonte FROM revisao_dados WHERE id = 1').fetchone()[0]
+    portos = {r[0] for r in conn.execute(SQL_PORTOS_ALTERADOS, (desde, revisao))} - {None}
+    reset = desde > revisao or desde < horizonte or len(portos) > LIMITE_PORTOS
+    eventos = [] if reset else [
+        {'event': 'port', 'id': revisao, 'source': fonte, 'port': porto} for porto in sorted(portos)
+    ]
+    eventos.append({'event': 'summary', 'id': revisao, 'source': fonte, 'reset': reset, 'ports': len(portos)})
+    return eventos
+
+def formatar(evento: dict) -> str:
+    """Evento no formato text/event-stream."""
+    linhas = []
+    if evento.get('id') is not None:
+        linhas.append(f"id: {evento['id']}")
+    linhas.append(f"event: {evento['event']}")
+    dados = {k: v for k, v in evento.items() if k not in ('event', 'id')}
+    linhas.append(f'data: {json.dumps(dados, ensure_ascii=False)}')
+    return '\n'.join(linhas) + '\n\n'
+
+
+class Notificador:
+    """Distribui alterações de um banco SQLite às conexões SSE do processo.
+
+    Uma única thread por processo e por banco lê PRAGMA data_version, que muda
+    quando outra conexão (outro processo, worker ou o Streamlit) faz commit.
+    Só então consulta o log de alterações. Conexões ociosas ficam bloqueadas
+    na própria fila, sem consultas; sem assinantes, a thread não consulta nada.
+    notificar() acorda a thread na hora (gravações do próprio processo).
+    """
+
+    def __init__(self, caminho=None, fonte: str = 'portos', intervalo: float = INTERVALO_VIGIA):
+        self.caminho = caminho
+        self.fonte = fonte
+        self.intervalo = intervalo
+        self.assinantes: set = set()
+        self.lock = threading.Lock()
+        self.acordar = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def assinar(self, fila: Optional[queue.Queue] = None) -> queue.Queue:
+        """Registra uma fila (nova, ou compartilhada entre notificadores) para receber os eventos."""
+        fila = fila if fila is not None else queue.Queue()
+        with self.lock:
+            self.assinantes.add(fila)
+            if self.thread is None or not self.thread.is_alive():
+                pronto = threading.Event()
+                self.thread = threading.Thread(target=self._vigiar, args=(pronto,), name=f'sse-{self.fonte}', daemon=True)
+                self.thread.start()
+                pronto.wait(1)  # estado inicial lido antes de devolver a fila
+        return fila
+
+    def cancelar(self, fila: queue.Queue) -> None:
+        with self.lock:
+            self.assinantes.discard(fila)
+
+    def publicar(self, eventos: List[dict]) -> None:
+        with self.lock:
+            filas = list(self.assinantes)
+        for fila in filas:
+            for evento in eventos:
+                fila.put(evento)
+
+    def notificar(self) -> None:
+        self.acordar.set()
+
+    def _vigiar(self, pronto: threading.Event) -> None:
+        conn = sqlite3.connect(self.caminho or db.DB_PATH)
+        try:
+            versao = conn.execute('PRAGMA data_version').fetchone()[0]
+            revisao = _revisao(conn) if self.fonte == 'portos' else None
+            pronto.set()
+            while True:
+                self.acordar.wait(self.intervalo)
+                self.acordar.clear()
+                with self.lock:
+                    if not self.assinantes:
+                        self.thread = None
+                        return
+                try:
+                    atual = conn.execute('PRAGMA data_version').fetchone()[0]
+                    if atual == versao:
+                        continue
+                    versao = atual
+                    eventos = eventos_desde(conn, revisao, self.fonte)
+                    if eventos and self.fonte == 'portos':
+                        revisao = eventos[-1]['id']
+                    self.publicar(eventos)
+                except sqlite3.Error as e:
+                    print(f"Erro ao verificar alterações ({self.fonte}): {e}")
+        finally:
+            conn.close()
+
+
+notificador = Notificador()
+
+def notificar() -> None:
+    """Chamado por db.save_* depois do commit."""
+    notificador.notificar()
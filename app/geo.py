@@ -0,0 +1,69 @@
+from __future__ import annotations
+import numpy as np
+
+# Elipsoide GRS80 (datum SIRGAS2000)
+GRS80_A = 6378137.0
+GRS80_F = 1 / 298.257222101
+
+UTM_K0 = 0.9996
+UTM_FALSE_EASTING = 500000.0
+UTM_FALSE_NORTHING_SUL = 10000000.0
+
+# Fusos UTM que cobrem o território brasileiro
+FUSOS_BRASIL = range(18, 26)
+
+def meridiano_central(fuso):
+    """Longitude (graus) do meridiano central de um fuso UTM."""
+    return -183.0 + 6.0 * np.asarray(fuso, dtype=float)
+
+def utm_to_latlon(e, n, fuso):
+    """Converte coordenadas UTM (SIRGAS2000, hemisfério sul) para lat/lon em graus.
+
+    Aceita escalares ou arrays/Series (vetorizado com NumPy). Linhas com
+    coordenada ou fuso ausente/fora de faixa resultam em NaN.
+    Usa a série inversa da projeção transversa de Mercator (Snyder, 1987),
+    com erro sub-milimétrico dentro do fuso.
+    """
+    e = np.asarray(e, dtype=float)
+    n = np.asarray(n, dtype=float)
+    fuso = np.asarray(fuso, dtype=float)
+    invalido = ~np.isin(fuso, list(FUSOS_BRASIL))
+
+    e2 = GRS80_F * (2 - GRS80_F)
+    ep2 = e2 / (1 - e2)
+    e1 = (1 - np.sqrt(1 - e2)) / (1 + np.sqrt(1 - e2))
+
+    x = e - UTM_FALSE_EASTING
+    m = (n - UTM_FALSE_NORTHING_SUL) / UTM_K0
+    mu = m / (GRS80_A * (1 - e2 / 4 - 3 * e2**2 / 64 - 5 * e2**3 / 256))
+
+    phi1 = (
+        mu
+        + (3 * e1 / 2 - 27 * e1**3 / 32) * np.sin(2 * mu)
+        + (21 * e1**2 / 16 - 55 * e1**4 / 32) * np.sin(4 * mu)
+        + (151 * e1**3 / 96) * np.sin(6 * mu)
+        + (1097 * e1**4 / 512) * np.sin(8 * mu)
+    )
+
+    sin1, cos1, tan1 = np.sin(phi1), np.cos(phi1), np.tan(phi1)
+    c1 = ep2 * cos1**2
+    t1 = tan1**2
+    n1 = GRS80_A / np.sqrt(1 - e2 * sin1**2)
+    r1 = GRS80_A * (1 - e2) / (1 - e2 * sin1**2) ** 1.5
+    d = x / (n1 * UTM_K0)
+
+    lat = phi1 - (n1 * tan1 / r1) * (
+        d**2 / 2
+        - (5 + 3 * t1 + 10 * c1 - 4 * c1**2 - 9 * ep2) * d**4 / 24
+        + (61 + 90 * t1 + 298 * c1 + 45 * t1**2 - 252 * ep2 - 3 * c1**2) * d**6 / 720
+    )
+    lon = (
+        d
+        - (1 + 2 * t1 + c1) * d**3 / 6
+        + (5 - 2 * c1 + 28 * t1 - 3 * c1**2 + 8 * ep2 + 24 * t1**2) * d**5 / 120
+    ) / cos1
+
+    lat = np.degrees(lat)
+    lon = meridiano_central(np.where(invalido, np.nan, fuso)) + np.degrees(lon)
+    lat = np.where(invalido | np.isnan(lon), np.nan, lat)
+    return lat, lon
@@ -0,0 +1,157 @@
+from __future__ import annotations
+import hashlib
+import io
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import pandas as pd
+
+import consultas
+import metricas
+import db
+import io_utils as iox
+import jobs
+import paralelo
+import services as svc
+import trechos
+
+# Fila de importações do banco principal (api.py e Streamlit)
+fila = jobs.Fila(lambda: db.DB_PATH)
+
+COLUNAS_ERROS = ['tabela', 'linha', 'coluna', 'erro']
+# Etapas de importar_excel(gravar=False): sem 'insert', a barra chega ao fim
+ETAPAS_SEM_GRAVAR = jobs.ETAPAS[:3]
+
+# Frames já lidos e validados, por hash do conteúdo (só neste processo). Poucos
+# itens: cada entrada guarda as três tabelas inteiras.
+MAX_PLANILHAS_EM_CACHE = 4
+_planilhas: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+def hash_conteudo(conteudo: bytes) -> str:
+    """sha256 do arquivo: a chave de todos os atalhos de reimportação."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+def planilha_em_cache(hash_: str) -> Optional[tuple]:
+    """((df00, df01, df02), erros) de um conteúdo já lido, em cópias."""
+    with _lock:
+        metricas.cache('planilhas', hash_ in _planilhas)
+        if hash_ not in _planilhas:
+            return None
+        _planilhas.move_to_end(hash_)
+        frames, erros = _planilhas[hash_]
+    return tuple(df.copy() for df in frames), erros.copy()
+
+def _guardar_planilha(hash_: str, frames: tuple, erros: pd.DataFrame) -> None:
+    with _lock:
+        _planilhas[hash_] = (tuple(df.copy() for df in frames), erros.copy())
+        _planilhas.move_to_end(hash_)
+        while len(_planilhas) > MAX_PLANILHAS_EM_CACHE:
+            _planilhas.popitem(last=False)
+
+def ja_importado(hash_: str) -> Optional[dict]:
+    """Importação anterior do mesmo conteúdo, se os dados não mudaram desde então."""
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        row = conn.execute('''
+            SELECT a.revisao, a.job_id, a.importado_em
+            FROM importacao_arquivo a
+            JOIN revisao_dados r ON r.id = 1 AND r.epoca = a.epoca AND r.valor = a.revisao
+            WHERE a.hash = ?
+        ''', (hash_,)).fetchone()
+    finally:
+        conn.close()
+    return dict(zip(('revisao', 'job_id', 'importado_em'), row)) if row else None
+
+def _marcar_importado(hash_: str, job_id: str) -> None:
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO importacao_arquivo (hash, epoca, revisao, job_id)
+            SELECT ?, epoca, valor, ? FROM revisao_dados WHERE id = 1
+        ''', (hash_, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def validar(df00: pd.DataFrame, df01: pd.DataFrame, df02: pd.DataFrame, job=None) -> pd.DataFrame:
+    """Erros de validação das três tabelas num único frame (tabela, linha, coluna, erro)."""
+    etapas = (
+        ('00', svc.validate_cadastro, df00, ()),
+        ('01', svc.validate_servicos, df01, (df00,)),
+        ('02', svc.validate_acompanhamento, df02, (df01,)),
+    )
+    frames = []
+    for i, (tabela, validar_tabela, df, referencias) in enumerate(etapas):
+        if job is not None:
+            job.etapa('validate', i, len(etapas))
+        # Tabelas grandes são validadas em blocos de linhas nos processos (ordem preservada)
+        with trechos.trecho(f'validate_{tabela}', linhas=len(df)):
+            erros = pd.concat(paralelo.mapear_blocos(validar_tabela, df, *referencias), ignore_index=True)
+        frames.append(erros.assign(tabela=tabela))
+    return pd.concat(frames, ignore_index=True)[COLUNAS_ERROS]
+
+def _resumo_chaves(df00: pd.DataFrame, df01: pd.DataFrame, erros: pd.DataFrame) -> dict:
+    """Linhas cuja chave natural não encontra o pai: db.save_* as descarta."""
+    orfaos = erros[erros['coluna'].str.startswith('chave')]
+    return {
+        'cadastros': len(df00),
+        'servicos': len(df01) - int((orfaos['tabela'] == '01').sum()),
+        'servicos_sem_cadastro': int((orfaos['tabela'] == '01').sum()),
+        'acompanhamentos_sem_servico': int((orfaos['tabela'] == '02').sum()),
+    }
+
+def importar_excel(job: jobs.Job, conteudo: bytes, gravar: bool = True) -> Tuple[pd.DataFrame, ...]:
+    """Job de importação de uma planilha completa (Tabelas 00, 01 e 02).
+
+    Etapas: parse -> validate -> resolve (chaves naturais) -> insert. Os erros
+    de validação ficam no resultado do job; com gravar=False (Streamlit, que
+    grava pelo botão "Salvar") para depois da resolução; submeta-o então com
+    etapas=ETAPAS_SEM_GRAVAR. Devolve os frames.
+    Um conteúdo já lido neste processo não é lido nem validado de novo.
+    Tempo, CPU e memória de cada etapa (trechos.py) ficam em resultado['trechos'].
+    """
+    with trechos.medir('importacao', job=job.id) as medicao:
+        try:
+            return _importar_excel(job, conteudo, gravar)
+        finally:
+            job.registrar(trechos=medicao.registros)
+
+def _importar_excel(job: jobs.Job, conteudo: bytes, gravar: bool) -> Tuple[pd.DataFrame, ...]:
+    hash_ = hash_conteudo(conteudo)
+    job.etapa('parse')
+    em_cache = planilha_em_cache(hash_)
+    if em_cache is None:
+        with trechos.trecho('parse') as t:
+            frames = iox.read_excel(io.BytesIO(conteudo))
+            t['linhas'] = sum(len(df) for df in frames)
+    else:
+        frames, erros = em_cache
+    df00, df01, df02 = frames
+    job.registrar(hash=hash_, cache=em_cache is not None,
+                  linhas={'00': len(df00), '01': len(df01), '02': len(df02)})
+
+    if em_cache is None:
+        erros = validar(df00, df01, df02, job)
+        _guardar_planilha(hash_, frames, erros)
+    job.registrar(erros=erros.to_dict('records'), total_erros=len(erros))
+
+    job.etapa('resolve')
+    with trechos.trecho('resolve', linhas=len(df01) + len(df02)):
+        chaves = _resumo_chaves(df00, df01, erros)
+    job.registrar(chaves=chaves)
+
+    if gravar:
+        # Só a diferença: linhas com a mesma impressão digital não são regravadas
+        with consultas.medir() as sql:
+            alteracoes = db.save_all_diferencial(df00, df01, df02,
+                                                 progresso=lambda i, total: job.etapa('insert', i, total))
+        if alteracoes is None:
+            raise RuntimeError('Erro ao gravar a importação')
+        job.registrar(alteracoes=alteracoes)
+        if consultas.instalado():
+            job.registrar(sql=sql.resumo())
+        _marcar_importado(hash_, job.id)
+    return df00, df01, df02
@@ -1,14 +1,19 @@
 from __future__ import annotations
+import io
+import os
 import pandas as pd
 from typing import List, Tuple
 
+import paralelo
+
 SHEET_NAMES_CAD = ["Tabela 00 - Cadastro", "Planilha 00", "Cadastro", "00"]
 SHEET_NAMES_SRV = ["Tabela 01 - Serviços", "Planilha 01", "Serviços", "01"]
 SHEET_NAMES_MON = ["Tabela 02 - Acompanhamento", "Planilha 02", "Acompanhamento", "02"]
 
 COLS_00 = [
     "Zona portuária","UF","Obj. de Concessão","Tipo","CAPEX Total","CAPEX Executado","% CAPEX Executado",
-    "Data de assinatura do contrato","Descrição","Latitude","Longitude"
+    "Data de assinatura do contrato","Descrição","Latitude","Longitude",
+    "Coordenada E (UTM)","Coordenada S (UTM)","Fuso"
 ]
 
 COLS_01 = [
@@ -24,30 +29,137 @@ COLS_02 = [
     "Responsável","Cargo","Setor","Riscos Relacionados (Tipo)","Riscos Relacionados (Descrição)"
 ]
 
+# Tipos por coluna. Strings muito repetidas (UF, Tipo, Fase, Responsável...)
+# viram "category"; valores monetários ficam em float64 e percentuais em float32.
+CATEGORY = "category"
+DATE = "datetime64[ns]"
+
+DTYPES_00 = {
+    "Zona portuária": CATEGORY, "UF": CATEGORY, "Tipo": CATEGORY,
+    "CAPEX Total": "float64", "CAPEX Executado": "float64", "% CAPEX Executado": "float32",
+    "Data de assinatura do contrato": DATE, "Latitude": "float64", "Longitude": "float64",
+    "Coordenada E (UTM)": "float64", "Coordenada S (UTM)": "float64", "Fuso": "Int8",
+}
+
+DTYPES_01 = {
+    "Zona portuária": CATEGORY, "UF": CATEGORY, "Obj. de Concessão": CATEGORY,
+    "Tipo de Serviço": CATEGORY, "Fase": CATEGORY, "Serviço": CATEGORY,
+    "Prazo início (anos)": "Int16", "Data de início": DATE,
+    "Prazo final (anos)": "Int16", "Data final": DATE, "Fonte (Prazo)": CATEGORY,
+    "% de CAPEX para o serviço": "float32", "CAPEX do Serviço (total)": "float64",
+    "CAPEX do Serviço (exec.)": "float64", "% CAPEX exec.": "float32",
+    "Fonte (% do CAPEX)": CATEGORY,
+}
+
+DTYPES_02 = {
+    "Zona portuária": CATEGORY, "UF": CATEGORY, "Obj. de Concessão": CATEGORY,
+    "Tipo de Serviço": CATEGORY, "Fase": CATEGORY, "Serviço": CATEGORY,
+    "% executada": "float32", "CAPEX (Reaj.)": "float64", "Valor executado": "float64",
+    "Data da atualização": DATE, "Responsável": CATEGORY, "Cargo": CATEGORY,
+    "Setor": CATEGORY, "Riscos Relacionados (Tipo)": CATEGORY,
+}
+
+def _blank_to_na(s: pd.Series) -> pd.Series:
+    if s.dtype == object:
+        s = s.mask(s.astype(str).str.strip() == "")
+    return s
+
+def _cast(s: pd.Series, dtype: str) -> pd.Series:
+    """Converte uma coluna sem perder valores: se algum valor preenchido não
+    puder ser convertido, a coluna é devolvida como veio (para a validação
+    continuar apontando o erro)."""
+    if str(s.dtype) == dtype:
+        return s
+    s = _blank_to_na(s)
+    if dtype == CATEGORY:
+        return s.astype(CATEGORY)
+    if dtype == DATE:
+        out = pd.to_datetime(s, errors="coerce", dayfirst=True, format="mixed")
+    else:
+        out = pd.to_numeric(s, errors="coerce")
+        if dtype.startswith("Int"):
+            valid = out.dropna()
+            if not (valid == valid.round()).all():
+                return s
+        out = out.astype(dtype)
+    if (out.isna() & s.notna()).any():
+        return s
+    return out
+
+def apply_dtypes(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """Aplica o schema de tipos (DTYPES_00/01/02) às colunas presentes em df."""
+    df = df.copy()
+    for col, dtype in dtypes.items():
+        if col in df.columns:
+            df[col] = _cast(df[col], dtype)
+    return df
+
+def para_edicao(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas category de volta a object para o st.data_editor: ele mostra uma
+    categórica como seleção entre as categorias existentes, e o usuário não
+    conseguiria digitar um porto, serviço ou responsável novo (nem escolher
+    nada num frame vazio). Depois da edição, apply_dtypes refaz o schema."""
+    categoricas = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not categoricas:
+        return df
+    return df.astype({c: object for c in categoricas})
+
+def memory_report(**frames: pd.DataFrame) -> pd.DataFrame:
+    """Uso de memória de cada DataFrame, comparado ao mesmo dado em dtype object."""
+    rows = []
+    for name, df in frames.items():
+        atual = int(df.memory_usage(index=True, deep=True).sum())
+        objeto = int(df.astype(object).memory_usage(index=True, deep=True).sum())
+        rows.append({
+            "tabela": name,
+            "linhas": len(df),
+            "bytes (object)": objeto,
+            "bytes (tipado)": atual,
+            "redução": round(objeto / atual, 1) if atual else None,
+        })
+    return pd.DataFrame(rows, columns=["tabela", "linhas", "bytes (object)", "bytes (tipado)", "redução"])
+
 def _find_sheet_name(book: pd.ExcelFile, candidates: List[str]) -> str | None:
     for cand in candidates:
         if cand in book.sheet_names:
             return cand
     return None
 
-def read_excel(path: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    xl = pd.ExcelFile(path)
-    name00 = _find_sheet_name(xl, SHEET_NAMES_CAD)
-    name01 = _find_sheet_name(xl, SHEET_NAMES_SRV)
-    name02 = _find_sheet_name(xl, SHEET_NAMES_MON)
-
-    def _read(name, cols):
-        if name is None:
-            return pd.DataFrame(columns=cols)
-        df = xl.parse(name)
+def _ler_planilha(planilha: tuple, origem) -> pd.DataFrame:
+    """Lê uma planilha (nome, colunas, dtypes) da origem e aplica o schema.
+    De nível de módulo para rodar nos processos de paralelo.mapear."""
+    name, cols, dtypes = planilha
+    if name is None:
+        df = pd.DataFrame(columns=cols)
+    else:
+        if isinstance(origem, bytes):
+            origem = io.BytesIO(origem)
+        df = pd.read_excel(origem, sheet_name=name)
         common = [c for c in cols if c in df.columns]
         df = df[common]
         for c in cols:
             if c not in df.columns:
                 df[c] = pd.Series(dtype=object)
-        return df[cols]
+    return apply_dtypes(df[cols], dtypes)
+
+def read_excel(path) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Lê as Tabelas 00, 01 e 02 (caminho, bytes ou arquivo aberto).
 
-    return _read(name00, COLS_00), _read(name01, COLS_01), _read(name02, COLS_02)
+    Planilhas grandes (>= paralelo.MIN_BYTES) são lidas ao mesmo tempo, uma
+    por processo; as menores, em sequência no próprio processo.
+    """
+    if hasattr(path, 'read'):
+        path = path.read()
+    tamanho = len(path) if isinstance(path, bytes) else os.path.getsize(path)
+    xl = pd.ExcelFile(io.BytesIO(path) if isinstance(path, bytes) else path)
+    planilhas = [
+        (_find_sheet_name(xl, SHEET_NAMES_CAD), COLS_00, DTYPES_00),
+        (_find_sheet_name(xl, SHEET_NAMES_SRV), COLS_01, DTYPES_01),
+        (_find_sheet_name(xl, SHEET_NAMES_MON), COLS_02, DTYPES_02),
+    ]
+    if tamanho >= paralelo.MIN_BYTES:
+        return tuple(paralelo.mapear(_ler_planilha, planilhas, path))
+    return tuple(_ler_planilha(planilha, xl) for planilha in planilhas)
 
 
 def write_excel(path_or_buffer, df00: pd.DataFrame, df01: pd.DataFrame, df02: pd.DataFrame) -> None:
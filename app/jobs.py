@@ -0,0 +1,197 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Sequence
+
+# Fila local de importações em segundo plano, com progresso por etapa.
+#
+# O estado de cada job fica na tabela importacao_job do banco informado: qualquer
+# worker do gunicorn (ou rerun do Streamlit) consulta o mesmo job, embora o
+# trabalho rode no ThreadPoolExecutor do processo que o recebeu. Só usa a
+# biblioteca padrão, para servir também ao present_tela.
+
+ETAPAS = ('parse', 'validate', 'resolve', 'insert')
+# Importações substituem as tabelas inteiras: por padrão, uma de cada vez
+MAX_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1))
+RETENCAO_DIAS = 7
+# Job sem conclusão depois disto (worker morto, gravação final perdida) vira 'erro'
+DURACAO_MAXIMA = float(os.environ.get('IMPORT_TIMEOUT', 1800))
+# Retornos guardados à espera de retirar() (ex.: sessões do Streamlit que não voltaram)
+MAX_RETORNOS = 8
+
+SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS importacao_job (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    arquivo TEXT,
+    situacao TEXT NOT NULL DEFAULT 'na_fila'
+        CHECK (situacao IN ('na_fila', 'executando', 'concluido', 'erro')),
+    etapa TEXT,
+    etapas TEXT NOT NULL,      -- JSON {etapa: {situacao, atual, total}}
+    resultado TEXT,            -- JSON, inclui os erros de validação
+    erro TEXT,
+    criado_em TEXT NOT NULL DEFAULT (datetime('now')),
+    iniciado_em TEXT,
+    concluido_em TEXT
+)
+"""
+
+
+class Job:
+    """Handle passado à função do job para reportar progresso e resultados."""
+
+    def __init__(self, fila: 'Fila', job_id: str, etapas: Sequence[str]):
+        self.fila = fila
+        self.id = job_id
+        self.etapas = {nome: {'situacao': 'pendente', 'atual': 0, 'total': None} for nome in etapas}
+        self.resultado: Dict[str, Any] = {}
+
+    def etapa(self, nome: str, atual: int = 0, total: Optional[int] = None) -> None:
+        """Marca `nome` como em andamento (e as anteriores como concluídas)."""
+        nomes = list(self.etapas)
+        for anterior in nomes[:nomes.index(nome)]:
+            if self.etapas[anterior]['situacao'] != 'concluida':
+                self.etapas[anterior]['situacao'] = 'concluida'
+        self.etapas[nome].update(situacao='executando', atual=atual, total=total)
+        self.fila._gravar(self.id, etapa=nome, etapas=json.dumps(self.etapas))
+
+    def registrar(self, **dados: Any) -> None:
+        """Acrescenta dados (serializáveis em JSON) ao resultado do job."""
+        self.resultado.update(dados)
+        self.fila._gravar(self.id, resultado=json.dumps(self.resultado, default=str))
+
+
+class Fila:
+    """Executa funções `funcao(job, *args)` em segundo plano e guarda o estado no SQLite.
+
+    `caminho` pode ser uma função, resolvida a cada acesso ao banco.
+    """
+
+    def __init__(self, caminho, etapas: Sequence[str] = ETAPAS, max_workers: int = MAX_WORKERS):
+        self.caminho = caminho
+        self.etapas = tuple(etapas)
+        self.max_workers = max_workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.retornos: Dict[str, Any] = {}  # valor devolvido pela função (só neste processo)
+        self.max_retornos = MAX_RETORNOS
+
+    def _conectar(self) -> sqlite3.Connection:
+        caminho = self.caminho() if callable(self.caminho) else self.caminho
+        conn = sqlite3.connect(caminho, timeout=30)
+        conn.execute(SQL_CRIAR)
+        return conn
+
+    def _gravar(self, job_id: str, **campos: Any) -> None:
+        conn = self._conectar()
+        try:
+            atribuicoes = ', '.join(f'{c} = ?' for c in campos)
+            conn.execute(f'UPDATE importacao_job SET {atribuicoes} WHERE id = ?', (*campos.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def submeter(self, tipo: str, funcao: Callable, *args: Any, arquivo: Optional[str] = None,
+                 guardar_retorno: bool = False, etapas: Optional[Sequence[str]] = None) -> str:
+        """Enfileira o job e devolve seu id imediatamente.
+
+        O valor devolvido pela função só é guardado (para retirar()) com
+        guardar_retorno=True; os mais antigos não retirados são descartados
+        acima de max_retornos. `etapas` substitui as etapas da fila para este
+        job (ex.: sem 'insert' quando a função não grava).
+        """
+        job = Job(self, uuid.uuid4().hex, etapas or self.etapas)
+        conn = self._conectar()
+        try:
+            conn.execute('INSERT INTO importacao_job (id, tipo, arquivo, etapas) VALUES (?, ?, ?, ?)',
+                         (job.id, tipo, arquivo, json.dumps(job.etapas)))
+            conn.commit()
+        finally:
+            conn.close()
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='importacao')
+            self.executor.submit(self._executar, job, funcao, args, guardar_retorno)
+        return job.id
+
+    def _executar(self, job: Job, funcao: Callable, args: tuple, guardar_retorno: bool) -> None:
+        self._gravar(job.id, situacao='executando', iniciado_em=_agora())
+        erro = None
+        try:
+            retorno = funcao(job, *args)
+            if guardar_retorno:
+                with self.lock:
+                    self.retornos[job.id] = retorno
+                    while len(self.retornos) > self.max_retornos:
+                        self.retornos.pop(next(iter(self.retornos)))
+        except Exception as e:
+            traceback.print_exc()
+            erro = str(e)
+        # Gravado fora do except: a exceção (e as conexões presas nos seus frames) já foi liberada
+        for estado in job.etapas.values():
+            if estado['situacao'] == 'executando':
+                estado['situacao'] = 'erro' if erro else 'concluida'
+        try:
+            self._gravar(job.id, situacao='erro' if erro else 'concluido', erro=erro,
+                         etapas=json.dumps(job.etapas), concluido_em=_agora())
+        except sqlite3.Error:
+            # Sem isto a exceção some no future do executor; obter() marca o job
+            # como 'erro' depois de DURACAO_MAXIMA
+            print(f"Erro ao gravar a conclusão do job {job.id}:")
+            traceback.print_exc()
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        """Estado do job (com etapas e resultado já decodificados), ou None."""
+        conn = self._conectar()
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM importacao_job WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['situacao'] in ('na_fila', 'executando') and _expirado(job['iniciado_em'] or job['criado_em']):
+            job.update(situacao='erro', erro=f'job sem conclusão depois de {DURACAO_MAXIMA:.0f} s', concluido_em=_agora())
+            self._gravar(job_id, situacao=job['situacao'], erro=job['erro'], concluido_em=job['concluido_em'])
+        job['etapas'] = json.loads(job['etapas'])
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else {}
+        return job
+
+    def retirar(self, job_id: str) -> Any:
+        """Valor devolvido pela função do job (se terminou neste processo), uma única vez."""
+        with self.lock:
+            return self.retornos.pop(job_id, None)
+
+    def limpar(self, retencao_dias: int = RETENCAO_DIAS) -> int:
+        """Remove jobs terminados há mais de `retencao_dias` dias."""
+        conn = self._conectar()
+        try:
+            removidos = conn.execute(
+                "DELETE FROM importacao_job WHERE concluido_em < datetime('now', ?)", (f'-{int(retencao_dias)} days',)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return removidos
+
+    def esperar(self) -> None:
+        """Aguarda os jobs em andamento (uso em testes e scripts)."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def _agora() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _expirado(momento: str) -> bool:
+    inicio = datetime.strptime(momento, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - inicio).total_seconds() > DURACAO_MAXIMA
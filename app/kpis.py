@@ -0,0 +1,119 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import List, Optional
+
+import db
+import rollup
+
+# Linhas diárias mais antigas que isto viram semanais; semanais mais antigas
+# que MESES_SEMANAL meses viram mensais. Cada período agregado guarda o último
+# valor do período (fotografia do fim da semana/mês).
+DIAS_DIARIO = 90
+MESES_SEMANAL = 24
+INTERVALO_PADRAO = 3600  # segundos entre fotografias do agendador
+
+KPIS = ('portos', 'investimento', 'progresso', 'servicos')
+
+SQL_GRAVAR = """
+INSERT OR REPLACE INTO kpi_snapshot
+    (granularidade, dimensao, chave, periodo, portos, investimento, progresso, servicos)
+VALUES ('dia', ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Agrega as linhas de {origem} anteriores a :corte em períodos de {destino}
+# (início do período dado por {inicio}) e remove as originais.
+SQL_AGREGAR = """
+INSERT OR REPLACE INTO kpi_snapshot
+    (granularidade, dimensao, chave, periodo, portos, investimento, progresso, servicos)
+SELECT '{destino}', dimensao, chave, inicio, portos, investimento, progresso, servicos FROM (
+    SELECT k.*, {inicio} AS inicio, ROW_NUMBER() OVER (
+        PARTITION BY k.dimensao, k.chave, {inicio} ORDER BY k.periodo DESC
+    ) AS rn
+    FROM kpi_snapshot k
+    WHERE k.granularidade = '{origem}' AND k.periodo < :corte
+) WHERE rn = 1
+"""
+
+SQL_TENDENCIA = """
+SELECT periodo, granularidade, portos, investimento, progresso, servicos
+FROM kpi_snapshot
+WHERE dimensao = ? AND chave = ? AND periodo BETWEEN ? AND ?
+ORDER BY periodo
+"""
+
+def fotografar(conn: sqlite3.Connection, dia: Optional[str] = None) -> int:
+    """Grava (ou regrava) a linha do dia de cada KPI por portfólio, UF e tipo.
+    Retorna o número de linhas gravadas. Não faz commit."""
+    dia = dia or date.today().isoformat()
+    linhas = [
+        (por, str(l['chave']), dia, l['portos'], l['capex_total'] or 0, l['progresso'] or 0, l['servicos'] or 0)
+        for por in rollup.DIMENSOES
+        for l in rollup.rollup(conn, por)
+    ]
+    conn.executemany(SQL_GRAVAR, linhas)
+    return len(linhas)
+
+def _inicio_semana(coluna: str) -> str:
+    return f"date({coluna}, 'weekday 0', '-6 days')"  # segunda-feira
+
+def compactar(conn: sqlite3.Connection, hoje: Optional[date] = None) -> None:
+    """Reduz a resolução do histórico: diário -> semanal -> mensal. Não faz commit."""
+    hoje = hoje or date.today()
+    # Cortes alinhados ao início da semana/mês para nunca agregar um período incompleto
+    corte_semanal = hoje - timedelta(days=DIAS_DIARIO)
+    corte_semanal -= timedelta(days=corte_semanal.weekday())
+    ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - MESES_SEMANAL, 12)
+    corte_mensal = date(ano, mes + 1, 1)
+    for origem, destino, inicio, corte in (
+        ('dia', 'semana', _inicio_semana('k.periodo'), corte_semanal),
+        ('semana', 'mes', "date(k.periodo, 'start of month')", corte_mensal),
+    ):
+        conn.execute(SQL_AGREGAR.format(origem=origem, destino=destino, inicio=inicio), {'corte': corte.isoformat()})
+        conn.execute('DELETE FROM kpi_snapshot WHERE granularidade = ? AND periodo < ?', (origem, corte.isoformat()))
+
+def tendencia(conn: sqlite3.Connection, dimensao: str = 'portfolio', chave: str = 'Portfólio',
+              de: str = '0000-01-01', ate: str = '9999-12-31') -> List[dict]:
+    """Série de KPIs de um portfólio/UF/tipo, lida só de kpi_snapshot."""
+    cursor = conn.execute(SQL_TENDENCIA, (dimensao, chave, de, ate))
+    colunas = [d[0] for d in cursor.description]
+    return [dict(zip(colunas, row)) for row in cursor.fetchall()]
+
+def executar() -> None:
+    """Uma rodada do agendador: fotografia do dia e compactação do histórico."""
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        fotografar(conn)
+        compactar(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def iniciar_agendador(intervalo: float = INTERVALO_PADRAO) -> threading.Thread:
+    """Roda executar() em segundo plano a cada `intervalo` segundos (thread daemon).
+
+    A linha do dia é regravada a cada rodada, então várias instâncias (ex.:
+    workers do gunicorn) apenas repetem o mesmo resultado.
+    """
+    parar = threading.Event()
+
+    def laco():
+        while True:
+            try:
+                executar()
+            except Exception as e:
+                print(f"Erro ao gravar fotografia de KPIs: {e}")
+            if parar.wait(intervalo):
+                return
+
+    thread = threading.Thread(target=laco, name='kpi-snapshot', daemon=True)
+    thread.parar = parar
+    thread.start()
+    return thread
+
+if __name__ == '__main__':
+    # Uso em cron: python kpis.py
+    db.init_db()
+    executar()
+    print('Fotografia de KPIs gravada.')
@@ -0,0 +1,326 @@
+from __future__ import annotations
+import atexit
+import bisect
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Métricas no formato de exposição do Prometheus (texto), sem dependências.
+#
+# Cada processo acumula contadores, medidores e histogramas em memória. Com
+# METRICAS_DIR no ambiente (ex.: os 4 workers do gunicorn), cada processo grava
+# um arquivo <pid>.json nessa pasta (no máximo a cada INTERVALO_GRAVACAO s e ao
+# sair) e /metrics soma os arquivos de todos: qualquer worker que atenda a
+# coleta responde pelo conjunto. Contadores e histogramas de workers que já
+# morreram continuam somando (não podem diminuir): a coleta os incorpora a
+# mortos.json e apaga o arquivo do morto, e um processo novo que recebe o pid
+# de um morto incorpora o arquivo antigo antes de gravar o seu. Medidores só
+# valem para os processos vivos. Apague a pasta ao (re)iniciar o serviço.
+# A incorporação usa uma trava (fcntl) na pasta; sem fcntl (Windows), os
+# arquivos dos mortos apenas continuam somando.
+
+DIRETORIO = os.environ.get('METRICAS_DIR')
+INTERVALO_GRAVACAO = 1.0
+ARQUIVO_MORTOS = 'mortos.json'
+
+FAIXAS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAIXAS_TAMANHO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+FAIXAS_COMANDOS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+# nome -> (tipo, ajuda, faixas)
+DEFINICOES = {
+    'http_requests_total': ('counter', 'Requisições HTTP atendidas.', None),
+    'http_request_duration_seconds': ('histogram', 'Duração das requisições HTTP.', FAIXAS_DURACAO),
+    'http_requests_in_flight': ('gauge', 'Requisições HTTP em andamento.', None),
+    'http_response_size_bytes': ('histogram', 'Tamanho do corpo das respostas HTTP.', FAIXAS_TAMANHO),
+    'http_request_sql_seconds': ('histogram', 'Tempo de SQL por requisição (com consultas.py instalado).',
+                                 FAIXAS_DURACAO),
+    'http_request_sql_statements': ('histogram', 'Comandos SQL por requisição (com consultas.py instalado).',
+                                    FAIXAS_COMANDOS),
+    'cache_requests_total': ('counter', 'Consultas aos caches em memória, por resultado (hit/miss).', None),
+}
+
+_valores: Dict[tuple, object] = {}
+_lock = threading.Lock()
+_ultima_gravacao = 0.0
+_INICIO = time.time()  # distingue este processo de um morto com o mesmo pid
+_arquivo_verificado = False
+
+def _chave(nome: str, rotulos: dict) -> tuple:
+    return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+def incrementar(nome: str, valor: float = 1, **rotulos) -> None:
+    """Soma `valor` a um contador ou medidor."""
+    chave = _chave(nome, rotulos)
+    with _lock:
+        _valores[chave] = _valores.get(chave, 0) + valor
+
+def observar(nome: str, valor: float, **rotulos) -> None:
+    """Registra uma observação num histograma: [contagens por faixa..., +Inf, soma]."""
+    faixas = DEFINICOES[nome][2]
+    chave = _chave(nome, rotulos)
+    with _lock:
+        h = _valores.get(chave)
+        if h is None:
+            h = _valores[chave] = [0] * (len(faixas) + 1) + [0.0]
+        h[bisect.bisect_left(faixas, valor)] += 1
+        h[-1] += valor
+
+def cache(nome: str, acerto: bool) -> None:
+    """Uma consulta ao cache `nome` (cache_requests_total e cache_hit_ratio)."""
+    incrementar('cache_requests_total', cache=nome, result='hit' if acerto else 'miss')
+
+# --- Agregação entre processos ----------------------------------------------
+
+def _escrever(arquivo: Path, dados: dict) -> None:
+    temporario = arquivo.with_name(f'.{arquivo.name}.tmp')
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, arquivo)
+
+def _ler(arquivo: Path) -> Optional[dict]:
+    try:
+        with open(arquivo, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # arquivo sendo trocado, já incorporado ou corrompido
+
+@contextlib.contextmanager
+def _trava(pasta: Path):
+    """Exclusão entre os processos que incorporam e coletam; sem fcntl, não trava (None)."""
+    if fcntl is None:
+        yield None
+        return
+    with open(pasta / '.trava', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def gravar(forcar: bool = False) -> None:
+    """Grava os valores deste processo em METRICAS_DIR/<pid>.json (troca atômica)."""
+    global _ultima_gravacao, _arquivo_verificado
+    if not DIRETORIO:
+        return
+    agora = time.monotonic()
+    if not forcar and agora - _ultima_gravacao < INTERVALO_GRAVACAO:
+        return
+    _ultima_gravacao = agora
+    with _lock:
+        valores = [[nome, list(rotulos), v] for (nome, rotulos), v in _valores.items()]
+    pasta = Path(DIRETORIO)
+    pasta.mkdir(parents=True, exist_ok=True)
+    pid = os.getpid()
+    arquivo = pasta / f'{pid}.json'
+    if not _arquivo_verificado:
+        # pid reaproveitado: o arquivo é de um morto e seria sobrescrito
+        with _trava(pasta) as trava:
+            if trava is not None and arquivo.exists():
+                _incorporar(pasta, [arquivo])
+        _arquivo_verificado = True
+    _escrever(arquivo, {'pid': pid, 'inicio': _INICIO, 'valores': valores})
+
+atexit.register(gravar, True)
+
+def _vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _morto(dados: dict) -> bool:
+    if dados['pid'] == os.getpid():
+        return dados.get('inicio') != _INICIO
+    return not _vivo(dados['pid'])
+
+def _somar(total: dict, chave: tuple, valor) -> None:
+    atual = total.get(chave)
+    if atual is None:
+        total[chave] = list(valor) if isinstance(valor, list) else valor
+    elif isinstance(valor, list):
+        total[chave] = [a + b for a, b in zip(atual, valor)]
+    else:
+        total[chave] = atual + valor
+
+def _incorporar(pasta: Path, arquivos: List[Path]) -> None:
+    """Soma contadores e histogramas dos arquivos de processos mortos em
+    mortos.json e apaga os arquivos (chamar com a trava)."""
+    mortos = pasta / ARQUIVO_MORTOS
+    total = {}
+    for nome, rotulos, valor in (_ler(mortos) or {}).get('valores', []):
+        _somar(total, (nome, tuple(map(tuple, rotulos))), valor)
+    incorporados = []
+    for arquivo in arquivos:
+        dados = _ler(arquivo)
+        if dados is None or not _morto(dados):
+            continue
+        for nome, rotulos, valor in dados['valores']:
+            if DEFINICOES.get(nome, ('gauge',))[0] != 'gauge':
+                _somar(total, (nome, tuple(map(tuple, rotulos))), valor)
+        incorporados.append(arquivo)
+    if not incorporados:
+        return
+    _escrever(mortos, {'pid': None, 'valores': [[nome, list(rotulos), v] for (nome, rotulos), v in total.items()]})
+    for arquivo in incorporados:
+        arquivo.unlink(missing_ok=True)
+
+def coletar() -> dict:
+    """Valores somados deste processo e dos outros processos em METRICAS_DIR.
+
+    Antes de somar, incorpora os arquivos de processos mortos a mortos.json;
+    incorporação e leitura ficam sob a mesma trava, para que outra coleta não
+    veja um morto em dois arquivos (ou em nenhum).
+    """
+    with _lock:
+        total = {chave: (list(v) if isinstance(v, list) else v) for chave, v in _valores.items()}
+    if not DIRETORIO or not Path(DIRETORIO).is_dir():
+        return total
+    pasta = Path(DIRETORIO)
+    proprio = os.getpid()
+    with _trava(pasta) as trava:
+        arquivos = [a for a in pasta.glob('*.json') if a.name != ARQUIVO_MORTOS]
+        if trava is not None:
+            _incorporar(pasta, [a for a in arquivos if a.stem.isdigit() and not _vivo(int(a.stem))])
+        for arquivo in [pasta / ARQUIVO_MORTOS] + arquivos:
+            dados = _ler(arquivo)
+            if dados is None or dados['pid'] == proprio:
+                continue
+            vivo = dados['pid'] is not None and _vivo(dados['pid'])
+            for nome, rotulos, valor in dados['valores']:
+                if DEFINICOES.get(nome, ('gauge',))[0] == 'gauge' and not vivo:
+                    continue
+                _somar(total, (nome, tuple(map(tuple, rotulos))), valor)
+    return total
+
+# --- Formato de exposição ---------------------------------------------------
+
+def _escapar(valor: str) -> str:
+    return valor.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _rotulos(pares) -> str:
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}' if pares else ''
+
+def _numero(valor: float) -> str:
+    if isinstance(valor, float) and math.isinf(valor):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+def exposicao(valores: dict, medidores: Optional[Dict[str, tuple]] = None) -> str:
+    """Texto no formato de exposição 0.0.4. `medidores`: medidores calculados na
+    hora da coleta, {nome: (ajuda, {rótulos(tuple de pares): valor})}."""
+    por_nome: Dict[str, list] = {}
+    for (nome, rotulos), valor in sorted(valores.items()):
+        por_nome.setdefault(nome, []).append((rotulos, valor))
+    linhas = []
+    for nome, itens in por_nome.items():
+        tipo, ajuda, faixas = DEFINICOES.get(nome, ('untyped', '', None))
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+        for rotulos, valor in itens:
+            if tipo != 'histogram':
+                linhas.append(f'{nome}{_rotulos(rotulos)} {_numero(valor)}')
+                continue
+            acumulado = 0
+            for limite, n in zip(list(faixas) + [math.inf], valor[:-1]):
+                acumulado += n
+                le = '+Inf' if math.isinf(limite) else _numero(float(limite))
+                linhas.append(f'{nome}_bucket{_rotulos(rotulos + (("le", le),))} {acumulado}')
+            linhas.append(f'{nome}_sum{_rotulos(rotulos)} {_numero(float(valor[-1]))}')
+            linhas.append(f'{nome}_count{_rotulos(rotulos)} {acumulado}')
+    for nome, (ajuda, itens) in (medidores or {}).items():
+        linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} gauge']
+        linhas += [f'{nome}{_rotulos(r)} {_numero(v)}' for r, v in sorted(itens.items())]
+    return '\n'.join(linhas) + '\n'
+
+def _taxa_acerto(valores: dict) -> dict:
+    por_cache: Dict[str, list] = {}
+    for (nome, rotulos), valor in valores.items():
+        if nome == 'cache_requests_total':
+            r = dict(rotulos)
+            contas = por_cache.setdefault(r['cache'], [0, 0])
+            contas[0 if r['result'] == 'hit' else 1] += valor
+    return {(('cache', c),): round(a / (a + f), 6) for c, (a, f) in por_cache.items() if a + f}
+
+def _tamanho_banco(caminho) -> int:
+    """Arquivo principal + WAL, se houver."""
+    total = 0
+    for sufixo in ('', '-wal'):
+        try:
+            total += os.path.getsize(f'{caminho}{sufixo}')
+        except OSError:
+            pass
+    return total
+
+# --- Flask ------------------------------------------------------------------
+
+def registrar_flask(app, nome: Optional[str] = None, bancos: Optional[Callable[[], dict]] = None) -> None:
+    """Mede cada requisição de `app` e expõe GET /metrics.
+
+    Por rota (a regra do Flask, não o caminho: cardinalidade limitada): contagem
+    por status, duração, tamanho da resposta e, se consultas.py estiver
+    instalado, tempo e comandos de SQL; mais as requisições em andamento.
+    `bancos` devolve {nome: caminho} dos bancos SQLite cujo tamanho é publicado.
+    """
+    from flask import Response, g, request
+    import consultas
+    nome = nome or app.name
+
+    @app.before_request
+    def _iniciar_metricas():
+        g._metricas_inicio = time.perf_counter()
+        incrementar('http_requests_in_flight', 1, app=nome)
+        if consultas.instalado():
+            g._metricas_medicao = consultas.medir()
+            g._metricas_sql = g._metricas_medicao.__enter__()
+
+    @app.after_request
+    def _registrar_metricas(response):
+        inicio = g.get('_metricas_inicio')
+        if inicio is None:
+            return response
+        rota = request.url_rule.rule if request.url_rule else '<sem rota>'
+        rotulos = {'app': nome, 'method': request.method, 'route': rota}
+        incrementar('http_requests_total', 1, status=response.status_code, **rotulos)
+        observar('http_request_duration_seconds', time.perf_counter() - inicio, **rotulos)
+        if not response.is_streamed:
+            observar('http_response_size_bytes', response.calculate_content_length() or 0, **rotulos)
+        sql = g.get('_metricas_sql')
+        if sql is not None:
+            observar('http_request_sql_seconds', sql.tempo_s, **rotulos)
+            observar('http_request_sql_statements', sql.comandos, **rotulos)
+        return response
+
+    @app.teardown_request
+    def _encerrar_metricas(_erro=None):
+        if g.pop('_metricas_inicio', None) is None:
+            return
+        medicao = g.pop('_metricas_medicao', None)
+        if medicao is not None:
+            medicao.__exit__(None, None, None)
+        incrementar('http_requests_in_flight', -1, app=nome)
+        gravar()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        gravar(forcar=True)
+        valores = coletar()
+        medidores = {'cache_hit_ratio': ('Acertos / consultas de cada cache, somando os processos.',
+                                         _taxa_acerto(valores))}
+        if bancos is not None:
+            medidores['sqlite_database_size_bytes'] = (
+                'Tamanho do banco SQLite (arquivo principal + WAL).',
+                {(('app', nome), ('database', b)): _tamanho_banco(c) for b, c in bancos().items()})
+        return Response(exposicao(valores, medidores), mimetype='text/plain; version=0.0.4; charset=utf-8')
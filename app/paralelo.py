@@ -0,0 +1,67 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Callable, List, Optional, Sequence
+
+import pandas as pd
+
+# Pool de processos da importação: planilhas lidas em paralelo e conversão/validação
+# em blocos de linhas. Os resultados voltam sempre na ordem original.
+
+PROCESSOS = int(os.environ.get('IMPORT_PROCESSES', os.cpu_count() or 1))
+LINHAS_POR_BLOCO = 5000
+# Abaixo destes tamanhos, iniciar/alimentar os processos custa mais do que ganha
+MIN_LINHAS = 10_000
+MIN_BYTES = 2_000_000
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+def executor() -> Optional[ProcessPoolExecutor]:
+    """Pool compartilhado, criado no primeiro uso (None com PROCESSOS <= 1).
+
+    Usa forkserver quando disponível: a importação roda em threads (jobs.Fila)
+    e fork de um processo com threads pode herdar locks presos.
+    """
+    global _executor
+    if PROCESSOS <= 1:
+        return None
+    with _lock:
+        if _executor is None:
+            metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _executor = ProcessPoolExecutor(max_workers=PROCESSOS, mp_context=multiprocessing.get_context(metodo))
+        return _executor
+
+def encerrar() -> None:
+    """Encerra o pool (testes e scripts); o próximo uso cria outro."""
+    global _executor
+    with _lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+def mapear(funcao: Callable, itens: Sequence, *args: Any) -> List:
+    """[funcao(item, *args) for item in itens], nos processos do pool.
+
+    `funcao` precisa ser de nível de módulo (pickle). Com um único item ou sem
+    pool, roda no próprio processo.
+    """
+    pool = executor() if len(itens) > 1 else None
+    if pool is None:
+        return [funcao(item, *args) for item in itens]
+    return list(pool.map(funcao, itens, *(repeat(a) for a in args)))
+
+def blocos(df: pd.DataFrame, tamanho: Optional[int] = None) -> List[pd.DataFrame]:
+    """Fatias consecutivas de `tamanho` linhas (padrão LINHAS_POR_BLOCO; o índice original é mantido)."""
+    tamanho = tamanho or LINHAS_POR_BLOCO
+    return [df.iloc[i:i + tamanho] for i in range(0, len(df), tamanho)] or [df]
+
+def mapear_blocos(funcao: Callable, df: pd.DataFrame, *args: Any) -> List:
+    """funcao(bloco, *args) para cada bloco de linhas de df, na ordem das linhas.
+    Frames com menos de MIN_LINHAS linhas vão inteiros, sem o pool."""
+    if len(df) < MIN_LINHAS:
+        return [funcao(df, *args)]
+    return mapear(funcao, blocos(df), *args)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+
+# Perfil de uma requisição sob demanda, sem novo deploy.
+#
+# Com DEBUG_TOKEN no ambiente (o mesmo de /debug/sql), registrar() envolve a
+# aplicação WSGI: uma requisição com ?__profile=<modo> (ou cabeçalho X-Profile)
+# e o token no cabeçalho X-Debug-Token (nunca na URL, que vai para logs) roda
+# sob cProfile e, ao mesmo tempo, sob um amostrador de pilhas da própria thread. Modos:
+#   1       resposta normal; perfil gravado em PERFIL_DIR (cabeçalho X-Profile-Id)
+#   resumo  devolve as TOP_N funções por tempo acumulado (texto do pstats)
+#   pilhas  devolve as pilhas amostradas no formato "collapsed" (flamegraph.pl,
+#           speedscope), uma linha "a;b;c contagem" por pilha
+# Sem DEBUG_TOKEN no início do processo nada é instalado: custo zero. O cProfile
+# não guarda pilhas completas, por isso o arquivo collapsed vem do amostrador.
+
+DIRETORIO = Path(os.environ.get('PERFIL_DIR', Path(tempfile.gettempdir()) / 'perfis'))
+MAX_ARQUIVOS = 100  # perfis guardados (os mais antigos são apagados)
+TOP_N = 30
+INTERVALO_AMOSTRA = 0.001
+MODOS = ('1', 'resumo', 'pilhas')
+
+_PARAMETROS = ('__profile', '__profile_top')
+
+class Amostrador(threading.Thread):
+    """Amostra a pilha da thread `alvo` a cada INTERVALO_AMOSTRA segundos."""
+
+    def __init__(self, alvo: int, intervalo: float = INTERVALO_AMOSTRA):
+        super().__init__(daemon=True, name='perfilador')
+        self.alvo = alvo
+        self.intervalo = intervalo
+        self.pilhas: Counter = Counter()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.alvo)
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f'{Path(codigo.co_filename).stem}:{codigo.co_name}')
+                quadro = quadro.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def parar(self) -> Counter:
+        self._parar.set()
+        self.join()
+        return self.pilhas
+
+def collapsed(pilhas: Counter) -> str:
+    return ''.join(f'{pilha} {n}\n' for pilha, n in sorted(pilhas.items()))
+
+def resumo(perfil: cProfile.Profile, top: int = TOP_N) -> str:
+    saida = io.StringIO()
+    pstats.Stats(perfil, stream=saida).strip_dirs().sort_stats('cumulative').print_stats(top)
+    return saida.getvalue()
+
+def _guardar(nome: str, texto_resumo: str, pilhas: str) -> str:
+    """Grava <id>.txt e <id>.folded em DIRETORIO e devolve o id."""
+    DIRETORIO.mkdir(parents=True, exist_ok=True)
+    perfil_id = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{nome}'
+    (DIRETORIO / f'{perfil_id}.txt').write_text(texto_resumo, encoding='utf-8')
+    (DIRETORIO / f'{perfil_id}.folded').write_text(pilhas, encoding='utf-8')
+    antigos = sorted(DIRETORIO.glob('*.txt'))[:-MAX_ARQUIVOS]
+    for arquivo in antigos:
+        arquivo.unlink(missing_ok=True)
+        arquivo.with_suffix('.folded').unlink(missing_ok=True)
+    return perfil_id
+
+class Perfilador:
+    """Middleware WSGI; só entra no caminho das requisições com ?__profile / X-Profile."""
+
+    def __init__(self, wsgi_app, nome: str, token: str):
+        self.wsgi_app = wsgi_app
+        self.nome = nome
+        self.token = token.encode()
+
+    def __call__(self, environ, start_response):
+        if '__profile' not in environ.get('QUERY_STRING', '') and 'HTTP_X_PROFILE' not in environ:
+            return self.wsgi_app(environ, start_response)
+
+        parametros = parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)
+        args = dict(parametros)
+        modo = args.get('__profile') or environ.get('HTTP_X_PROFILE')
+        informado = environ.get('HTTP_X_DEBUG_TOKEN', '')
+        if not hmac.compare_digest(informado.encode(), self.token):
+            return _json(start_response, '403 FORBIDDEN', {'error': 'token inválido'})
+        if modo not in MODOS:
+            return _json(start_response, '400 BAD REQUEST', {'error': f'__profile deve ser um de {", ".join(MODOS)}'})
+        try:
+            top = int(args.get('__profile_top', TOP_N))
+        except ValueError:
+            return _json(start_response, '400 BAD REQUEST', {'error': '__profile_top deve ser inteiro'})
+        environ = {**environ, 'QUERY_STRING': urlencode([(k, v) for k, v in parametros if k not in _PARAMETROS])}
+
+        resposta, corpo = {}, []
+
+        def capturar(status, headers, exc_info=None):
+            resposta.update(status=status, headers=headers)
+            return corpo.append
+
+        perfil = cProfile.Profile()
+        amostrador = Amostrador(threading.get_ident())
+        amostrador.start()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            iteravel = self.wsgi_app(environ, capturar)
+            try:
+                corpo.extend(iteravel)  # respostas em streaming rodam até o fim
+            finally:
+                if hasattr(iteravel, 'close'):
+                    iteravel.close()
+        finally:
+            perfil.disable()
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            pilhas = amostrador.parar()
+
+        rota = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'raiz'
+        cabecalho = (f"# {self.nome} {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
+                     f"{resposta.get('status')} {duracao_ms:.1f} ms, {sum(pilhas.values())} amostras\n")
+        texto_resumo = cabecalho + resumo(perfil, top)
+        texto_pilhas = collapsed(pilhas)
+        if modo == 'resumo':
+            return _texto(start_response, texto_resumo)
+        if modo == 'pilhas':
+            return _texto(start_response, texto_pilhas)
+
+        perfil_id = _guardar(f'{self.nome}-{rota}', texto_resumo, texto_pilhas)
+        start_response(resposta['status'], list(resposta['headers']) + [
+            ('X-Profile-Id', perfil_id), ('X-Profile-Wall-Ms', f'{duracao_ms:.1f}')])
+        return corpo
+
+def _json(start_response, status: str, dados: dict):
+    corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(corpo)))])
+    return [corpo]
+
+def _texto(start_response, texto: str):
+    corpo = texto.encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', str(len(corpo)))])
+    return [corpo]
+
+def registrar(app, nome: Optional[str] = None) -> None:
+    """Liga o perfil sob demanda em `app` (Flask) se DEBUG_TOKEN estiver definido."""
+    token = os.environ.get('DEBUG_TOKEN')
+    if not token:
+        return
+    app.wsgi_app = Perfilador(app.wsgi_app, nome or app.name, token)
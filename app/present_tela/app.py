@@ -8,15 +8,41 @@ from flask import Flask, jsonify, request, send_from_directory, redirect, url_fo
 from flask_cors import CORS
 import sqlite3
 import json
+import hashlib
 from datetime import datetime
 from pathlib import Path
 import pandas as pd
 import os
+import sys
 from werkzeug.utils import secure_filename
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # módulos compartilhados (jobs.py, paralelo.py, consultas.py...)
+import consultas
+import metricas
+import perfilador
+import jobs
+import paralelo
+import trechos
+
 app = Flask(__name__)
 CORS(app)  # Permite requisições do frontend
 
+# Comandos SQL e tempo de cada requisição no log (JSON), com aviso de N+1
+if os.environ.get('SQL_CONTADOR'):
+    consultas.registrar_flask(app, 'present_tela')
+
+# Relatório do perfil de consultas (SQL_PERFIL=1) em /debug/sql, protegido por DEBUG_TOKEN
+consultas.registrar_debug(app)
+
+# Métricas Prometheus em /metrics, somadas entre os workers com METRICAS_DIR;
+# METRICAS_SQL=1 inclui tempo e comandos de SQL por requisição
+if os.environ.get('METRICAS_SQL'):
+    consultas.instalar()
+metricas.registrar_flask(app, 'present_tela', bancos=lambda: {'portos': DATABASE})
+
+# Perfil de uma requisição sob demanda (?__profile=1|resumo|pilhas), só com DEBUG_TOKEN
+perfilador.registrar(app, 'present_tela')
+
 # Configurações
 DATABASE = 'portos.db'
 JSON_FILE = 'planilha_portos.json'
@@ -28,6 +54,9 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Criar pasta de uploads se não existir
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Importações rodam em segundo plano; o estado dos jobs fica no próprio banco
+fila_importacao = jobs.Fila(lambda: DATABASE, etapas=('parse', 'insert'))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -116,6 +145,40 @@ def init_db():
         )
     ''')
     
+    # Último acompanhamento por serviço (projeto + tipo/fase/serviço)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_acomp_projeto_servico
+        ON acompanhamento(projeto_id, tipo_servico, fase, servico, data_atualizacao DESC)
+    ''')
+    
+    # Revisão dos dados: qualquer gravação nas três tabelas a incrementa
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revisao_dados (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            valor INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO revisao_dados (id, valor) VALUES (1, 0)')
+    for tabela in ('projetos', 'servicos', 'acompanhamento'):
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS tr_revisao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE revisao_dados SET valor = valor + 1 WHERE id = 1;
+                END
+            ''')
+    
+    # Arquivos já importados (sha256 do conteúdo -> revisão logo após a importação)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS importacao_arquivo (
+            hash TEXT PRIMARY KEY,
+            revisao INTEGER NOT NULL,
+            job_id TEXT,
+            importado_em TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -125,6 +188,46 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+# Estado atual de cada serviço: só o acompanhamento mais recente conta
+SQL_ACOMPANHAMENTO_ATUAL = '''
+    SELECT projeto_id, fase, percentual_executada, data_atualizacao, id FROM (
+        SELECT a.*, ROW_NUMBER() OVER (
+            PARTITION BY a.projeto_id, a.tipo_servico, a.fase, a.servico
+            ORDER BY a.data_atualizacao DESC, a.id DESC
+        ) AS rn
+        FROM acompanhamento a
+        {where}
+    ) WHERE rn = 1
+'''
+
+def estado_atual_projetos(conn, projeto_id=None):
+    """Progresso e etapa de cada projeto a partir do último acompanhamento de cada serviço.
+    
+    Retorna {projeto_id: {'progresso': ..., 'etapa': ...}}; projetos sem
+    acompanhamento não aparecem.
+    """
+    if projeto_id is None:
+        rows = conn.execute(SQL_ACOMPANHAMENTO_ATUAL.format(where='')).fetchall()
+    else:
+        rows = conn.execute(SQL_ACOMPANHAMENTO_ATUAL.format(where='WHERE a.projeto_id = ?'), (projeto_id,)).fetchall()
+    
+    atuais = {}
+    for row in rows:
+        atuais.setdefault(row['projeto_id'], []).append(row)
+    
+    estado = {}
+    for pid, servicos in atuais.items():
+        progresso = max(a['percentual_executada'] or 0 for a in servicos)
+        mais_recente = max(servicos, key=lambda a: (a['data_atualizacao'] or '', a['id']))
+        if mais_recente['fase']:
+            etapa = mais_recente['fase']
+        elif progresso > 0:
+            etapa = 'Em execução'
+        else:
+            etapa = 'Em andamento'
+        estado[pid] = {'progresso': progresso, 'etapa': etapa}
+    return estado
+
 # --- Importação de Dados ----------------------------------------------------
 
 def import_from_json():
@@ -266,36 +369,26 @@ def get_projects():
         
         # Busca projetos
         projetos = conn.execute('SELECT * FROM projetos ORDER BY local, obj_concessao').fetchall()
+        estado = estado_atual_projetos(conn)
+        
+        # Serviços e acompanhamentos de todos os projetos em uma consulta cada
+        # (e não duas por projeto), agrupados por projeto na ordem do id
+        servicos_por_projeto, acompanhamentos_por_projeto = {}, {}
+        for linha in conn.execute('SELECT * FROM servicos ORDER BY id'):
+            servicos_por_projeto.setdefault(linha['projeto_id'], []).append(dict(linha))
+        for linha in conn.execute('SELECT * FROM acompanhamento ORDER BY id'):
+            acompanhamentos_por_projeto.setdefault(linha['projeto_id'], []).append(dict(linha))
         
         result = []
         
         for projeto in projetos:
             projeto_dict = dict(projeto)
+            servicos_dict = servicos_por_projeto.get(projeto_dict['id'], [])
+            acompanhamentos_dict = acompanhamentos_por_projeto.get(projeto_dict['id'], [])
             
-            # Busca serviços do projeto
-            servicos = conn.execute('SELECT * FROM servicos WHERE projeto_id = ?', (projeto_dict['id'],)).fetchall()
-            servicos_dict = [dict(s) for s in servicos] if servicos else []
-            
-            # Busca acompanhamentos do projeto
-            acompanhamentos = conn.execute('SELECT * FROM acompanhamento WHERE projeto_id = ?', (projeto_dict['id'],)).fetchall()
-            acompanhamentos_dict = [dict(a) for a in acompanhamentos] if acompanhamentos else []
-            
-            # Calcula progresso baseado nos acompanhamentos
-            progresso = 0
-            if acompanhamentos_dict:
-                progresso = max([a.get('percentual_executada', 0) or 0 for a in acompanhamentos_dict])
-            
-            # Determina etapa baseada nos acompanhamentos
-            etapa = 'Planejamento'
-            if acompanhamentos_dict:
-                # Pega o acompanhamento mais recente
-                mais_recente = max(acompanhamentos_dict, key=lambda x: x.get('data_atualizacao', ''))
-                if mais_recente.get('fase'):
-                    etapa = mais_recente['fase']
-                elif progresso > 0:
-                    etapa = 'Em execução'
-                else:
-                    etapa = 'Em andamento'
+            # Progresso e etapa pelo último acompanhamento de cada serviço
+            atual = estado.get(projeto_dict['id'], {'progresso': 0, 'etapa': 'Planejamento'})
+            progresso, etapa = atual['progresso'], atual['etapa']
             
             # Coordenadas
             latitude = projeto_dict.get('latitude')
@@ -445,22 +538,9 @@ def get_project(projeto_id):
     acompanhamentos_dict = [dict(a) for a in acompanhamentos] if acompanhamentos else []
     servicos_dict = [dict(s) for s in servicos] if servicos else []
     
-    # Calcula progresso baseado nos acompanhamentos
-    progresso = 0
-    if acompanhamentos_dict:
-        progresso = max([a.get('percentual_executada', 0) or 0 for a in acompanhamentos_dict])
-    
-    # Determina etapa baseada nos acompanhamentos
-    etapa = 'Planejamento'
-    if acompanhamentos_dict:
-        # Pega o acompanhamento mais recente
-        mais_recente = max(acompanhamentos_dict, key=lambda x: x.get('data_atualizacao', ''))
-        if mais_recente.get('fase'):
-            etapa = mais_recente['fase']
-        elif progresso > 0:
-            etapa = 'Em execução'
-        else:
-            etapa = 'Em andamento'
+    # Progresso e etapa pelo último acompanhamento de cada serviço
+    atual = estado_atual_projetos(conn, projeto_id).get(projeto_id, {'progresso': 0, 'etapa': 'Planejamento'})
+    progresso, etapa = atual['progresso'], atual['etapa']
     
     # Prepara coordenadas
     latitude = projeto_dict['latitude']
@@ -697,7 +777,7 @@ def create_acompanhamento():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Faz upload de planilha Excel ou JSON e importa para o banco"""
+    """Faz upload de planilha Excel ou JSON e enfileira a importação (202 + id do job)"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'Nenhum arquivo enviado'}), 400
@@ -708,58 +788,128 @@ def upload_file():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Processa o arquivo
-            if filename.endswith('.json'):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                success = import_json_data(data)
-            elif filename.endswith(('.xlsx', '.xls')):
-                data = process_excel_file(filepath)
-                success = import_json_data(data)
             
-            if success:
+            # Mesmo conteúdo já importado e dados inalterados desde então: nada a fazer
+            conteudo = file.read()
+            hash_arquivo = hashlib.sha256(conteudo).hexdigest()
+            conn = get_db_connection()
+            anterior = conn.execute('''
+                SELECT a.revisao, a.job_id, a.importado_em FROM importacao_arquivo a
+                JOIN revisao_dados r ON r.id = 1 AND r.valor = a.revisao
+                WHERE a.hash = ?
+            ''', (hash_arquivo,)).fetchone()
+            conn.close()
+            if anterior is not None:
                 return jsonify({
-                    'message': f'Arquivo {filename} importado com sucesso!',
+                    'message': f'Arquivo {filename} já importado (revisão {anterior["revisao"]})',
                     'filename': filename,
-                    'records': len(data.get('Tabela 00 - Cadastro', []))
+                    'skipped': True,
+                    'jobId': anterior['job_id'],
+                    'statusUrl': f'/api/jobs/{anterior["job_id"]}'
                 })
-            else:
-                return jsonify({'error': 'Erro ao processar arquivo'}), 500
+            
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with open(filepath, 'wb') as f:
+                f.write(conteudo)
+            
+            job_id = fila_importacao.submeter('upload', importar_arquivo, filepath, hash_arquivo, arquivo=filename)
+            return jsonify({
+                'message': f'Arquivo {filename} recebido; importação em andamento',
+                'filename': filename,
+                'jobId': job_id,
+                'statusUrl': f'/api/jobs/{job_id}'
+            }), 202
         else:
             return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def importar_arquivo(job, filepath, hash_arquivo=None):
+    """Job de importação: parse (Excel/JSON) -> insert, com tempo, CPU e memória
+    de cada etapa em resultado['trechos']"""
+    with trechos.medir('upload', job=job.id) as medicao:
+        try:
+            _importar_arquivo(job, filepath, hash_arquivo)
+        finally:
+            job.registrar(trechos=medicao.registros)
+
+def _importar_arquivo(job, filepath, hash_arquivo):
+    job.etapa('parse')
+    with trechos.trecho('parse') as t:
+        if filepath.endswith('.json'):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = process_excel_file(filepath)
+        t['linhas'] = sum(len(v) for v in data.values() if isinstance(v, list))
+    job.registrar(records=len(data.get('Tabela 00 - Cadastro', [])))
+    
+    job.etapa('insert')
+    with trechos.trecho('insert', linhas=len(data.get('Tabela 00 - Cadastro', []))):
+        if not import_json_data(data):
+            raise RuntimeError('Erro ao processar arquivo')
+    if hash_arquivo:
+        conn = get_db_connection()
+        conn.execute('''
+            INSERT OR REPLACE INTO importacao_arquivo (hash, revisao, job_id)
+            SELECT ?, valor, ? FROM revisao_dados WHERE id = 1
+        ''', (hash_arquivo, job.id))
+        conn.commit()
+        conn.close()
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Estado de um job de importação (situação e progresso por etapa)"""
+    try:
+        job = fila_importacao.obter(job_id)
+        if job is None:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        resultado = dict(job['resultado'])
+        trechos_job = resultado.pop('trechos', [])
+        return jsonify({
+            'id': job['id'],
+            'filename': job['arquivo'],
+            'status': job['situacao'],
+            'stage': job['etapa'],
+            'stages': job['etapas'],
+            'error': job['erro'],
+            'result': resultado,
+            'timings': trechos.para_api(trechos_job),
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _ler_aba(sheet_name, filepath):
+    """Lê uma aba da planilha e normaliza os headers (roda nos processos de paralelo)"""
+    df = pd.read_excel(filepath, sheet_name=sheet_name, engine='openpyxl')
+    df = df.dropna(axis=0, how='all').dropna(axis=1, how='all')
+    
+    # Normaliza headers se começar com ##
+    if not df.empty and isinstance(df.iat[0,0], str) and df.iat[0,0].strip().startswith('##'):
+        headers = df.iloc[1].astype(str).str.strip().tolist()
+        df = df.iloc[2:].copy()
+        df.columns = headers
+    
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.to_dict('records')
+
 def process_excel_file(filepath):
-    """Processa arquivo Excel e converte para formato JSON"""
+    """Processa arquivo Excel e converte para formato JSON (abas em paralelo nos arquivos grandes)"""
     try:
         xls = pd.ExcelFile(filepath, engine='openpyxl')
-        data = {}
-        
-        for sheet_name in xls.sheet_names:
-            df = pd.read_excel(filepath, sheet_name=sheet_name, engine='openpyxl')
-            df = df.dropna(axis=0, how='all').dropna(axis=1, how='all')
-            
-            # Normaliza headers se começar com ##
-            if not df.empty and isinstance(df.iat[0,0], str) and df.iat[0,0].strip().startswith('##'):
-                headers = df.iloc[1].astype(str).str.strip().tolist()
-                df = df.iloc[2:].copy()
-                df.columns = headers
-            
-            df.columns = [str(c).strip() for c in df.columns]
-            data[sheet_name] = df.to_dict('records')
-        
-        return data
+        if os.path.getsize(filepath) >= paralelo.MIN_BYTES:
+            abas = paralelo.mapear(_ler_aba, xls.sheet_names, filepath)
+        else:
+            abas = [_ler_aba(sheet_name, xls) for sheet_name in xls.sheet_names]
+        return dict(zip(xls.sheet_names, abas))
     except Exception as e:
         print(f"Erro ao processar Excel: {e}")
         return {}
 
 def import_json_data(data):
     """Importa dados no formato JSON para o banco"""
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -803,6 +953,8 @@ def import_json_data(data):
         return True
     except Exception as e:
         print(f"Erro na importação: {e}")
+        if conn is not None:
+            conn.close()  # libera o banco (a importação roda numa thread da fila)
         return False
 
 @app.route('/api/projects/<int:projeto_id>', methods=['DELETE'])
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import sqlite3
+from datetime import date
+from typing import Dict, List, Optional
+
+# Progresso de cada porto ponderado pelo % de CAPEX de seus serviços:
+#   Σ(perc_capex × último perc_executada) / Σ(perc_capex)
+# Quando a planilha não informa nenhum peso, vale a média simples dos serviços.
+# Serviços sem acompanhamento contam como 0%.
+_PROGRESSO = """
+    CASE WHEN SUM(s.perc_capex) > 0
+         THEN SUM(s.perc_capex * COALESCE(a.perc_executada, 0)) / SUM(s.perc_capex)
+         ELSE COALESCE(AVG(COALESCE(a.perc_executada, 0)), 0)
+    END"""
+
+# Último acompanhamento de cada serviço (a mesma regra de vw_acompanhamento_atual),
+# escrito em linha: com LEFT JOIN a view seria materializada para todos os
+# serviços do banco. {ate} limita a data para consultas "como estava em".
+_ULTIMO_ACOMPANHAMENTO = """
+LEFT JOIN acompanhamento a ON a.id = (
+    SELECT a2.id FROM acompanhamento a2
+    WHERE a2.servico_id = s.id {ate}
+    ORDER BY a2.data_atualizacao DESC, a2.id DESC
+    LIMIT 1
+)"""
+
+# Só os portos pendentes (marcados pelos gatilhos de db.init_db) são recalculados.
+SQL_RECALCULAR_PENDENTES = f"""
+INSERT OR REPLACE INTO progresso_porto (cadastro_id, progresso, peso_total, servicos, servicos_com_peso, atualizado_em)
+SELECT
+    c.id,{_PROGRESSO},
+    COALESCE(SUM(s.perc_capex), 0),
+    COUNT(s.id),
+    COUNT(s.perc_capex),
+    CURRENT_TIMESTAMP
+FROM cadastro c
+LEFT JOIN servico s ON s.cadastro_id = c.id
+{_ULTIMO_ACOMPANHAMENTO.format(ate='')}
+WHERE c.id IN (SELECT cadastro_id FROM progresso_porto_pendente)
+GROUP BY c.id
+"""
+
+# Progresso de cada porto em uma data (:data, inclusive), em uma única consulta:
+# para cada serviço, o último acompanhamento até a data pelo índice
+# ix_acomp_servico_atual. Portos sem serviços não aparecem (progresso 0).
+SQL_PROGRESSO_EM = f"""
+SELECT s.cadastro_id,{_PROGRESSO} AS progresso, COUNT(s.id) AS servicos
+FROM servico s
+{_ULTIMO_ACOMPANHAMENTO.format(ate='AND a2.data_atualizacao <= :data')}
+GROUP BY s.cadastro_id
+"""
+
+# Fotografias mensais (progresso no último dia de cada mês) dos portos pendentes,
+# do mês do primeiro acompanhamento do porto até o mês atual (ou o da última
+# atualização, se posterior). Servem os gráficos de tendência sem reprocessar
+# o histórico a cada ponto.
+SQL_RECALCULAR_MENSAL_PENDENTES = f"""
+WITH RECURSIVE meses(cadastro_id, mes, fim) AS (
+    SELECT a.cadastro_id,
+           date(MIN(a.data_atualizacao), 'start of month'),
+           MAX(date(MAX(a.data_atualizacao), 'start of month'), date('now', 'start of month'))
+    FROM acompanhamento a
+    WHERE a.cadastro_id IN (SELECT cadastro_id FROM progresso_porto_pendente)
+      AND a.data_atualizacao IS NOT NULL
+    GROUP BY a.cadastro_id
+    UNION ALL
+    SELECT cadastro_id, date(mes, '+1 month'), fim FROM meses WHERE mes < fim
+)
+INSERT INTO progresso_mensal (cadastro_id, mes, progresso)
+SELECT m.cadastro_id, strftime('%Y-%m', m.mes),{_PROGRESSO}
+FROM meses m
+JOIN servico s ON s.cadastro_id = m.cadastro_id
+{_ULTIMO_ACOMPANHAMENTO.format(ate="AND a2.data_atualizacao < date(m.mes, '+1 month')")}
+GROUP BY m.cadastro_id, m.mes
+"""
+
+# Agregação ponderada pelo CAPEX total de cada porto (média simples se nenhum
+# porto do grupo tiver CAPEX informado). {fonte} é a tabela progresso_porto ou,
+# para uma data passada, a consulta SQL_PROGRESSO_EM.
+SQL_ROLLUP = """
+SELECT
+    {chave} AS chave,
+    COUNT(*) AS portos,
+    CASE WHEN SUM(c.capex_total) > 0
+         THEN SUM(c.capex_total * COALESCE(p.progresso, 0)) / SUM(c.capex_total)
+         ELSE AVG(COALESCE(p.progresso, 0))
+    END AS progresso,
+    AVG(COALESCE(p.progresso, 0)) AS progresso_simples,
+    SUM(c.capex_total) AS capex_total,
+    SUM(COALESCE(p.servicos, 0)) AS servicos
+FROM cadastro c
+LEFT JOIN {fonte} p ON p.cadastro_id = c.id
+{join}
+GROUP BY 1
+ORDER BY 1
+"""
+
+# Série mensal: para cada mês, a fotografia mais recente de cada porto até ele
+# (uma busca na chave primária de progresso_mensal por porto e mês).
+SQL_SERIE_MENSAL = """
+WITH RECURSIVE meses(mes) AS (
+    SELECT :de
+    UNION ALL
+    SELECT strftime('%Y-%m', date(mes || '-01', '+1 month')) FROM meses WHERE mes < :ate
+)
+SELECT
+    m.mes,
+    CASE WHEN SUM(c.capex_total) > 0
+         THEN SUM(c.capex_total * COALESCE(p.progresso, 0)) / SUM(c.capex_total)
+         ELSE AVG(COALESCE(p.progresso, 0))
+    END AS progresso
+FROM meses m
+CROSS JOIN cadastro c
+LEFT JOIN progresso_mensal p ON p.cadastro_id = c.id AND p.mes = (
+    SELECT MAX(p2.mes) FROM progresso_mensal p2
+    WHERE p2.cadastro_id = c.id AND p2.mes <= m.mes
+)
+WHERE {where}
+GROUP BY m.mes
+ORDER BY m.mes
+"""
+
+# Um porto com mais de uma UF entra no total de cada uma delas;
+# por isso as linhas por UF não devem ser somadas para obter o portfólio.
+DIMENSOES = {
+    'portfolio': ("'Portfólio'", ''),
+    'uf': ('cu.uf_sigla', 'JOIN cadastro_uf cu ON cu.cadastro_id = c.id'),
+    'tipo': ("COALESCE(c.tipo, 'Não informado')", ''),
+}
+
+def parse_data(texto: str) -> str:
+    """'AAAA-MM-DD' -> a mesma data normalizada. Levanta ValueError se inválida."""
+    return date.fromisoformat(texto).isoformat()
+
+def parse_mes(texto: str) -> str:
+    """'AAAA-MM' -> a mesma string. Levanta ValueError se inválido."""
+    return date.fromisoformat(f'{texto}-01').strftime('%Y-%m')
+
+def marcar_todos(conn: sqlite3.Connection) -> None:
+    """Marca todos os portos para recálculo."""
+    conn.execute('INSERT OR IGNORE INTO progresso_porto_pendente (cadastro_id) SELECT id FROM cadastro')
+
+def recalcular(conn: sqlite3.Connection) -> int:
+    """Recalcula o progresso atual e as fotografias mensais dos portos pendentes.
+    Retorna quantos portos foram recalculados.
+
+    Não faz commit: roda dentro da transação de quem alterou os dados.
+    """
+    pendentes = conn.execute('SELECT COUNT(*) FROM progresso_porto_pendente').fetchone()[0]
+    if pendentes:
+        conn.execute(SQL_RECALCULAR_PENDENTES)
+        conn.execute('DELETE FROM progresso_mensal WHERE cadastro_id IN (SELECT cadastro_id FROM progresso_porto_pendente)')
+        conn.execute(SQL_RECALCULAR_MENSAL_PENDENTES)
+        conn.execute('DELETE FROM progresso_porto_pendente')
+    return pendentes
+
+def progresso_em(conn: sqlite3.Connection, data: str) -> Dict[int, float]:
+    """{cadastro_id: progresso (0 a 1)} como estava na data 'AAAA-MM-DD'."""
+    return {cadastro_id: progresso
+            for cadastro_id, progresso, _ in conn.execute(SQL_PROGRESSO_EM, {'data': data})}
+
+def rollup(conn: sqlite3.Connection, por: str = 'portfolio', as_of: Optional[str] = None) -> List[dict]:
+    """Progresso ponderado por CAPEX agrupado por 'portfolio', 'uf' ou 'tipo'.
+
+    Com as_of ('AAAA-MM-DD'), considera só os acompanhamentos até essa data.
+    """
+    if por not in DIMENSOES:
+        raise ValueError(f'agrupamento inválido: {por} (use {", ".join(DIMENSOES)})')
+    chave, join = DIMENSOES[por]
+    fonte = 'progresso_porto' if as_of is None else f'({SQL_PROGRESSO_EM})'
+    cursor = conn.execute(SQL_ROLLUP.format(chave=chave, join=join, fonte=fonte), {'data': as_of})
+    colunas = [d[0] for d in cursor.description]
+    return [dict(zip(colunas, row)) for row in cursor.fetchall()]
+
+def progresso_portfolio(conn: sqlite3.Connection, as_of: Optional[str] = None) -> Optional[float]:
+    """Progresso ponderado do portfólio inteiro (0 a 1), ou None sem portos."""
+    linhas = rollup(conn, 'portfolio', as_of)
+    return linhas[0]['progresso'] if linhas else None
+
+def serie_mensal(conn: sqlite3.Connection, de: str, ate: str, cadastro_id: Optional[int] = None) -> List[dict]:
+    """Progresso ponderado mês a mês ('AAAA-MM', inclusive) a partir das fotografias
+    mensais; com cadastro_id, a série de um único porto."""
+    where, params = ('c.id = :cadastro_id', {'cadastro_id': cadastro_id}) if cadastro_id else ('1', {})
+    params.update(de=de, ate=ate)
+    return [{'mes': mes, 'progresso': progresso}
+            for mes, progresso in conn.execute(SQL_SERIE_MENSAL.format(where=where), params)]
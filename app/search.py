@@ -0,0 +1,83 @@
+from __future__ import annotations
+import html
+import re
+import sqlite3
+from typing import List
+
+# Marcadores usados pelo snippet() do FTS5; trocados por <mark> depois do escape HTML
+_INI, _FIM = '\x02', '\x03'
+
+SEARCH_QUERIES = {
+    'cadastro': f"""
+        SELECT c.id AS id, c.id AS cadastro_id,
+               c.zona_portuaria || ' - ' || c.obj_concessao AS titulo,
+               snippet(cadastro_fts, -1, '{_INI}', '{_FIM}', '…', 16) AS trecho,
+               bm25(cadastro_fts) AS rank
+        FROM cadastro_fts
+        JOIN cadastro c ON c.id = cadastro_fts.rowid
+        WHERE cadastro_fts MATCH ?
+        ORDER BY rank LIMIT ?
+    """,
+    'servico': f"""
+        SELECT s.id AS id, s.cadastro_id AS cadastro_id,
+               COALESCE(s.servico, 'Serviço') || ' - ' || c.zona_portuaria AS titulo,
+               snippet(servico_fts, -1, '{_INI}', '{_FIM}', '…', 16) AS trecho,
+               bm25(servico_fts) AS rank
+        FROM servico_fts
+        JOIN servico s ON s.id = servico_fts.rowid
+        JOIN cadastro c ON c.id = s.cadastro_id
+        WHERE servico_fts MATCH ?
+        ORDER BY rank LIMIT ?
+    """,
+    'acompanhamento': f"""
+        SELECT a.id AS id, s.cadastro_id AS cadastro_id,
+               COALESCE(s.servico, 'Acompanhamento') || ' (' || COALESCE(a.data_atualizacao, 's/ data') || ')' AS titulo,
+               snippet(acompanhamento_fts, -1, '{_INI}', '{_FIM}', '…', 16) AS trecho,
+               bm25(acompanhamento_fts) AS rank
+        FROM acompanhamento_fts
+        JOIN acompanhamento a ON a.id = acompanhamento_fts.rowid
+        JOIN servico s ON s.id = a.servico_id
+        WHERE acompanhamento_fts MATCH ?
+        ORDER BY rank LIMIT ?
+    """,
+}
+
+def to_match_query(texto: str) -> str:
+    """Converte o texto digitado em uma consulta FTS5 segura (todas as palavras, por prefixo)."""
+    termos = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{t}"*' for t in termos)
+
+def _highlight(trecho: str) -> str:
+    return html.escape(trecho or '').replace(_INI, '<mark>').replace(_FIM, '</mark>')
+
+def search(conn: sqlite3.Connection, texto: str, limit: int = 20) -> List[dict]:
+    """Busca textual ranqueada (bm25) em cadastro, serviços e acompanhamentos.
+
+    O bm25 de cada tabela FTS depende das estatísticas dela (número e tamanho
+    dos documentos), então os valores de tabelas diferentes não se comparam.
+    Os resultados são intercalados pela posição dentro da própria tabela e,
+    na mesma posição, pelo score: o bm25 dividido pelo do melhor resultado da
+    tabela (1 = melhor da tabela). 'rank' continua sendo o bm25 bruto.
+
+    O trecho retornado já vem com HTML escapado e os termos encontrados em <mark>.
+    """
+    consulta = to_match_query(texto)
+    if not consulta:
+        return []
+    resultados = []
+    for ordem, (tipo, sql) in enumerate(SEARCH_QUERIES.items()):
+        melhor = None
+        for posicao, (id_, cadastro_id, titulo, trecho, rank) in enumerate(conn.execute(sql, (consulta, limit))):
+            melhor = rank if melhor is None else melhor
+            score = rank / melhor if melhor else 1.0
+            resultados.append(((posicao, -score, ordem), {
+                'type': tipo,
+                'id': id_,
+                'portoId': cadastro_id,
+                'title': titulo,
+                'snippet': _highlight(trecho),
+                'rank': rank,
+                'score': round(score, 4),
+            }))
+    resultados.sort(key=lambda r: r[0])
+    return [r for _, r in resultados[:limit]]
@@ -36,7 +36,8 @@ def normalize_percentage(x):
         val = float(x)
         if val > 1:
             val = val / 100.0
-        return max(0.0, min(1.0, val))
+        # Arredonda para não carregar o ruído de float32 (schema de tipos) ao banco
+        return round(max(0.0, min(1.0, val)), 6)
     except Exception:
         return None
 
@@ -125,7 +126,7 @@ def validate_acompanhamento(df02: pd.DataFrame, df01: pd.DataFrame) -> pd.DataFr
     key01_cols = ['Zona portuária','UF','Obj. de Concessão','Tipo de Serviço','Fase','Serviço','Descrição']
     if not set(key01_cols).issubset(df01.columns):
         return pd.DataFrame(columns=['linha','coluna','erro'])
-    key01 = set(tuple(x) for x in df01[key01_cols].fillna('').values)
+    key01 = set(tuple(x) for x in df01[key01_cols].astype(object).fillna('').values)
     for idx, r in df02.iterrows():
         k = tuple(r.get(c) for c in key01_cols)
         if any(pd.isna(x) or x == '' for x in k):
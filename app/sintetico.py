@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Gerador de dados sintéticos (Tabelas 00, 01 e 02) para testes de carga.
+
+Fator de escala 1 = 100 portos x 20 serviços x 50 atualizações (2.000 serviços,
+100.000 acompanhamentos); o número de portos cresce linearmente com a escala.
+Os dados respeitam UF_LIST, TIPO_LIST e as chaves naturais usadas na gravação
+(zona + objeto; zona + objeto + tipo de serviço + fase + serviço), e as datas
+seguem a ordem assinatura <= início < final, com atualizações mensais a partir
+do início. Nenhuma atualização passa da data de referência (--hoje): as
+assinaturas recuam o quanto for preciso para caber a série inteira.
+
+    python sintetico.py --escala 1 --formato excel --saida sf1.xlsx
+    python sintetico.py --escala 10 --formato json --saida present_tela/sf10.json
+    python sintetico.py --escala 1 --formato sqlite --saida /tmp/portos_sf1.db
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+import io_utils as iox
+import services as svc
+
+PORTOS_POR_ESCALA = 100
+SERVICOS_POR_PORTO = 20
+ATUALIZACOES_POR_SERVICO = 50
+# Data de referência padrão: fixa, para a mesma semente gerar sempre os mesmos dados
+HOJE = date(2025, 7, 1)
+ANOS_DE_ASSINATURA = 15
+PRAZO_INICIO_MAXIMO = 5  # anos entre a assinatura e o início de um serviço
+
+# Zonas portuárias com UF e coordenadas aproximadas (os portos são espalhados em volta)
+ZONAS = [
+    ('Santos', 'SP', -23.95, -46.33), ('Paranaguá', 'PR', -25.50, -48.52),
+    ('Itaguaí', 'RJ', -22.93, -43.84), ('Rio de Janeiro', 'RJ', -22.89, -43.18),
+    ('Rio Grande', 'RS', -32.05, -52.10), ('São Francisco do Sul', 'SC', -26.24, -48.64),
+    ('Vitória', 'ES', -20.32, -40.33), ('Salvador', 'BA', -12.96, -38.51),
+    ('Suape', 'PE', -8.39, -34.96), ('Pecém', 'CE', -3.54, -38.81),
+    ('Itaqui', 'MA', -2.57, -44.37), ('Vila do Conde', 'PA', -1.55, -48.75),
+    ('Santana', 'AP', -0.06, -51.17), ('Manaus', 'AM', -3.14, -60.02),
+    ('Maceió', 'AL', -9.68, -35.73), ('Cabedelo', 'PB', -6.97, -34.84),
+]
+TIPOS_SERVICO = ['Dragagem', 'Obras civis', 'Equipamentos', 'Acessos terrestres', 'Meio ambiente']
+RESPONSAVEIS = [('Ana', 'Analista', 'PPI'), ('Bruno', 'Coordenador', 'SNPTA'),
+                ('Carla', 'Especialista', 'ANTAQ'), ('Diego', 'Analista', 'Autoridade Portuária')]
+RISCOS = [None, 'Meio Ambiente', 'Licitação', 'Financeiro', 'Judicial']
+
+def _datas(ano, mes, dia) -> pd.Series:
+    return pd.Series(pd.to_datetime(pd.DataFrame({'year': ano, 'month': mes, 'day': dia})))
+
+def gerar(escala: float = 1, semente: int = 0,
+          servicos: int = SERVICOS_POR_PORTO,
+          atualizacoes: int = ATUALIZACOES_POR_SERVICO,
+          hoje: date = HOJE) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """(df00, df01, df02) no layout de io_utils (COLS_00/01/02), determinístico pela
+    semente e por `hoje`, antes da qual ficam todas as atualizações."""
+    rng = np.random.default_rng(semente)
+    n = max(1, round(PORTOS_POR_ESCALA * escala))
+    # Último ano de assinatura em que início (até dezembro de +PRAZO_INICIO_MAXIMO)
+    # mais `atualizacoes` meses ainda termina antes do mês de `hoje`
+    ultimo_ano = (hoje.year * 12 + hoje.month - 1 - 12 - atualizacoes) // 12 - PRAZO_INICIO_MAXIMO
+
+    # Tabela 00 - um objeto de concessão por porto, chave (zona, objeto) única
+    zona = rng.integers(len(ZONAS), size=n)
+    nomes, ufs, lats, lons = (np.array(c, dtype=object) for c in zip(*ZONAS))
+    ano_ass = rng.integers(ultimo_ano - ANOS_DE_ASSINATURA + 1, ultimo_ano + 1, n)
+    mes_ass, dia_ass = rng.integers(1, 13, n), rng.integers(1, 29, n)
+    capex = np.round(rng.lognormal(19, 1.2, n), 2)
+    perc_exec = np.round(rng.uniform(0, 1, n), 4)
+    df00 = pd.DataFrame({
+        'Zona portuária': nomes[zona],
+        'UF': ufs[zona],
+        'Obj. de Concessão': [f'{nome[:3].upper()}{i:05d}' for i, nome in enumerate(nomes[zona])],
+        'Tipo': rng.choice(svc.TIPO_LIST, n),
+        'CAPEX Total': capex,
+        'CAPEX Executado': np.round(capex * perc_exec, 2),
+        '% CAPEX Executado': perc_exec,
+        'Data de assinatura do contrato': _datas(ano_ass, mes_ass, dia_ass),
+        'Descrição': [f'Objeto sintético {i}' for i in range(n)],
+        'Latitude': np.round(lats[zona].astype(float) + rng.normal(0, 0.05, n), 6),
+        'Longitude': np.round(lons[zona].astype(float) + rng.normal(0, 0.05, n), 6),
+    }, columns=iox.COLS_00)
+
+    # Tabela 01 - serviços com nome único no porto (a Tabela 02 resolve por zona,
+    # objeto, tipo, fase e serviço) e % de CAPEX somando ~100% em cada porto
+    porto = np.repeat(np.arange(n), servicos)
+    k = np.tile(np.arange(servicos), n)
+    pesos = rng.uniform(0.5, 1.5, (n, servicos))
+    perc_capex = np.round((pesos / pesos.sum(axis=1, keepdims=True)).ravel(), 4)
+    prazo_inicio = rng.integers(0, PRAZO_INICIO_MAXIMO + 1, n * servicos)
+    prazo_final = prazo_inicio + rng.integers(1, 6, n * servicos)
+    capex_servico = np.round(capex[porto] * perc_capex, 2)
+    df01 = pd.DataFrame({
+        'Zona portuária': df00['Zona portuária'].to_numpy()[porto],
+        'UF': df00['UF'].to_numpy()[porto],
+        'Obj. de Concessão': df00['Obj. de Concessão'].to_numpy()[porto],
+        'Tipo de Serviço': np.array(TIPOS_SERVICO, dtype=object)[k % len(TIPOS_SERVICO)],
+        'Fase': [f'{f}ª' for f in k // len(TIPOS_SERVICO) % 3 + 1],
+        'Serviço': [f'Serviço {j + 1:03d}' for j in k],
+        'Descrição do serviço': [f'Etapa {j + 1} do objeto' for j in k],
+        'Prazo início (anos)': prazo_inicio,
+        # Mesmo cálculo de services.compute_service_fields (dia <= 28: add_years exato)
+        'Data de início': _datas(ano_ass[porto] + prazo_inicio, mes_ass[porto], dia_ass[porto]),
+        'Prazo final (anos)': prazo_final,
+        'Data final': _datas(ano_ass[porto] + prazo_final, mes_ass[porto], dia_ass[porto]),
+        'Fonte (Prazo)': 'Contrato',
+        '% de CAPEX para o serviço': perc_capex,
+        'CAPEX do Serviço (total)': capex_servico,
+    }, columns=iox.COLS_01)
+
+    # Tabela 02 - atualizações mensais a partir do mês seguinte ao início, com %
+    # executada não decrescente
+    servico = np.repeat(np.arange(len(df01)), atualizacoes)
+    mes = np.tile(np.arange(1, atualizacoes + 1), len(df01))
+    inicio = df01['Data de início'].to_numpy().astype('datetime64[M]')
+    data = (inicio[servico] + mes).astype('datetime64[D]') + rng.integers(0, 28, len(servico))
+    incrementos = rng.uniform(0, 1, (len(df01), atualizacoes))
+    perc_executada = np.round((np.cumsum(incrementos, axis=1) / incrementos.sum(axis=1, keepdims=True)
+                               * rng.uniform(0.2, 1, (len(df01), 1))).ravel(), 4)
+    responsavel = rng.integers(len(RESPONSAVEIS), size=len(servico))
+    nomes_resp, cargos, setores = (np.array(c, dtype=object) for c in zip(*RESPONSAVEIS))
+    risco = np.array(RISCOS, dtype=object)[rng.integers(len(RISCOS), size=len(servico))]
+    df02 = pd.DataFrame({
+        **{col: df01[col].to_numpy()[servico]
+           for col in ('Zona portuária', 'UF', 'Obj. de Concessão', 'Tipo de Serviço', 'Fase', 'Serviço')},
+        'Descrição': [f'Atualização {m}' for m in mes],
+        '% executada': perc_executada,
+        'CAPEX (Reaj.)': np.round(capex_servico[servico] * (1 + mes * 0.004), 2),
+        'Valor executado': np.round(capex_servico[servico] * perc_executada, 2),
+        'Data da atualização': pd.Series(data.astype('datetime64[ns]')),
+        'Responsável': nomes_resp[responsavel],
+        'Cargo': cargos[responsavel],
+        'Setor': setores[responsavel],
+        'Riscos Relacionados (Tipo)': risco,
+        'Riscos Relacionados (Descrição)': [f'Risco de {r.lower()}' if r else None for r in risco],
+    }, columns=iox.COLS_02)
+
+    # Execução do serviço = última atualização
+    ultima = df02.groupby(servico)['% executada'].last().to_numpy()
+    df01['CAPEX do Serviço (exec.)'] = np.round(capex_servico * ultima, 2)
+    df01['% CAPEX exec.'] = ultima
+    return (iox.apply_dtypes(df00, iox.DTYPES_00), iox.apply_dtypes(df01, iox.DTYPES_01),
+            iox.apply_dtypes(df02, iox.DTYPES_02))
+
+# present_tela chama a zona de "Local", o setor do responsável de "Setor2" e o
+# CAPEX do serviço sem o "(total)"
+RENOMEAR_JSON = {'Zona portuária': 'Local', 'CAPEX do Serviço (total)': 'CAPEX do Serviço'}
+
+def para_json(df00: pd.DataFrame, df01: pd.DataFrame, df02: pd.DataFrame) -> dict:
+    """Formato de present_tela (planilha_portos.json): registros por nome da planilha."""
+    def registros(df, **renomear):
+        df = df.astype(object).rename(columns={**RENOMEAR_JSON, **renomear})
+        for col in df.columns:
+            if col.startswith('Data'):
+                df[col] = df[col].map(lambda v: str(v) if pd.notna(v) else None)
+        return df.where(pd.notna(df), None).to_dict('records')
+    return {
+        iox.SHEET_NAMES_CAD[0]: registros(df00),
+        iox.SHEET_NAMES_SRV[0]: registros(df01),
+        iox.SHEET_NAMES_MON[0]: registros(df02, Setor='Setor2'),
+    }
+
+def salvar(frames: tuple, formato: str, saida: Path) -> None:
+    """Grava os frames como planilha Excel, JSON de present_tela ou banco SQLite (schema de db.py)."""
+    if formato == 'excel':
+        iox.write_excel(saida, *frames)
+    elif formato == 'json':
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(para_json(*frames), f, ensure_ascii=False)
+    elif formato == 'sqlite':
+        import db
+        caminho_original, db.DB_PATH = db.DB_PATH, Path(saida)
+        try:
+            db.init_db()
+            if not db.save_all(*frames):
+                raise RuntimeError(f'Erro ao gravar {saida}')
+        finally:
+            db.DB_PATH = caminho_original
+    else:
+        raise ValueError(f'Formato inválido: {formato}')
+
+EXTENSOES = {'excel': 'xlsx', 'json': 'json', 'sqlite': 'db'}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos das Tabelas 00, 01 e 02.')
+    parser.add_argument('--escala', type=float, default=1,
+                        help=f'fator de escala (1 = {PORTOS_POR_ESCALA} portos)')
+    parser.add_argument('--formato', choices=sorted(EXTENSOES), default='excel')
+    parser.add_argument('--saida', type=Path, help='arquivo de saída (padrão: sintetico_sf<escala>.<ext>)')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--servicos', type=int, default=SERVICOS_POR_PORTO, help='serviços por porto')
+    parser.add_argument('--atualizacoes', type=int, default=ATUALIZACOES_POR_SERVICO,
+                        help='atualizações por serviço')
+    parser.add_argument('--hoje', type=date.fromisoformat, default=HOJE,
+                        help=f'data de referência: nenhuma atualização depois dela (padrão: {HOJE})')
+    args = parser.parse_args(argv)
+
+    saida = args.saida or Path(f'sintetico_sf{args.escala:g}.{EXTENSOES[args.formato]}')
+    if args.formato == 'sqlite' and saida.exists():
+        print(f'❌ {saida} já existe (a carga sintética substitui os dados do banco)')
+        return 1
+    frames = gerar(args.escala, args.semente, args.servicos, args.atualizacoes, args.hoje)
+    salvar(frames, args.formato, saida)
+    print(f'✅ {saida}: ' + ', '.join(f'{len(df)} linhas na Tabela {t}' for t, df in zip(('00', '01', '02'), frames)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
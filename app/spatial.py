@@ -0,0 +1,79 @@
+from __future__ import annotations
+import math
+import sqlite3
+from typing import List, Tuple
+
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+
+def parse_bbox(texto: str) -> Tuple[float, float, float, float]:
+    """'oeste,sul,leste,norte' -> tupla de floats. Levanta ValueError se inválido."""
+    bbox = tuple(float(v) for v in texto.split(','))
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError(f'bbox inválido: {texto}')
+    return bbox
+
+def haversine_km(lat, lon, lats, lons):
+    """Distância (km) de um ponto a arrays de pontos, vetorizada com NumPy."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(a))
+
+def has_rtree(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='cadastro_rtree'"
+    ).fetchone() is not None
+
+def bbox_filter(conn: sqlite3.Connection, alias: str = 'c') -> str:
+    """Trecho de WHERE que restringe {alias}.id ao bbox (parâmetros: sul, norte, oeste, leste)."""
+    if has_rtree(conn):
+        return f'''{alias}.id IN (
+            SELECT id FROM cadastro_rtree
+            WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+        )'''
+    return f'''({alias}.latitude BETWEEN ? AND ? AND {alias}.longitude BETWEEN ? AND ?)'''
+
+def bbox_params(bbox: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
+    west, south, east, north = bbox
+    return south, north, west, east
+
+def ids_in_bbox(conn: sqlite3.Connection, bbox) -> List[Tuple[int, float, float]]:
+    """(id, latitude, longitude) dos cadastros dentro do bbox."""
+    return conn.execute(f'''
+        SELECT c.id, c.latitude, c.longitude FROM cadastro c
+        WHERE c.latitude IS NOT NULL AND c.longitude IS NOT NULL AND {bbox_filter(conn)}
+    ''', bbox_params(bbox)).fetchall()
+
+def nearest(conn: sqlite3.Connection, lat: float, lon: float, k: int = 5) -> List[Tuple[int, float]]:
+    """Os k cadastros mais próximos de (lat, lon): lista de (id, distância em km).
+
+    Busca candidatos em caixas crescentes ao redor do ponto (pela R*Tree) e
+    refina com haversine; a caixa só para de crescer quando o k-ésimo vizinho
+    está garantidamente dentro do círculo inscrito nela.
+    """
+    total = conn.execute(
+        'SELECT COUNT(*) FROM cadastro WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+    ).fetchone()[0]
+    k = min(k, total)
+    if k <= 0:
+        return []
+
+    raio = 1.0  # graus de latitude
+    while True:
+        dlon = min(180.0, raio / max(math.cos(math.radians(min(89.0, abs(lat) + raio))), 1e-6))
+        bbox = (lon - dlon, max(-90.0, lat - raio), lon + dlon, min(90.0, lat + raio))
+        cand = ids_in_bbox(conn, bbox)
+        cobre_tudo = raio >= 180.0
+        if len(cand) >= k or cobre_tudo:
+            ids = np.array([c[0] for c in cand])
+            dist = haversine_km(lat, lon, [c[1] for c in cand], [c[2] for c in cand])
+            ordem = np.argsort(dist, kind='stable')[:k]
+            if cobre_tudo or dist[ordem[-1]] <= raio * KM_POR_GRAU:
+                return [(int(ids[i]), float(dist[i])) for i in ordem]
+            raio = dist[ordem[-1]] / KM_POR_GRAU * 1.01
+        else:
+            raio *= 2
+        raio = min(raio, 180.0)
@@ -0,0 +1,96 @@
+import pytest
+
+import analytics
+import db
+import rollup
+
+
+@pytest.fixture
+def conn(conn):
+    analytics.cache.clear()
+    # Porto 1 em duas UFs, com dois serviços; porto 2 sem serviços
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, tipo, capex_total) VALUES
+            (1, 'Rio Grande', 'RIG01', 'Concessão', 300), (2, 'Itaguaí', 'ITG01', 'Arrendamento', 100);
+        INSERT INTO cadastro_uf VALUES (1, 'RS'), (1, 'SC'), (2, 'RJ');
+        INSERT INTO servico (id, cadastro_id, tipo_servico, fase, servico, capex_servico) VALUES
+            (10, 1, 'Dragagem', '1ª', 'A', 120), (11, 1, 'Cais', '1ª', 'B', 180);
+        INSERT INTO acompanhamento (servico_id, perc_executada, valor_executado, data_atualizacao) VALUES
+            (10, 0.2, 10, '2025-01-01'), (10, 0.5, 40, '2025-06-01');
+    ''')
+    rollup.recalcular(conn)
+    conn.commit()
+    analytics.precomputar(conn)  # como fazem as gravações de db.py
+    return conn
+
+
+def _linhas(conn, group_by, metrics):
+    return analytics.executar(conn, analytics.parse_group_by(group_by), analytics.parse_metrics(metrics))
+
+
+def test_total_nao_duplica_portos_por_uf_nem_por_servico(conn):
+    (total,) = _linhas(conn, '', 'sum(capex_total),count(ports),count(services),sum(capex_servico),sum(valor_executado)')
+    assert total == {'sum(capex_total)': 400, 'count(ports)': 2, 'count(services)': 2,
+                     'sum(capex_servico)': 300, 'sum(valor_executado)': 40}
+
+
+def test_porto_com_varias_ufs_entra_integralmente_em_cada_uma(conn):
+    por_uf = {l['uf']: l for l in _linhas(conn, 'uf', 'sum(capex_total),count(services)')}
+    assert por_uf['RS'] == {'uf': 'RS', 'sum(capex_total)': 300, 'count(services)': 2}
+    assert por_uf['SC']['sum(capex_total)'] == 300
+    assert por_uf['RJ'] == {'uf': 'RJ', 'sum(capex_total)': 100, 'count(services)': 0}
+
+
+def test_cruzamento_uf_tipo_servico(conn):
+    linhas = _linhas(conn, 'uf,tipo_servico', 'sum(capex_total),max(perc_executada)')
+    assert {(l['uf'], l['tipo_servico']): (l['sum(capex_total)'], l['max(perc_executada)']) for l in linhas} == {
+        ('RJ', 'Não informado'): (100, None),
+        ('RS', 'Cais'): (300, None), ('RS', 'Dragagem'): (300, 0.5),
+        ('SC', 'Cais'): (300, None), ('SC', 'Dragagem'): (300, 0.5),
+    }
+
+
+@pytest.mark.parametrize('group_by', ['setor', 'uf,uf', 'uf;tipo'])
+def test_group_by_invalido(group_by):
+    with pytest.raises(ValueError):
+        analytics.parse_group_by(group_by)
+
+
+@pytest.mark.parametrize('metrics', ['median(capex_total)', 'sum(capex_total); DROP TABLE cadastro',
+                                     'sum(setor)', 'sum(capex_total'])
+def test_metrics_invalidas(metrics):
+    with pytest.raises(ValueError):
+        analytics.parse_metrics(metrics)
+
+
+def test_cache_por_revisao_e_cubo_pre_calculado(conn):
+    dims, metricas = ('uf',), ('sum(capex_total)',)
+    primeira = analytics.consultar(conn, dims, metricas)
+    assert primeira['source'] == 'cubo'
+    assert conn.execute('SELECT COUNT(*) FROM analytics_cubo').fetchone()[0] == len(analytics.NIVEIS_CUBO)
+    assert analytics.consultar(conn, dims, metricas)['source'] == 'memoria'
+    assert analytics.consultar(conn, ('porto',), metricas)['source'] == 'sql'
+
+    # Alteração sem pré-cálculo: a consulta não grava o cubo, vai ao SQL
+    conn.execute('UPDATE cadastro SET capex_total = 500 WHERE id = 2')
+    conn.commit()
+    nova = analytics.consultar(conn, dims, metricas)
+    assert nova['revision'] > primeira['revision'] and nova['source'] == 'sql'
+    assert {l['uf']: l['sum(capex_total)'] for l in nova['rows']}['RJ'] == 500
+    assert {r[0] for r in conn.execute('SELECT DISTINCT revisao FROM analytics_cubo')} == {primeira['revision']}
+    assert not conn.in_transaction
+
+    analytics.cache.clear()
+    analytics.precomputar(conn)
+    assert analytics.consultar(conn, dims, metricas) == {**nova, 'source': 'cubo'}
+    # Níveis de revisões antigas são descartados
+    assert {r[0] for r in conn.execute('SELECT DISTINCT revisao FROM analytics_cubo')} == {nova['revision']}
+
+
+def test_gravacoes_pre_calculam_o_cubo(conn):
+    assert db.save_cadastro(db.load_cadastro())
+    rev = analytics.revisao(conn)
+    assert conn.execute('SELECT COUNT(*) FROM analytics_cubo WHERE revisao = ?', (rev,)).fetchone()[0] == \
+        len(analytics.NIVEIS_CUBO)
+    assert db.save_all_diferencial(*db.load_all()) is not None
+    assert {r[0] for r in conn.execute('SELECT DISTINCT revisao FROM analytics_cubo')} == {analytics.revisao(conn)}
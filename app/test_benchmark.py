@@ -0,0 +1,25 @@
+import benchmark
+import consultas
+import db
+
+
+def test_execucao_grava_historico_e_compara(tmp_path):
+    caminho_db = db.DB_PATH
+    historico = tmp_path / 'historico.json'
+    execucao = benchmark.executar([0.02], repeticoes=1, caminho=historico, servicos=2, atualizacoes=2)
+    assert db.DB_PATH == caminho_db and not consultas.instalado()  # nada fica trocado
+
+    passos = execucao['resultados']['sf0.02']
+    assert {'read_excel', 'save_all', 'load_all', 'api_portos', 'present_api_projects'} <= set(passos)
+    assert passos['save_all']['sql'] > 0 and passos['api_portos']['sql'] == 1
+    assert all(m['tempo_s'] >= 0 and m['rss_pico_mb'] > 0 for m in passos.values())
+    assert benchmark.carregar_historico(historico) == [execucao]
+
+    pior = {**execucao, 'resultados': {'sf0.02': {
+        **passos,
+        'save_all': {**passos['save_all'], 'tempo_s': passos['save_all']['tempo_s'] * 2 + 1},
+        'api_portos': {**passos['api_portos'], 'sql': 10},
+    }}}
+    regressoes = {(passo, metrica) for _, passo, metrica, _, _ in benchmark.comparar(pior, execucao)}
+    assert regressoes == {('save_all', 'tempo_s'), ('api_portos', 'sql')}
+    assert benchmark.comparar(execucao, execucao) == []
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import changes
+import db
+import io_utils as iox
+
+
+@pytest.fixture
+def conn(conn):
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, capex_total) VALUES
+            (1, 'Santos', 'STS10', 300), (2, 'Itaguaí', 'ITG01', 100);
+        INSERT INTO cadastro_uf VALUES (1, 'SP');
+        INSERT INTO servico (id, cadastro_id, servico) VALUES (10, 1, 'Dragagem');
+    ''')
+    conn.commit()
+    return conn
+
+
+def _ops(resultado):
+    return [(c['table'], c['id'], c['op']) for c in resultado['changes']]
+
+
+def test_delta_traz_so_as_linhas_alteradas(conn):
+    base = changes.alteracoes(conn, 0)
+    assert set(_ops(base)) == {('cadastro', 1, 'U'), ('cadastro', 2, 'I'), ('servico', 10, 'I')}
+    desde = base['revision']
+    assert changes.alteracoes(conn, desde)['changes'] == []
+
+    conn.execute('UPDATE cadastro SET capex_total = 350 WHERE id = 2')
+    conn.execute('UPDATE cadastro SET capex_total = 400 WHERE id = 2')
+    conn.execute("INSERT INTO cadastro_uf VALUES (2, 'RJ')")
+    conn.commit()
+    delta = changes.alteracoes(conn, desde)
+    (alteracao,) = delta['changes']  # uma entrada por linha, com o estado atual
+    assert (alteracao['table'], alteracao['id'], alteracao['op']) == ('cadastro', 2, 'U')
+    assert alteracao['row']['investment'] == 400 and alteracao['row']['ufs'] == 'RJ'
+
+
+def test_exclusao_em_cascata(conn):
+    desde = changes.estado(conn)[0]
+    conn.execute('DELETE FROM cadastro WHERE id = 1')
+    conn.commit()
+    assert set(_ops(changes.alteracoes(conn, desde))) == {('cadastro', 1, 'D'), ('servico', 10, 'D')}
+
+
+def test_paginacao(conn):
+    pagina = changes.alteracoes(conn, 0, limite=2)
+    assert pagina['has_more'] and pagina['revision'] == 2
+    resto = changes.alteracoes(conn, pagina['revision'], limite=10)
+    assert not resto['has_more'] and resto['revision'] == changes.estado(conn)[0]
+
+
+def test_compactacao_e_horizonte(conn):
+    conn.execute('UPDATE cadastro SET capex_total = 1 WHERE id = 1')
+    conn.execute('DELETE FROM servico WHERE id = 10')
+    conn.commit()
+    antes = changes.alteracoes(conn, 0)
+
+    resultado = changes.compactar(conn)
+    assert resultado['duplicadas'] > 0 and resultado['exclusoes'] == 0
+    assert conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0] == 3
+    assert changes.alteracoes(conn, 0)['changes'] == antes['changes']
+
+    # Exclusões além da retenção saem do log; clientes anteriores ao horizonte recarregam tudo
+    conn.execute("UPDATE change_log SET criado_em = datetime('now', '-30 days') WHERE op = 'D'")
+    resultado = changes.compactar(conn)
+    conn.commit()
+    assert resultado['exclusoes'] == 1
+    assert changes.alteracoes(conn, 0)['reset']
+    assert not changes.alteracoes(conn, resultado['horizonte'])['reset']
+
+
+def test_gravacao_compacta_o_log_acima_do_limite(conn, monkeypatch):
+    df00 = pd.DataFrame([{'Zona portuária': 'Santos', 'UF': 'SP', 'Obj. de Concessão': f'STS{i}'} for i in range(5)],
+                        columns=iox.COLS_00)
+    duplicadas = '''SELECT COUNT(*) - COUNT(DISTINCT tabela || ':' || registro_id) FROM change_log'''
+    assert changes.compactar_se_necessario(conn) is None
+    assert db.save_cadastro(df00) and db.save_cadastro(df00)
+    assert conn.execute(duplicadas).fetchone()[0] > 0
+
+    monkeypatch.setattr(changes, 'MAX_EXCEDENTE', 3)
+    assert db.save_cadastro(df00)
+    assert conn.execute(duplicadas).fetchone()[0] == 0
+
+
+def test_nao_altera_a_row_factory_de_quem_chamou(conn):
+    conn.execute("UPDATE cadastro SET capex_total = 1 WHERE id = 2")
+    conn.commit()
+    conn.row_factory = sqlite3.Row
+    resultado = changes.alteracoes(conn, 0)
+    assert resultado['changes'][-1]['row']['investment'] == 1
+    assert conn.row_factory is sqlite3.Row
+    conn.row_factory = None
+    changes.alteracoes(conn, 0)
+    assert conn.row_factory is None
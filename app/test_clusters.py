@@ -0,0 +1,97 @@
+import pytest
+
+import clusters
+import consultas
+import db
+
+
+@pytest.fixture
+def conn(conn, monkeypatch):
+    monkeypatch.setattr(clusters, '_index', None)
+    monkeypatch.setattr(clusters, '_versao', None)
+    # Dois portos vizinhos em Santos e um em Belém
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, latitude, longitude) VALUES
+            (1, 'Santos', 'STS01', -23.95, -46.33), (2, 'Santos', 'STS02', -23.96, -46.31),
+            (3, 'Belém', 'BEL01', -1.45, -48.50);
+    ''')
+    conn.commit()
+    return conn
+
+
+def _portos(features):
+    return sorted(f['id'] for f in features if f['type'] == 'porto')
+
+
+def test_vizinhos_agrupados_no_zoom_baixo_e_separados_no_alto():
+    indice = clusters.ClusterIndex()
+    indice.add(1, -23.95, -46.33, name='STS01')
+    indice.add(2, -23.96, -46.31, name='STS02')
+    indice.add(3, -1.45, -48.50, name='BEL01')
+
+    longe = indice.get_clusters((-180, -90, 180, 90), 4)
+    (cluster,) = [f for f in longe if f['type'] == 'cluster']
+    assert cluster['count'] == 2 and _portos(longe) == [3]
+    assert cluster['expansionZoom'] > 4
+    perto = indice.get_clusters((-180, -90, 180, 90), cluster['expansionZoom'])
+    assert _portos(perto) == [1, 2, 3]
+    assert indice.get_clusters((-50, -5, -45, 0), 4) == [
+        {'type': 'porto', 'id': 3, 'name': 'BEL01', 'lat': -1.45, 'lon': -48.50}]
+
+
+def test_mover_e_remover_porto():
+    indice = clusters.ClusterIndex()
+    indice.add(1, -23.95, -46.33)
+    indice.add(2, -23.96, -46.31)
+    indice.add(2, -1.45, -48.50)  # mudou de lugar
+    assert _portos(indice.get_clusters((-180, -90, 180, 90), 4)) == [1, 2]
+    indice.remove(1)
+    assert len(indice) == 1
+    assert all(celula['ids'] == {2} and celula['count'] == 1
+               for nivel in indice.levels.values() for celula in nivel.values())
+
+
+def test_indice_acompanha_insercao_alteracao_e_exclusao(conn):
+    assert len(clusters.get_index()) == 3
+    conn.execute("INSERT INTO cadastro (id, zona_portuaria, obj_concessao, latitude, longitude) "
+                 "VALUES (4, 'Rio Grande', 'RIG01', -32.03, -52.10)")
+    conn.execute('UPDATE cadastro SET latitude = -3.72, longitude = -38.52 WHERE id = 2')
+    conn.execute('DELETE FROM cadastro WHERE id = 3')
+    conn.commit()
+    indice = clusters.get_index()
+    assert sorted(indice.points) == [1, 2, 4]
+    assert (indice.points[2]['lat'], indice.points[2]['lon']) == (-3.72, -38.52)
+    conn.execute('UPDATE cadastro SET latitude = NULL WHERE id = 4')
+    conn.commit()
+    assert sorted(clusters.get_index().points) == [1, 2]
+
+
+def test_sem_alteracao_nao_le_o_cadastro(conn):
+    indice = clusters.get_index()
+    with consultas.no_maximo(2):
+        assert clusters.get_index() is indice
+    conn.execute('UPDATE cadastro SET latitude = -3.72, longitude = -38.52 WHERE id = 2')
+    conn.commit()
+    with consultas.no_maximo(4), consultas.medir() as contagem:
+        clusters.get_index()
+    lidos = [sql for sql in contagem.por_sql if 'FROM cadastro' in sql]
+    assert len(lidos) == 1 and 'id IN' in lidos[0]  # só o porto alterado
+
+
+def test_banco_recriado_reconstroi_o_indice(conn, tmp_path, monkeypatch):
+    assert len(clusters.get_index()) == 3
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'outro.db')
+    db.init_db()
+    assert len(clusters.get_index()) == 0
+
+
+def test_endpoint(conn):
+    import api
+    client = api.app.test_client()
+    resposta = client.get('/api/portos/clusters?bbox=-180,-90,180,90&zoom=4')
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo['zoom'] == 4
+    assert sorted(f.get('count', 1) for f in corpo['features']) == [1, 2]
+    assert client.get('/api/portos/clusters?bbox=1,2,3&zoom=4').status_code == 400
+    assert client.get('/api/portos/clusters?zoom=perto').status_code == 400
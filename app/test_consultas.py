@@ -0,0 +1,183 @@
+import importlib.util
+import json
+import logging
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+import consultas
+import db
+import sintetico
+
+# Máximo de comandos por endpoint, qualquer que seja o tamanho do banco
+MAXIMO_API = {
+    '/api/portos': 1,
+    '/api/portos/1': 5,
+    '/api/portos/summary': 4,
+    '/api/portos/rollup': 1,
+    '/api/portos/history': 1,
+    '/api/changes?since=0': 6,
+}
+
+
+@pytest.fixture(params=[0.02, 0.1], ids=['2-portos', '10-portos'])
+def escala(request):
+    return request.param
+
+
+@pytest.fixture
+def desinstalar():
+    yield
+    consultas.desinstalar()
+
+
+def test_endpoints_da_api_nao_crescem_com_os_dados(escala, tmp_path, monkeypatch):
+    import api
+    sintetico.salvar(sintetico.gerar(escala, servicos=3, atualizacoes=2), 'sqlite', tmp_path / 'portos.db')
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'portos.db')
+    client = api.app.test_client()
+    for url, maximo in MAXIMO_API.items():
+        with consultas.no_maximo(maximo):
+            assert client.get(url).status_code == 200, url
+    assert not consultas.instalado()
+
+
+def test_projetos_do_present_tela_sem_n_mais_1(escala, tmp_path):
+    caminho = Path(__file__).parent / 'present_tela' / 'app.py'
+    spec = importlib.util.spec_from_file_location('present_tela_app', caminho)
+    present = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(present)
+    present.DATABASE, present.JSON_FILE = str(tmp_path / 'present.db'), str(tmp_path / 'present.json')
+    sintetico.salvar(sintetico.gerar(escala, servicos=3, atualizacoes=2), 'json', Path(present.JSON_FILE))
+    present.init_db()
+    present.import_from_json()
+
+    with consultas.no_maximo(4):
+        projetos = present.app.test_client().get('/api/projects').get_json()
+    assert len(projetos) == round(100 * escala)
+    assert all(len(p['servicos']) == 3 and len(p['acompanhamentos']) == 6 for p in projetos)
+
+
+def test_detecta_comando_repetido(tmp_path, desinstalar):
+    consultas.instalar()
+    conn = sqlite3.connect(tmp_path / 'x.db')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+    conn.executemany('INSERT INTO t (v) VALUES (?)', [('a',)] * 20)
+    with consultas.medir() as contagem:
+        ids = [r[0] for r in conn.execute('SELECT id FROM t')]
+        for i in ids:
+            conn.execute('SELECT v FROM t WHERE id = ?', (i,)).fetchone()
+    assert contagem.comandos == 21 and contagem.tempo_s > 0
+    assert contagem.repetidos() == [('SELECT v FROM t WHERE id = ?', 20)]
+    assert consultas.normalizar("SELECT * FROM t WHERE id IN (1, 2, 3) AND v = 'x''y'") == \
+        'SELECT * FROM t WHERE id IN (?) AND v = ?'
+
+    with pytest.raises(AssertionError, match='20x SELECT v FROM t WHERE id = ?'):
+        with consultas.no_maximo(5):
+            for i in ids:
+                conn.execute('SELECT v FROM t WHERE id = ?', (i,)).fetchone()
+    conn.close()
+
+
+def test_log_por_requisicao(tmp_path, caplog, desinstalar):
+    app = Flask('teste')
+    caminho = tmp_path / 'x.db'
+
+    @app.route('/itens')
+    def itens():
+        conn = sqlite3.connect(caminho)
+        for i in range(consultas.LIMITE_N_MAIS_1):
+            conn.execute('SELECT ?', (i,)).fetchone()
+        conn.close()
+        return 'ok'
+
+    consultas.registrar_flask(app)
+    with caplog.at_level(logging.INFO, logger='consultas'):
+        assert app.test_client().get('/itens').status_code == 200
+    registro = json.loads(caplog.records[-1].getMessage())
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert (registro['rota'], registro['status'], registro['sql']) == ('/itens', 200, consultas.LIMITE_N_MAIS_1)
+    assert registro['n_mais_1'] == [{'sql': 'SELECT ?', 'vezes': consultas.LIMITE_N_MAIS_1}]
+
+
+@pytest.fixture
+def perfil():
+    yield consultas.perfilar(limite_lenta_ms=0)
+    consultas.parar_perfil()
+    consultas.desinstalar()
+
+
+def test_perfil_acumula_duracao_linhas_e_lentas(tmp_path, perfil, caplog):
+    conn = sqlite3.connect(tmp_path / 'x.db')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+    conn.executemany('INSERT INTO t (v) VALUES (?)', [('a',)] * 20)
+    with caplog.at_level(logging.WARNING, logger='consultas.lentas'):
+        for limite in (5, 15):
+            assert len(conn.execute('SELECT id FROM t WHERE id <= ?', (limite,)).fetchall()) == limite
+        assert sum(1 for _ in conn.execute('SELECT v FROM t')) == 20
+    conn.close()
+
+    por_sql = {r['sql']: r for r in perfil.relatorio(limite=None)}
+    filtro = por_sql['SELECT id FROM t WHERE id <= ?']
+    assert (filtro['chamadas'], filtro['linhas']) == (2, 20)
+    assert sum(filtro['histograma'].values()) == 2 and filtro['max_ms'] <= filtro['total_ms']
+    assert por_sql['SELECT v FROM t']['linhas'] == 20
+    assert por_sql['INSERT INTO t (v) VALUES (?)']['chamadas'] == 1
+
+    lentas = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'consultas.lentas']
+    lentas = [l for l in lentas if l['sql'].startswith('SELECT')]
+    assert [(l['sql'], l['linhas']) for l in lentas] == [
+        ('SELECT id FROM t WHERE id <= ?', 5), ('SELECT id FROM t WHERE id <= ?', 15), ('SELECT v FROM t', 20)]
+    agregado = consultas.agregar_lentas(json.dumps(l) for l in lentas)
+    assert [(a['sql'], a['vezes'], a['linhas']) for a in agregado] == [
+        ('SELECT id FROM t WHERE id <= ?', 2, 20), ('SELECT v FROM t', 1, 20)]
+
+
+def test_debug_sql_exige_token(tmp_path, perfil, monkeypatch):
+    import api
+    sintetico.salvar(sintetico.gerar(0.02, servicos=3, atualizacoes=2), 'sqlite', tmp_path / 'portos.db')
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'portos.db')
+    client = api.app.test_client()
+    monkeypatch.delenv('DEBUG_TOKEN', raising=False)
+    assert client.get('/debug/sql').status_code == 404
+
+    monkeypatch.setenv('DEBUG_TOKEN', 'segredo')
+    assert client.get('/debug/sql', headers={'X-Debug-Token': 'errado'}).status_code == 403
+    assert client.get('/debug/sql?token=segredo').status_code == 403  # token só no cabeçalho
+    assert client.get('/api/portos').status_code == 200
+    resposta = client.get('/debug/sql?ordem=chamadas&reset=1', headers={'X-Debug-Token': 'segredo'})
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert dados['active'] and any(q['sql'].startswith('SELECT') and q['rows'] > 0 for q in dados['queries'])
+    assert client.get('/debug/sql', headers={'X-Debug-Token': 'segredo'}).get_json()['queries'] == []
+
+
+# Gravações: o número de comandos não depende do número de portos
+MAXIMO_SAVE_CADASTRO = 26
+MAXIMO_SAVE_DIFERENCIAL = 51
+
+
+def test_gravacao_do_cadastro_nao_cresce_com_os_dados(escala, banco):
+    df00, df01, df02 = sintetico.gerar(escala, servicos=3, atualizacoes=2)
+    with consultas.no_maximo(MAXIMO_SAVE_CADASTRO):
+        assert db.save_cadastro(df00)
+
+    # Diferencial com uma atualização (UF trocada) e uma inserção de porto
+    alterado = df00.astype({'UF': object})
+    alterado.loc[alterado.index[0], 'UF'] = 'RJ; ES'
+    novo = df00.iloc[:1].assign(**{'Obj. de Concessão': 'NOVO01', 'UF': 'BA'})
+    with consultas.no_maximo(MAXIMO_SAVE_DIFERENCIAL):
+        resumo = db.save_all_diferencial(pd.concat([alterado, novo], ignore_index=True), df01, df02)
+    assert resumo['cadastro']['inseridas'] == 1 and resumo['cadastro']['atualizadas'] == 1
+
+    conn = sqlite3.connect(db.DB_PATH)
+    ufs = dict(conn.execute('''
+        SELECT c.obj_concessao, GROUP_CONCAT(cu.uf_sigla, ';') FROM cadastro c
+        JOIN (SELECT * FROM cadastro_uf ORDER BY uf_sigla) cu ON cu.cadastro_id = c.id GROUP BY c.id
+    '''))
+    conn.close()
+    assert ufs[df00.iloc[0]['Obj. de Concessão']] == 'ES;RJ' and ufs['NOVO01'] == 'BA'
+    assert len(ufs) == len(df00) + 1
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pandas as pd
+
+import db
+import io_utils as iox
+
+
+def _frames():
+    df00 = pd.DataFrame([
+        {'Zona portuária': 'Santos', 'UF': 'SP', 'Obj. de Concessão': 'STS10', 'Tipo': 'Concessão', 'CAPEX Total': 300},
+        {'Zona portuária': 'Paranaguá', 'UF': 'PR', 'Obj. de Concessão': 'PAR01', 'Tipo': 'Arrendamento', 'CAPEX Total': 100},
+    ], columns=iox.COLS_00)
+    df01 = pd.DataFrame([
+        {'Zona portuária': 'Santos', 'UF': 'SP', 'Obj. de Concessão': 'STS10', 'Tipo de Serviço': 'Dragagem',
+         'Fase': '1ª', 'Serviço': 'Aprofundamento', '% de CAPEX para o serviço': 0.5},
+        {'Zona portuária': 'Paranaguá', 'UF': 'PR', 'Obj. de Concessão': 'PAR01', 'Tipo de Serviço': 'Obras',
+         'Fase': '1ª', 'Serviço': 'Cais', '% de CAPEX para o serviço': 1.0},
+    ], columns=iox.COLS_01)
+    df02 = pd.DataFrame([
+        {'Zona portuária': 'Santos', 'Obj. de Concessão': 'STS10', 'Tipo de Serviço': 'Dragagem', 'Fase': '1ª',
+         'Serviço': 'Aprofundamento', '% executada': 0.2, 'Data da atualização': '2024-01-31'},
+        {'Zona portuária': 'Santos', 'Obj. de Concessão': 'STS10', 'Tipo de Serviço': 'Dragagem', 'Fase': '1ª',
+         'Serviço': 'Aprofundamento', '% executada': 0.4, 'Data da atualização': '2024-02-29'},
+    ], columns=iox.COLS_02)
+    return df00, df01, df02
+
+
+def _revisao(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute('SELECT valor FROM revisao_dados WHERE id = 1').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_reimportacao_identica_nao_altera_nada(banco):
+    assert db.save_all(*_frames())
+    revisao = _revisao(banco)
+    resumo = db.save_all_diferencial(*_frames())
+    assert {t: (n['inalteradas'], n['inseridas'] + n['atualizadas'] + n['removidas'])
+            for t, n in resumo.items()} == {'cadastro': (2, 0), 'servico': (2, 0), 'acompanhamento': (2, 0)}
+    assert _revisao(banco) == revisao  # nenhum trigger disparou
+
+
+def test_aplica_so_a_diferenca(banco):
+    df00, df01, df02 = _frames()
+    db.save_all_diferencial(df00, df01, df02)
+    conn = sqlite3.connect(banco)
+    ids_servico = dict(conn.execute('SELECT servico, id FROM servico'))
+    conn.close()
+
+    df00.loc[0, 'CAPEX Total'] = 350
+    df01 = df01.iloc[:1]  # serviço de Paranaguá removido
+    df02.loc[len(df02)] = df02.iloc[1].to_dict() | {'% executada': 0.6, 'Data da atualização': '2024-03-31'}
+    resumo = db.save_all_diferencial(df00, df01, df02)
+    assert resumo['cadastro'] == {'inseridas': 0, 'atualizadas': 1, 'removidas': 0, 'inalteradas': 1}
+    assert resumo['servico'] == {'inseridas': 0, 'atualizadas': 0, 'removidas': 1, 'inalteradas': 1}
+    assert resumo['acompanhamento'] == {'inseridas': 1, 'atualizadas': 0, 'removidas': 0, 'inalteradas': 2}
+
+    conn = sqlite3.connect(banco)
+    assert conn.execute("SELECT capex_total FROM cadastro WHERE obj_concessao = 'STS10'").fetchone()[0] == 350
+    assert dict(conn.execute('SELECT servico, id FROM servico')) == {'Aprofundamento': ids_servico['Aprofundamento']}
+    assert conn.execute("SELECT uf_sigla FROM cadastro_uf cu JOIN cadastro c ON c.id = cu.cadastro_id "
+                        "WHERE obj_concessao = 'STS10'").fetchall() == [('SP',)]
+    conn.close()
@@ -0,0 +1,17 @@
+import db
+import estresse
+
+
+def test_rodadas_por_configuracao():
+    caminho_db = db.DB_PATH
+    resultados = estresse.executar(['delete', 'wal'], [0, 2000], escala=0.02, leitores=2,
+                                   modo_leitores='threads', escritor='linha', duracao=0.3)
+    assert db.DB_PATH == caminho_db
+    assert [(r['journal_mode'], r['busy_timeout_ms']) for r in resultados] == \
+        [('delete', 0), ('delete', 2000), ('wal', 0), ('wal', 2000)]
+    for r in resultados:
+        assert r['leituras'] > 0 and r['p50_ms'] <= r['p95_ms'] <= r['p99_ms'] <= r['max_ms']
+        assert r['leituras_erro'] == 0 and r['escritas_erro'] == 0
+        assert r['escritas'] + r['escritas_ocupado'] > 0
+    # Com espera pelo lock, nenhum leitor nem escritor desiste
+    assert all(r['leituras_ocupado'] == r['escritas_ocupado'] == 0 for r in resultados if r['busy_timeout_ms'])
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+import db
+import events
+
+
+@pytest.fixture
+def conn(conn):
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, capex_total) VALUES
+            (1, 'Santos', 'STS10', 300), (2, 'Itaguaí', 'ITG01', 100);
+        INSERT INTO servico (id, cadastro_id, servico) VALUES (10, 1, 'Dragagem');
+    ''')
+    conn.commit()
+    return conn
+
+
+def test_eventos_por_porto_alterado(conn):
+    desde = events._revisao(conn)
+    assert events.eventos_desde(conn, desde) == []
+
+    conn.execute("INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES (10, 0.5, '2025-01-01')")
+    conn.commit()
+    *portos, resumo = events.eventos_desde(conn, desde)
+    assert [e['port'] for e in portos] == [1]
+    assert resumo['event'] == 'summary' and not resumo['reset'] and resumo['id'] == events._revisao(conn)
+
+
+def test_exclusoes_avisam_o_porto_da_linha_excluida(conn):
+    conn.execute("INSERT INTO acompanhamento (id, servico_id, data_atualizacao) VALUES (100, 10, '2025-01-01')")
+    conn.commit()
+    desde = events._revisao(conn)
+    conn.execute('DELETE FROM acompanhamento WHERE id = 100')
+    conn.commit()
+    assert [e['port'] for e in events.eventos_desde(conn, desde)[:-1]] == [1]
+    desde = events._revisao(conn)
+    conn.execute('DELETE FROM servico WHERE id = 10')
+    conn.commit()
+    assert [e['port'] for e in events.eventos_desde(conn, desde)[:-1]] == [1]
+
+
+def test_log_sem_cadastro_id_usa_a_linha_atual(conn):
+    desde = events._revisao(conn)
+    conn.execute('UPDATE servico SET servico = ? WHERE id = 10', ('Cais',))
+    conn.execute('UPDATE change_log SET cadastro_id = NULL')  # entradas de antes da coluna
+    conn.commit()
+    assert [e['port'] for e in events.eventos_desde(conn, desde)[:-1]] == [1]
+
+
+def test_muitos_portos_ou_revisao_desconhecida_viram_reset(conn, monkeypatch):
+    monkeypatch.setattr(events, 'LIMITE_PORTOS', 1)
+    (resumo,) = events.eventos_desde(conn, 0)
+    assert resumo['reset'] and resumo['ports'] == 2
+    (resumo,) = events.eventos_desde(conn, 10_000)
+    assert resumo['reset']
+
+
+def test_notificador_publica_commits_de_outra_conexao(conn):
+    notificador = events.Notificador(intervalo=0.05)
+    fila = notificador.assinar()
+    try:
+        conn.execute('UPDATE cadastro SET capex_total = 500 WHERE id = 2')
+        conn.commit()
+        notificador.notificar()
+        evento = fila.get(timeout=5)
+        assert (evento['event'], evento['port']) == ('port', 2)
+        assert fila.get(timeout=5)['event'] == 'summary'
+    finally:
+        notificador.cancelar(fila)
+
+
+def test_formatar():
+    texto = events.formatar({'event': 'port', 'id': 7, 'source': 'portos', 'port': 2})
+    assert texto == 'id: 7\nevent: port\ndata: {"source": "portos", "port": 2}\n\n'
+
+
+def test_stream_nao_perde_gravacao_feita_durante_a_leitura_do_atraso(conn, monkeypatch):
+    import api
+    monkeypatch.setattr(events, 'DURACAO_MAXIMA', 3.0)
+    monkeypatch.setattr(events.notificador, 'intervalo', 0.05)
+    eventos_desde = events.eventos_desde
+
+    def gravar_durante_a_leitura(c, desde, *args):
+        pendentes = eventos_desde(c, desde, *args)
+        monkeypatch.setattr(events, 'eventos_desde', eventos_desde)  # só na leitura do atraso
+        outra = sqlite3.connect(db.DB_PATH)
+        outra.execute('UPDATE cadastro SET capex_total = 500 WHERE id = 2')
+        outra.commit()
+        outra.close()
+        events.notificar()
+        return pendentes
+
+    monkeypatch.setattr(events, 'eventos_desde', gravar_durante_a_leitura)
+    resposta = api.app.test_client().get(f'/api/stream?since={events._revisao(conn)}')
+    recebido = ''
+    for parte in resposta.response:
+        recebido += parte.decode() if isinstance(parte, bytes) else parte
+        if 'event: summary' in recebido:
+            break
+    resposta.close()
+    assert 'event: port\ndata: {"source": "portos", "port": 2}' in recebido
@@ -0,0 +1,51 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+import geo
+
+# Pontos de referência (SIRGAS2000 / UTM sul, EPSG:319xx) gerados com PROJ
+REFERENCIAS = [
+    # (E, N, fuso, lat, lon)
+    (363593.594, 7353304.523, 23, -23.926132, -46.34027),   # Santos - TECON 10
+    (684623.673, 7466421.401, 23, -22.9, -43.2),           # Rio de Janeiro
+    (751294.304, 7177324.867, 22, -25.5, -48.5),           # Paranaguá
+    (200408.482, 8928766.702, 25, -9.68, -35.73),          # Maceió
+    (166507.798, 9656881.022, 21, -3.1, -60.0),            # Manaus
+    (480716.248, 6677873.553, 22, -30.03, -51.2),          # Porto Alegre
+]
+
+
+def test_utm_to_latlon_pontos_de_referencia():
+    e, n, fuso, lat_ref, lon_ref = map(np.array, zip(*REFERENCIAS))
+    lat, lon = geo.utm_to_latlon(e, n, fuso)
+    # 1e-7 graus ~ 1 cm
+    np.testing.assert_allclose(lat, lat_ref, atol=1e-7)
+    np.testing.assert_allclose(lon, lon_ref, atol=1e-7)
+
+
+def test_utm_to_latlon_valores_ausentes():
+    lat, lon = geo.utm_to_latlon([363593.594, np.nan, 363593.594], [7353304.523, 7353304.523, 7353304.523], [23, 23, 99])
+    assert np.isfinite(lat[0]) and np.isfinite(lon[0])
+    assert np.isnan(lat[1:]).all() and np.isnan(lon[1:]).all()
+
+
+def test_save_cadastro_grava_latlon_do_utm(banco):
+    e, n, fuso, lat_ref, lon_ref = REFERENCIAS[0]
+    df00 = pd.DataFrame([
+        {'Zona portuária': 'Porto Organizado de Santos', 'UF': 'SP', 'Obj. de Concessão': 'TECON 10',
+         'Coordenada E (UTM)': e, 'Coordenada S (UTM)': n, 'Fuso': fuso},
+        {'Zona portuária': 'Porto Organizado de Santos', 'UF': 'SP', 'Obj. de Concessão': 'STS10',
+         'Latitude': -23.9, 'Longitude': -46.3, 'Coordenada E (UTM)': e, 'Coordenada S (UTM)': n, 'Fuso': fuso},
+    ])
+    assert db.save_cadastro(df00)
+
+    conn = sqlite3.connect(banco)
+    rows = conn.execute('SELECT latitude, longitude FROM cadastro ORDER BY id').fetchall()
+    conn.close()
+    assert rows[0] == pytest.approx((lat_ref, lon_ref), abs=1e-7)
+    # Latitude/longitude informadas na planilha são mantidas
+    assert rows[1] == pytest.approx((-23.9, -46.3))
@@ -0,0 +1,19 @@
+import pandas as pd
+
+import io_utils as iox
+
+
+def test_edicao_aceita_valores_novos_e_refaz_o_schema():
+    df = iox.apply_dtypes(pd.DataFrame([
+        {'Zona portuária': 'Santos', 'UF': 'SP', 'Tipo': 'Concessão', 'CAPEX Total': '300'},
+    ], columns=iox.COLS_00), iox.DTYPES_00)
+    assert isinstance(df['Zona portuária'].dtype, pd.CategoricalDtype)
+
+    editavel = iox.para_edicao(df)
+    assert editavel['Zona portuária'].dtype == object and editavel['CAPEX Total'].dtype == 'float64'
+    editavel.loc[1] = {**editavel.iloc[0].to_dict(), 'Zona portuária': 'Itaguaí'}  # linha nova no editor
+
+    de_volta = iox.apply_dtypes(editavel, iox.DTYPES_00)
+    assert list(de_volta['Zona portuária']) == ['Santos', 'Itaguaí']
+    assert isinstance(de_volta['Zona portuária'].dtype, pd.CategoricalDtype)
+    assert iox.para_edicao(pd.DataFrame(columns=iox.COLS_02)).empty
@@ -0,0 +1,158 @@
+import io
+import sqlite3
+
+import pandas as pd
+
+import importacao
+import io_utils as iox
+import jobs
+
+
+def _planilha() -> bytes:
+    df00 = pd.DataFrame([
+        {'Zona portuária': 'Santos', 'UF': 'SP', 'Obj. de Concessão': 'STS10', 'Tipo': 'Concessão', 'CAPEX Total': 300},
+        {'Zona portuária': 'Itaguaí', 'UF': 'XX', 'Obj. de Concessão': 'ITG01', 'Tipo': 'Arrendamento', 'CAPEX Total': 100},
+    ], columns=iox.COLS_00)
+    df01 = pd.DataFrame([
+        {'Zona portuária': 'Santos', 'UF': 'SP', 'Obj. de Concessão': 'STS10', 'Tipo de Serviço': 'Dragagem',
+         'Fase': '1ª', 'Serviço': 'Aprofundamento', '% de CAPEX para o serviço': 0.5},
+        {'Zona portuária': 'Rio Grande', 'UF': 'RS', 'Obj. de Concessão': 'RIG01', 'Serviço': 'Cais'},
+    ], columns=iox.COLS_01)
+    df02 = pd.DataFrame(columns=iox.COLS_02)
+    saida = io.BytesIO()
+    iox.write_excel(saida, df00, df01, df02)
+    return saida.getvalue()
+
+
+def test_job_reporta_etapas_e_erro(tmp_path):
+    fila = jobs.Fila(tmp_path / 'jobs.db', etapas=('parse', 'insert'))
+
+    def trabalho(job, valor):
+        job.etapa('parse')
+        job.registrar(valor=valor)
+        job.etapa('insert', 1, 2)
+        return valor * 2
+
+    def falha(job):
+        job.etapa('parse')
+        raise ValueError('planilha inválida')
+
+    ok, erro = fila.submeter('teste', trabalho, 21, guardar_retorno=True), fila.submeter('teste', falha)
+    fila.esperar()
+
+    job = fila.obter(ok)
+    assert job['situacao'] == 'concluido' and job['resultado'] == {'valor': 21}
+    assert {e['situacao'] for e in job['etapas'].values()} == {'concluida'}
+    assert job['etapas']['insert']['total'] == 2
+    assert fila.retirar(ok) == 42 and fila.retirar(ok) is None
+
+    job = fila.obter(erro)
+    assert (job['situacao'], job['erro']) == ('erro', 'planilha inválida')
+    assert job['etapas'] == {'parse': {'situacao': 'erro', 'atual': 0, 'total': None},
+                             'insert': {'situacao': 'pendente', 'atual': 0, 'total': None}}
+    assert fila.obter('inexistente') is None
+
+
+def test_retorno_so_guardado_quando_pedido_e_limitado(tmp_path):
+    fila = jobs.Fila(tmp_path / 'jobs.db', etapas=('parse',))
+    fila.max_retornos = 2
+    sem = fila.submeter('teste', lambda job: 'descartado')
+    com = [fila.submeter('teste', lambda job, i: i, i, guardar_retorno=True) for i in range(3)]
+    fila.esperar()
+    assert fila.obter(sem)['situacao'] == 'concluido' and sem not in fila.retornos
+    assert list(fila.retornos) == com[1:]  # o mais antigo não retirado foi descartado
+    assert fila.retirar(com[0]) is None and fila.retirar(com[2]) == 2
+
+
+def test_etapas_por_job(tmp_path):
+    fila = jobs.Fila(tmp_path / 'jobs.db', etapas=('parse', 'insert'))
+    job_id = fila.submeter('teste', lambda job: job.etapa('parse'), etapas=('parse',))
+    fila.esperar()
+    assert fila.obter(job_id)['etapas'] == {'parse': {'situacao': 'concluida', 'atual': 0, 'total': None}}
+
+
+def test_job_sem_conclusao_vira_erro(tmp_path, monkeypatch):
+    fila = jobs.Fila(tmp_path / 'jobs.db', etapas=('parse',))
+    gravar = fila._gravar
+
+    def gravar_sem_conclusao(job_id, **campos):
+        if 'concluido_em' in campos:
+            raise sqlite3.OperationalError('database is locked')
+        gravar(job_id, **campos)
+
+    monkeypatch.setattr(fila, '_gravar', gravar_sem_conclusao)
+    job_id = fila.submeter('teste', lambda job: None)
+    fila.esperar()  # a exceção da gravação final não escapa do worker
+    monkeypatch.setattr(fila, '_gravar', gravar)
+    assert fila.obter(job_id)['situacao'] == 'executando'
+
+    monkeypatch.setattr(jobs, 'DURACAO_MAXIMA', 0)
+    conn = sqlite3.connect(tmp_path / 'jobs.db')
+    conn.execute("UPDATE importacao_job SET iniciado_em = datetime('now', '-1 minute')")
+    conn.commit()
+    conn.close()
+    job = fila.obter(job_id)
+    assert job['situacao'] == 'erro' and 'sem conclusão' in job['erro']
+    assert fila.obter(job_id)['situacao'] == 'erro'  # gravado
+
+
+def test_importacao_pela_api(banco):
+    import api
+    client = api.app.test_client()
+    resposta = client.post('/api/import', data={'file': (io.BytesIO(_planilha()), 'portos.xlsx')},
+                           content_type='multipart/form-data')
+    assert resposta.status_code == 202
+    job_id = resposta.get_json()['jobId']
+    importacao.fila.esperar()
+
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'concluido', job['error']
+    assert job_id not in importacao.fila.retornos  # ninguém retira os frames pela API
+    assert job['result']['chaves']['servicos_sem_cadastro'] == 1
+    assert job['result']['total_erros'] >= 2  # UF inválida e serviço sem cadastro
+    etapas = {t['stage']: t for t in job['timings']}
+    assert ['parse', 'validate_00', 'validate_01', 'validate_02', 'resolve', 'convert_cadastro',
+            'write_cadastro'] == list(etapas)[:7]
+    assert etapas['parse']['rows'] == 4 and etapas['write_cadastro']['rows'] == 2
+    assert all(t['wallMs'] >= 0 and t['cpuMs'] >= 0 and t['error'] is None for t in job['timings'])
+
+    erros = client.get(f'/api/jobs/{job_id}/errors?format=csv')
+    assert erros.mimetype == 'text/csv'
+    assert erros.get_data(as_text=True).splitlines()[0] == 'tabela,linha,coluna,erro'
+
+    conn = sqlite3.connect(banco)
+    assert conn.execute('SELECT COUNT(*) FROM cadastro').fetchone()[0] == 2
+    assert conn.execute('SELECT COUNT(*) FROM servico').fetchone()[0] == 1
+    conn.close()
+
+    assert client.get('/api/jobs/nao-existe').status_code == 404
+    assert client.post('/api/import').status_code == 400
+
+
+def test_reenvio_do_mesmo_arquivo_nao_reimporta(banco):
+    import api
+    client = api.app.test_client()
+    planilha = _planilha()
+
+    def enviar():
+        return client.post('/api/import', data={'file': (io.BytesIO(planilha), 'portos.xlsx')},
+                           content_type='multipart/form-data')
+
+    primeiro = enviar()
+    assert primeiro.status_code == 202
+    importacao.fila.esperar()
+    segundo = enviar()
+    assert segundo.status_code == 200 and segundo.get_json()['skipped']
+    assert segundo.get_json()['jobId'] == primeiro.get_json()['jobId']
+
+    # Dados alterados depois da importação: o mesmo arquivo volta a ser importado,
+    # mas sem ler nem validar a planilha de novo (frames em cache pelo hash)
+    conn = sqlite3.connect(banco)
+    conn.execute('UPDATE cadastro SET capex_total = 1 WHERE id = 1')
+    conn.commit()
+    conn.close()
+    terceiro = enviar()
+    assert terceiro.status_code == 202
+    importacao.fila.esperar()
+    job = client.get(terceiro.get_json()['statusUrl']).get_json()
+    assert job['status'] == 'concluido' and job['result']['cache']
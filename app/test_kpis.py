@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import pytest
+
+import kpis
+import rollup
+
+
+@pytest.fixture
+def conn(conn):
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, tipo, capex_total) VALUES
+            (1, 'Santos', 'STS10', 'Concessão', 300), (2, 'Itaguaí', 'ITG01', 'Arrendamento', 100);
+        INSERT INTO cadastro_uf VALUES (1, 'SP'), (2, 'RJ');
+        INSERT INTO servico (id, cadastro_id, servico, perc_capex) VALUES (10, 1, 'Dragagem', 1), (20, 2, 'Pátio', 1);
+        INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES (10, 0.5, '2025-01-01');
+    ''')
+    rollup.recalcular(conn)
+    return conn
+
+
+def test_fotografia_do_dia_por_portfolio_uf_e_tipo(conn):
+    assert kpis.fotografar(conn, '2025-01-02') == 5  # portfólio + 2 UFs + 2 tipos
+    (ponto,) = kpis.tendencia(conn)
+    assert ponto == pytest.approx({'periodo': '2025-01-02', 'granularidade': 'dia', 'portos': 2,
+                                   'investimento': 400, 'progresso': 0.375, 'servicos': 2})
+    assert kpis.tendencia(conn, 'uf', 'RJ')[0]['progresso'] == 0
+    # Regravar o mesmo dia substitui a linha
+    conn.execute("INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES (20, 1.0, '2025-01-02')")
+    rollup.recalcular(conn)
+    kpis.fotografar(conn, '2025-01-02')
+    assert [p['progresso'] for p in kpis.tendencia(conn)] == pytest.approx([0.625])
+
+
+def test_compactacao_diario_semanal_mensal(conn):
+    hoje = date(2025, 12, 31)
+    for n in range(900):
+        dia = hoje - timedelta(days=n)
+        conn.execute(kpis.SQL_GRAVAR, ('portfolio', 'Portfólio', dia.isoformat(), 2, 400, n / 1000, 2))
+    kpis.compactar(conn, hoje)
+
+    serie = kpis.tendencia(conn)
+    por_granularidade = {}
+    for p in serie:
+        por_granularidade.setdefault(p['granularidade'], []).append(p)
+    # Diário: ~90 dias a partir de uma segunda-feira; semanal: até 24 meses atrás
+    assert 90 <= len(por_granularidade['dia']) < 97
+    assert date.fromisoformat(por_granularidade['dia'][0]['periodo']).weekday() == 0
+    assert all(date.fromisoformat(p['periodo']).weekday() == 0 for p in por_granularidade['semana'])
+    assert all(p['periodo'].endswith('-01') for p in por_granularidade['mes'])
+    assert por_granularidade['mes'][-1]['periodo'] < '2023-12-01' <= por_granularidade['semana'][0]['periodo']
+    # Cada período agregado guarda o último valor (dia mais recente) do período
+    semana = por_granularidade['semana'][-1]
+    domingo = date.fromisoformat(semana['periodo']) + timedelta(days=6)
+    assert semana['progresso'] == pytest.approx((hoje - domingo).days / 1000)
+    # Compactar de novo não muda nada
+    kpis.compactar(conn, hoje)
+    assert kpis.tendencia(conn) == serie
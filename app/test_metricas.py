@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import consultas
+import db
+import metricas
+import sintetico
+
+
+def _amostras(texto: str) -> dict:
+    """{'nome{rótulos}': valor} das linhas de amostra do formato de exposição."""
+    return {l.rsplit(' ', 1)[0]: float(l.rsplit(' ', 1)[1].replace('+Inf', 'inf'))
+            for l in texto.splitlines() if l and not l.startswith('#')}
+
+
+def test_soma_processos_e_descarta_medidores_de_mortos(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricas, 'DIRETORIO', str(tmp_path))
+    morto = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                           capture_output=True, text=True).stdout.strip()
+    rotulos = [['app', 'teste-soma']]
+    for pid in (os.getppid(), int(morto)):
+        with open(tmp_path / f'{pid}.json', 'w') as f:
+            json.dump({'pid': pid, 'valores': [
+                ['http_requests_in_flight', rotulos, 2],
+                ['http_request_duration_seconds', rotulos, [1] + [0] * len(metricas.FAIXAS_DURACAO) + [0.001]],
+            ]}, f)
+    metricas.incrementar('http_requests_in_flight', 1, app='teste-soma')
+    metricas.observar('http_request_duration_seconds', 20.0, app='teste-soma')
+    metricas.gravar(forcar=True)
+    assert (tmp_path / f'{os.getpid()}.json').exists()
+
+    amostras = _amostras(metricas.exposicao(metricas.coletar()))
+    assert amostras['http_requests_in_flight{app="teste-soma"}'] == 3  # 1 deste + 2 do vivo
+    assert amostras['http_request_duration_seconds_bucket{app="teste-soma",le="0.005"}'] == 2
+    assert amostras['http_request_duration_seconds_bucket{app="teste-soma",le="10.0"}'] == 2
+    assert amostras['http_request_duration_seconds_bucket{app="teste-soma",le="+Inf"}'] == 3
+    assert round(amostras['http_request_duration_seconds_sum{app="teste-soma"}'], 6) == 20.002
+    metricas.incrementar('http_requests_in_flight', -1, app='teste-soma')
+
+
+def _pid_morto() -> int:
+    return int(subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True).stdout)
+
+
+def _gravar_arquivo(caminho, pid, valor, inicio=0.0):
+    with open(caminho, 'w') as f:
+        json.dump({'pid': pid, 'inicio': inicio, 'valores': [
+            ['http_requests_total', [['app', 'teste-mortos']], valor],
+            ['http_requests_in_flight', [['app', 'teste-mortos']], 5],
+        ]}, f)
+
+
+def test_arquivos_de_mortos_sao_incorporados_e_apagados(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricas, 'DIRETORIO', str(tmp_path))
+    mortos = [_pid_morto(), _pid_morto()]
+    for i, pid in enumerate(mortos):
+        _gravar_arquivo(tmp_path / f'{pid}.json', pid, 10 * (i + 1))
+    chave = ('http_requests_total', (('app', 'teste-mortos'),))
+
+    assert metricas.coletar()[chave] == 30
+    assert sorted(a.name for a in tmp_path.glob('*.json')) == ['mortos.json']
+    assert metricas.coletar()[chave] == 30  # nem some nem conta duas vezes
+    assert ('http_requests_in_flight', (('app', 'teste-mortos'),)) not in metricas.coletar()
+
+    # Mais um morto depois: soma ao que já estava incorporado
+    pid = _pid_morto()
+    _gravar_arquivo(tmp_path / f'{pid}.json', pid, 5)
+    assert metricas.coletar()[chave] == 35
+    assert len(list(tmp_path.glob('*.json'))) == 1
+
+
+def test_pid_reaproveitado_nao_sobrescreve_o_morto(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricas, 'DIRETORIO', str(tmp_path))
+    monkeypatch.setattr(metricas, '_arquivo_verificado', False)
+    # Arquivo de um processo anterior que teve o mesmo pid deste
+    _gravar_arquivo(tmp_path / f'{os.getpid()}.json', os.getpid(), 7, inicio=metricas._INICIO - 3600)
+    metricas.gravar(forcar=True)
+    proprio = json.loads((tmp_path / f'{os.getpid()}.json').read_text())
+    assert proprio['inicio'] == metricas._INICIO
+    assert metricas.coletar()[('http_requests_total', (('app', 'teste-mortos'),))] == 7
+
+
+def test_metrics_da_api(tmp_path, monkeypatch):
+    import api
+    sintetico.salvar(sintetico.gerar(0.02, servicos=3, atualizacoes=2), 'sqlite', tmp_path / 'portos.db')
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'portos.db')
+    client = api.app.test_client()
+    consultas.instalar()
+    try:
+        for _ in range(2):
+            assert client.get('/api/portos').status_code == 200
+            assert client.get('/api/analytics?group_by=uf').status_code == 200
+    finally:
+        consultas.desinstalar()
+    assert client.get('/api/portos/999999').status_code == 404
+
+    resposta = client.get('/metrics')
+    assert resposta.status_code == 200 and resposta.mimetype == 'text/plain'
+    amostras = _amostras(resposta.get_data(as_text=True))
+    rota = 'app="api",method="GET",route="/api/portos"'
+    assert amostras[f'http_requests_total{{{rota},status="200"}}'] >= 2
+    assert amostras[f'http_request_duration_seconds_count{{{rota}}}'] >= 2
+    assert amostras[f'http_response_size_bytes_sum{{{rota}}}'] > 0
+    assert amostras[f'http_request_sql_statements_sum{{{rota}}}'] >= 2
+    assert amostras['http_requests_total{app="api",method="GET",route="/api/portos/<int:porto_id>",status="404"}'] >= 1
+    assert amostras['http_requests_in_flight{app="api"}'] == 1  # a própria coleta
+    assert amostras['sqlite_database_size_bytes{app="api",database="portos"}'] == (tmp_path / 'portos.db').stat().st_size
+    assert 0 < amostras['cache_hit_ratio{cache="analytics"}'] < 1
+    assert re.search(r'^# TYPE http_request_duration_seconds histogram$', resposta.get_data(as_text=True), re.M)
@@ -0,0 +1,69 @@
+import io
+
+import pandas as pd
+import pytest
+
+import db
+import importacao
+import io_utils as iox
+import paralelo
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Força o pool de processos mesmo para frames e arquivos pequenos."""
+    monkeypatch.setattr(paralelo, 'PROCESSOS', 2)
+    monkeypatch.setattr(paralelo, 'MIN_LINHAS', 1)
+    monkeypatch.setattr(paralelo, 'MIN_BYTES', 0)
+    monkeypatch.setattr(paralelo, 'LINHAS_POR_BLOCO', 3)
+    yield
+    paralelo.encerrar()
+
+
+def _frames(n=10):
+    df00 = pd.DataFrame({
+        'Zona portuária': [f'Porto {i}' for i in range(n)],
+        'UF': ['SP' if i % 3 else 'XX' for i in range(n)],
+        'Obj. de Concessão': [f'OBJ{i}' for i in range(n)],
+        'Tipo': ['Concessão'] * n,
+        'CAPEX Total': [100.0 * i for i in range(n)],
+    }, columns=iox.COLS_00)
+    df01 = pd.DataFrame({
+        'Zona portuária': [f'Porto {i}' for i in range(n)],
+        'UF': ['SP' if i % 3 else 'XX' for i in range(n)],
+        'Obj. de Concessão': [f'OBJ{i}' if i % 4 else 'SEM' for i in range(n)],
+        'Serviço': [f'S{i}' for i in range(n)],
+        '% de CAPEX para o serviço': [0.5 if i % 5 else 'abc' for i in range(n)],
+    }, columns=iox.COLS_01)
+    return df00, df01, pd.DataFrame(columns=iox.COLS_02)
+
+
+def test_validacao_em_blocos_preserva_a_ordem(pool):
+    df00, df01, df02 = _frames()
+    assert len(paralelo.blocos(df01)) == 4
+    paralela = importacao.validar(df00, df01, df02)
+    paralelo.encerrar()
+    paralelo.PROCESSOS = 1
+    serial = importacao.validar(df00, df01, df02)
+    pd.testing.assert_frame_equal(paralela, serial)
+    linhas01 = list(paralela.loc[paralela['tabela'] == '01', 'linha'])
+    assert {0, 4, 5, 8} <= set(linhas01) and linhas01 == sorted(linhas01)
+
+
+def test_conversao_em_blocos_igual_a_serial(pool, banco):
+    df00, df01, _ = _frames()
+    assert db.save_cadastro(df00)
+    blocos = paralelo.mapear_blocos(db._df_to_db_servicos, df01, db.DB_PATH)
+    assert len(blocos) == 4
+    assert [r for b in blocos for r in b] == db._df_to_db_servicos(df01)
+
+
+def test_leitura_das_planilhas_em_processos(pool):
+    df00, df01, df02 = _frames()
+    arquivo = io.BytesIO()
+    iox.write_excel(arquivo, df00, df01, df02)
+    lidas = iox.read_excel(arquivo.getvalue())
+    paralelo.MIN_BYTES = float('inf')
+    for lida, serial in zip(lidas, iox.read_excel(io.BytesIO(arquivo.getvalue()))):
+        pd.testing.assert_frame_equal(lida, serial)
+    assert len(lidas[0]) == 10
@@ -0,0 +1,58 @@
+import re
+import time
+
+from flask import Flask, jsonify, request
+
+import perfilador
+
+
+def _app():
+    app = Flask('teste')
+
+    def calcular():
+        fim = time.perf_counter() + 0.05
+        while time.perf_counter() < fim:
+            sum(range(1000))
+
+    @app.route('/lento')
+    def lento():
+        calcular()
+        return jsonify({'args': sorted(request.args)})
+    return app
+
+
+def test_sem_token_nada_e_instalado(monkeypatch):
+    monkeypatch.delenv('DEBUG_TOKEN', raising=False)
+    app = _app()
+    perfilador.registrar(app)
+    assert not isinstance(app.wsgi_app, perfilador.Perfilador)
+    assert app.test_client().get('/lento?__profile=resumo').get_json() == {'args': ['__profile']}
+
+
+def test_perfil_sob_demanda(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEBUG_TOKEN', 'segredo')
+    monkeypatch.setattr(perfilador, 'DIRETORIO', tmp_path)
+    app = _app()
+    perfilador.registrar(app)
+    client = app.test_client()
+
+    assert client.get('/lento?x=1').get_json() == {'args': ['x']}
+    token = {'X-Debug-Token': 'segredo'}
+    assert client.get('/lento?__profile=resumo', headers={'X-Debug-Token': 'errado'}).status_code == 403
+    assert client.get('/lento?__profile=resumo&__token=segredo').status_code == 403  # token só no cabeçalho
+    assert client.get('/lento?__profile=tudo', headers=token).status_code == 400
+
+    texto = client.get('/lento?__profile=resumo&__profile_top=5', headers=token).get_data(as_text=True)
+    assert texto.startswith('# teste GET /lento 200 OK') and 'calcular' in texto
+
+    pilhas = client.get('/lento', headers={'X-Profile': 'pilhas', 'X-Debug-Token': 'segredo'}).get_data(as_text=True)
+    linhas = pilhas.splitlines()
+    assert linhas and all(re.fullmatch(r'\S.* \d+', l) for l in linhas)
+    assert any('test_perfilador:lento;test_perfilador:calcular' in l for l in linhas)
+
+    resposta = client.get('/lento?x=1&__profile=1', headers=token)
+    assert resposta.get_json() == {'args': ['x']}  # parâmetros do perfil não chegam à view
+    perfil_id = resposta.headers['X-Profile-Id']
+    assert float(resposta.headers['X-Profile-Wall-Ms']) >= 50
+    assert (tmp_path / f'{perfil_id}.txt').read_text().startswith('# teste GET /lento')
+    assert (tmp_path / f'{perfil_id}.folded').stat().st_size > 0
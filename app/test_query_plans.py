@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+import db
+import rollup
+import spatial
+
+
+def _plano(conn, sql, params):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def _assert_sem_scan_nem_sort(plano, permitir_scan_indice=False):
+    for passo in plano:
+        assert 'TEMP B-TREE' not in passo, plano
+        if passo.startswith('SCAN'):
+            if 'VIRTUAL TABLE' in passo:
+                continue  # R*Tree / FTS5 usam o próprio índice
+            assert permitir_scan_indice and re.search(r'USING (COVERING )?INDEX', passo), plano
+
+
+CONSULTAS_PONTUAIS = {
+    'porto por id': (db.SQL_PORTO, (1,)),
+    'UFs do porto': (db.SQL_PORTO_UFS, (1,)),
+    'serviços do porto ordenados': (db.SQL_PORTO_SERVICOS, (1,)),
+    'últimas 10 atualizações do porto': (db.SQL_PORTO_ULTIMAS_ATUALIZACOES, (1,)),
+    'portos por id (nearest)': (db.SQL_PORTOS.format(where='c.id IN (?, ?, ?)', order='c.id'), (1, 2, 3)),
+}
+
+
+@pytest.mark.parametrize('nome', CONSULTAS_PONTUAIS)
+def test_consultas_pontuais_usam_indice(conn, nome):
+    sql, params = CONSULTAS_PONTUAIS[nome]
+    _assert_sem_scan_nem_sort(_plano(conn, sql, params))
+
+
+def test_chaves_naturais_numa_leitura_sem_ordenacao(conn):
+    # _df_to_db_servicos/_acompanhamento leem todas as chaves de uma vez: cadastro
+    # pelo índice da chave (cobre zona, objeto e id) e serviço na ordem do id,
+    # buscando o cadastro pela chave primária
+    _assert_sem_scan_nem_sort(_plano(conn, db.SQL_CADASTRO_IDS, ()), permitir_scan_indice=True)
+    plano = _plano(conn, db.SQL_SERVICO_IDS, ())
+    assert not any('TEMP B-TREE' in passo for passo in plano), plano
+    assert any(passo.startswith('SEARCH c USING INTEGER PRIMARY KEY') for passo in plano), plano
+
+
+def test_portos_por_bbox_usa_rtree(conn):
+    sql = db.SQL_PORTOS.format(where=spatial.bbox_filter(conn), order='c.id')
+    plano = _plano(conn, sql, spatial.bbox_params((-50, -25, -45, -20)))
+    assert any('cadastro_rtree' in passo for passo in plano), plano
+    _assert_sem_scan_nem_sort(plano)
+
+
+def test_lista_de_portos_percorre_indice_ordenado(conn):
+    # Listar todos os portos lê a tabela inteira, mas deve fazê-lo pelo índice
+    # da chave natural (já na ordem do ORDER BY) e sem ordenação temporária.
+    sql = db.SQL_PORTOS.format(where='1', order=db.PORTOS_ORDEM_NOME)
+    _assert_sem_scan_nem_sort(_plano(conn, sql, ()), permitir_scan_indice=True)
+
+
+def test_acompanhamento_atual_busca_ultimo_por_indice(conn):
+    # O último acompanhamento de cada serviço sai do índice (servico_id,
+    # data_atualizacao DESC, id DESC) com LIMIT 1, sem varrer o histórico.
+    sql = 'SELECT MAX(v.perc_executada) FROM vw_acompanhamento_atual v WHERE v.cadastro_id = ?'
+    plano = _plano(conn, sql, (1,))
+    assert any('ix_acomp_servico_atual' in passo for passo in plano), plano
+    _assert_sem_scan_nem_sort(plano)
+
+
+def test_recalculo_de_progresso_so_le_portos_pendentes(conn):
+    plano = _plano(conn, rollup.SQL_RECALCULAR_PENDENTES, ())
+    assert not any('MATERIALIZE' in passo for passo in plano), plano
+    _assert_sem_scan_nem_sort(plano)
+
+
+def test_progresso_em_data_busca_pelo_indice_de_servico_e_data(conn):
+    # Uma consulta para todos os serviços: percorre servico pelo índice e, para
+    # cada um, busca o último acompanhamento até a data sem varrer o histórico.
+    plano = _plano(conn, rollup.SQL_PROGRESSO_EM, {'data': '2025-12-31'})
+    assert any('ix_acomp_servico_atual (servico_id=? AND data_atualizacao<?)' in passo for passo in plano), plano
+    _assert_sem_scan_nem_sort(plano, permitir_scan_indice=True)
@@ -0,0 +1,86 @@
+import pytest
+
+import rollup
+
+
+@pytest.fixture
+def conn(conn):
+    # Porto 1 (SP, Concessão, R$ 300): serviços com peso 0,75 e 0,25
+    # Porto 2 (RJ/SP, Arrendamento, R$ 100): um serviço sem peso
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, tipo, capex_total) VALUES
+            (1, 'Santos', 'STS10', 'Concessão', 300), (2, 'Itaguaí', 'ITG01', 'Arrendamento', 100);
+        INSERT INTO cadastro_uf VALUES (1, 'SP'), (2, 'RJ'), (2, 'SP');
+        INSERT INTO servico (id, cadastro_id, servico, perc_capex) VALUES
+            (10, 1, 'Dragagem', 0.75), (11, 1, 'Cais', 0.25), (20, 2, 'Pátio', NULL);
+        INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES
+            (10, 0.9, '2025-01-01'), (10, 0.4, '2025-06-01'),
+            (11, 0.2, '2025-06-01'),
+            (20, 0.5, '2025-06-01');
+    ''')
+    rollup.recalcular(conn)
+    conn.commit()
+    return conn
+
+
+def _progresso(conn, cadastro_id):
+    return conn.execute('SELECT progresso FROM progresso_porto WHERE cadastro_id = ?', (cadastro_id,)).fetchone()[0]
+
+
+def test_progresso_do_porto_ponderado_pelo_ultimo_acompanhamento(conn):
+    # 0,75 × 0,4 (último, não o máximo 0,9) + 0,25 × 0,2
+    assert _progresso(conn, 1) == pytest.approx(0.35)
+    # Sem pesos informados: média simples
+    assert _progresso(conn, 2) == pytest.approx(0.5)
+
+
+def test_rollup_ponderado_pelo_capex_do_porto(conn):
+    assert rollup.progresso_portfolio(conn) == pytest.approx((300 * 0.35 + 100 * 0.5) / 400)
+    por_uf = {l['chave']: l for l in rollup.rollup(conn, 'uf')}
+    assert por_uf['RJ']['progresso'] == pytest.approx(0.5)
+    assert por_uf['SP']['portos'] == 2  # porto com duas UFs entra em ambas
+    por_tipo = {l['chave']: l['progresso'] for l in rollup.rollup(conn, 'tipo')}
+    assert por_tipo == pytest.approx({'Arrendamento': 0.5, 'Concessão': 0.35})
+    with pytest.raises(ValueError):
+        rollup.rollup(conn, 'setor')
+
+
+def test_alteracao_recalcula_apenas_o_porto_afetado(conn):
+    conn.execute("INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES (11, 1.0, '2025-07-01')")
+    assert [r[0] for r in conn.execute('SELECT cadastro_id FROM progresso_porto_pendente')] == [1]
+    assert rollup.recalcular(conn) == 1
+    assert _progresso(conn, 1) == pytest.approx(0.75 * 0.4 + 0.25 * 1.0)
+
+    conn.execute('UPDATE servico SET perc_capex = 0.5 WHERE id IN (10, 11)')
+    assert rollup.recalcular(conn) == 1
+    assert _progresso(conn, 1) == pytest.approx(0.7)
+
+    conn.execute('DELETE FROM cadastro WHERE id = 2')
+    assert conn.execute('SELECT COUNT(*) FROM progresso_porto WHERE cadastro_id = 2').fetchone()[0] == 0
+
+
+def test_progresso_como_estava_em_uma_data(conn):
+    # Em 2025-03-01 só havia o acompanhamento de 0,9 da dragagem
+    assert rollup.progresso_em(conn, '2025-03-01') == pytest.approx({1: 0.75 * 0.9, 2: 0.0})
+    assert rollup.progresso_em(conn, '2025-06-01') == pytest.approx({1: 0.35, 2: 0.5})
+    assert rollup.progresso_portfolio(conn, '2024-12-31') == 0
+    por_tipo = {l['chave']: l['progresso'] for l in rollup.rollup(conn, 'tipo', '2025-03-01')}
+    assert por_tipo == pytest.approx({'Arrendamento': 0.0, 'Concessão': 0.675})
+
+
+def test_fotografias_mensais(conn):
+    mensal = dict(conn.execute("SELECT mes, progresso FROM progresso_mensal WHERE cadastro_id = 1 AND mes <= '2025-06'"))
+    assert list(mensal) == [f'2025-{m:02d}' for m in range(1, 7)]
+    assert mensal['2025-05'] == pytest.approx(0.675)
+    assert mensal['2025-06'] == pytest.approx(0.35)
+
+    serie = rollup.serie_mensal(conn, '2024-12', '2025-06', cadastro_id=1)
+    assert [p['mes'] for p in serie] == ['2024-12'] + [f'2025-{m:02d}' for m in range(1, 7)]
+    assert [p['progresso'] for p in serie] == pytest.approx([0, 0.675, 0.675, 0.675, 0.675, 0.675, 0.35])
+    # Portfólio: porto 2 (R$ 100) só tem dados a partir de junho
+    assert rollup.serie_mensal(conn, '2025-06', '2025-06')[0]['progresso'] == pytest.approx((300 * 0.35 + 100 * 0.5) / 400)
+
+    # Um acompanhamento retroativo refaz as fotografias do porto
+    conn.execute("INSERT INTO acompanhamento (servico_id, perc_executada, data_atualizacao) VALUES (11, 0.6, '2025-03-15')")
+    rollup.recalcular(conn)
+    assert rollup.serie_mensal(conn, '2025-03', '2025-03', cadastro_id=1)[0]['progresso'] == pytest.approx(0.675 + 0.25 * 0.6)
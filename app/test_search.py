@@ -0,0 +1,79 @@
+import pytest
+
+import db
+import search
+
+
+@pytest.fixture
+def conn(conn):
+    conn.executescript('''
+        INSERT INTO cadastro (id, zona_portuaria, obj_concessao, descricao) VALUES
+            (1, 'Santos', 'STS10', 'Terminal de contêineres com dragagem do canal'),
+            (2, 'Itaguaí', 'ITG02', 'Granéis <b>sólidos</b>');
+        INSERT INTO servico (id, cadastro_id, servico, descricao_servico) VALUES
+            (10, 1, 'Dragagem', 'Dragagem de aprofundamento do berço'),
+            (11, 2, 'Cais', 'Reforço estrutural');
+        INSERT INTO acompanhamento (id, servico_id, descricao, risco_descricao, data_atualizacao) VALUES
+            (100, 10, 'Licenciamento em andamento', 'Atraso na licença de dragagem', '2025-01-01');
+    ''')
+    conn.commit()
+    return conn
+
+
+def _achados(conn, texto):
+    return {(r['type'], r['id']) for r in search.search(conn, texto)}
+
+
+def test_to_match_query():
+    assert search.to_match_query('dragagem  do canal') == '"dragagem"* "do"* "canal"*'
+    assert search.to_match_query('"; DROP TABLE cadastro --') == '"DROP"* "TABLE"* "cadastro"*'
+    assert search.to_match_query('  !! ') == ''
+
+
+def test_busca_nas_tres_tabelas_sem_acentos_e_por_prefixo(conn):
+    assert _achados(conn, 'dragag') == {('cadastro', 1), ('servico', 10), ('acompanhamento', 100)}
+    assert _achados(conn, 'conteineres') == {('cadastro', 1)}
+    assert _achados(conn, 'licenca dragagem') == {('acompanhamento', 100)}
+    assert search.search(conn, '   ') == []
+
+
+def test_resultado_e_trecho_escapado(conn):
+    (r,) = search.search(conn, 'solidos')
+    assert r == {'type': 'cadastro', 'id': 2, 'portoId': 2, 'title': 'Itaguaí - ITG02',
+                 'snippet': 'Granéis &lt;b&gt;<mark>sólidos</mark>&lt;/b&gt;', 'rank': r['rank'], 'score': 1.0}
+    (r,) = search.search(conn, 'licenciamento')
+    assert r['portoId'] == 1 and r['title'] == 'Dragagem (2025-01-01)'
+
+
+def test_ranking_intercala_as_tabelas_pela_posicao(conn):
+    # Muitos serviços com o termo não podem empurrar o melhor cadastro para o fim
+    conn.executemany('INSERT INTO servico (cadastro_id, servico, descricao_servico) VALUES (2, ?, ?)',
+                     [(f'Serviço {i}', 'dragagem ' * (i + 1)) for i in range(10)])
+    conn.commit()
+    resultados = search.search(conn, 'dragagem', limit=5)
+    assert [r['type'] for r in resultados[:3]] == ['cadastro', 'servico', 'acompanhamento']
+    assert all(r['score'] == 1.0 for r in resultados[:3])
+    assert len(resultados) == 5 and all(0 < r['score'] <= 1 for r in resultados)
+
+
+def test_triggers_mantem_o_indice_em_sincronia(conn):
+    conn.execute("INSERT INTO cadastro (id, zona_portuaria, obj_concessao, descricao) "
+                 "VALUES (3, 'Pecém', 'PEC01', 'Hub de hidrogênio verde')")
+    conn.commit()
+    assert _achados(conn, 'hidrogenio') == {('cadastro', 3)}
+
+    conn.execute("UPDATE cadastro SET descricao = 'Terminal de amônia' WHERE id = 3")
+    conn.execute("UPDATE servico SET descricao_servico = 'Derrocagem' WHERE id = 10")
+    conn.commit()
+    assert _achados(conn, 'hidrogenio') == set()
+    assert _achados(conn, 'amonia') == {('cadastro', 3)}
+    assert _achados(conn, 'derrocagem') == {('servico', 10)}
+    assert ('servico', 10) in _achados(conn, 'dragagem')  # o título do serviço continua indexado
+
+    conn.execute('DELETE FROM acompanhamento WHERE id = 100')
+    conn.execute('DELETE FROM cadastro WHERE id = 3')
+    conn.commit()
+    assert _achados(conn, 'licenciamento') == set()
+    assert _achados(conn, 'amonia') == set()
+    for tabela in db.FTS_TABLES:  # índice confere com a tabela de conteúdo (levanta se divergir)
+        conn.execute(f"INSERT INTO {tabela}_fts({tabela}_fts, rank) VALUES ('integrity-check', 1)")
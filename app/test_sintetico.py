@@ -0,0 +1,57 @@
+import json
+import sqlite3
+from datetime import date
+
+import pandas as pd
+
+import db
+import importacao
+import io_utils as iox
+import services as svc
+import sintetico
+
+
+def test_dados_validos_e_ordenados():
+    df00, df01, df02 = sintetico.gerar(escala=0.05, servicos=4, atualizacoes=6)
+    assert (len(df00), len(df01), len(df02)) == (5, 20, 120)
+    assert set(df00['UF']) <= set(svc.UF_LIST) and set(df00['Tipo']) <= set(svc.TIPO_LIST)
+    assert not df00.duplicated(['Zona portuária', 'Obj. de Concessão']).any()
+    assert not df01.duplicated(['Zona portuária', 'Obj. de Concessão', 'Tipo de Serviço', 'Fase', 'Serviço']).any()
+    assert importacao.validar(df00, df01, df02).empty
+
+    assert (df01['Data de início'] < df01['Data final']).all()
+    por_servico = df02.groupby(['Obj. de Concessão', 'Serviço'], observed=True)
+    assert por_servico['Data da atualização'].apply(lambda s: s.is_monotonic_increasing).all()
+    assert por_servico['% executada'].apply(lambda s: s.is_monotonic_increasing).all()
+    assert df01.groupby('Obj. de Concessão', observed=True)['% de CAPEX para o serviço'].sum().round(2).eq(1).all()
+    pd.testing.assert_frame_equal(df02, sintetico.gerar(escala=0.05, servicos=4, atualizacoes=6)[2])
+
+
+def test_atualizacoes_nao_passam_da_data_de_referencia():
+    for atualizacoes in (1, 50, 200):
+        _, _, df02 = sintetico.gerar(escala=0.2, servicos=5, atualizacoes=atualizacoes)
+        assert len(df02) == 20 * 5 * atualizacoes
+        assert df02['Data da atualização'].max() < pd.Timestamp(sintetico.HOJE)
+    df00, _, df02 = sintetico.gerar(escala=0.2, servicos=5, atualizacoes=12, hoje=date(2030, 1, 15))
+    assert df02['Data da atualização'].max() < pd.Timestamp(2030, 1, 1)
+    assert df00['Data de assinatura do contrato'].dt.year.max() > sintetico.HOJE.year - 12
+
+
+def test_saidas(tmp_path):
+    caminho_db = db.DB_PATH
+    assert sintetico.main(['--escala', '0.02', '--servicos', '3', '--atualizacoes', '2',
+                           '--formato', 'sqlite', '--saida', str(tmp_path / 'sf.db')]) == 0
+    assert db.DB_PATH == caminho_db
+    conn = sqlite3.connect(tmp_path / 'sf.db')
+    assert [conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+            for t in ('cadastro', 'servico', 'acompanhamento')] == [2, 6, 12]
+    conn.close()
+
+    frames = sintetico.gerar(escala=0.02, servicos=3, atualizacoes=2)
+    sintetico.salvar(frames, 'excel', tmp_path / 'sf.xlsx')
+    assert [len(df) for df in iox.read_excel(tmp_path / 'sf.xlsx')] == [2, 6, 12]
+    sintetico.salvar(frames, 'json', tmp_path / 'sf.json')
+    dados = json.loads((tmp_path / 'sf.json').read_text(encoding='utf-8'))
+    acompanhamento = dados['Tabela 02 - Acompanhamento'][0]
+    assert acompanhamento['Data da atualização'].endswith('00:00:00')
+    assert acompanhamento['Local'] == frames[0]['Zona portuária'][0] and 'Setor2' in acompanhamento
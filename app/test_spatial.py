@@ -0,0 +1,86 @@
+import pytest
+
+import db
+import spatial
+
+PORTOS = [
+    # (id, latitude, longitude)
+    (1, -23.95, -46.33),   # Santos
+    (2, -22.90, -43.20),   # Rio de Janeiro
+    (3, -25.50, -48.50),   # Paranaguá
+    (4, -3.10, -60.00),    # Manaus
+    (5, -30.03, -51.20),   # Porto Alegre
+]
+
+
+@pytest.fixture(params=[True, False], ids=['rtree', 'sem-rtree'])
+def rtree(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(db, '_criar_indice_espacial', lambda cursor: False)
+    return request.param
+
+
+@pytest.fixture
+def conn(rtree, conn):  # rtree antes: o banco é criado já sem o índice
+    conn.executemany("INSERT INTO cadastro (id, zona_portuaria, obj_concessao, latitude, longitude) "
+                     "VALUES (?, 'Zona', 'OBJ' || ?, ?, ?)", [(i, i, la, lo) for i, la, lo in PORTOS])
+    conn.execute("INSERT INTO cadastro (id, zona_portuaria, obj_concessao) VALUES (6, 'Sem', 'COORD')")
+    conn.commit()
+    assert spatial.has_rtree(conn) is rtree
+    return conn
+
+
+def _ids(conn, bbox):
+    return sorted(r[0] for r in spatial.ids_in_bbox(conn, bbox))
+
+
+def test_parse_bbox():
+    assert spatial.parse_bbox('-50,-30,-40,-20') == (-50, -30, -40, -20)
+    for texto in ('-50,-30,-40', '-40,-30,-50,-20', '-50,-20,-40,-30', 'a,b,c,d'):
+        with pytest.raises(ValueError):
+            spatial.parse_bbox(texto)
+
+
+def test_filtro_bbox(conn):
+    assert _ids(conn, (-50, -27, -42, -22)) == [1, 2, 3]
+    assert _ids(conn, (-46.33, -23.95, -46.33, -23.95)) == [1]  # borda inclusiva
+    assert _ids(conn, (-180, -90, 180, 90)) == [1, 2, 3, 4, 5]
+    assert _ids(conn, (0, 0, 10, 10)) == []
+
+
+def test_mais_proximos_em_ordem_de_distancia(conn):
+    vizinhos = spatial.nearest(conn, -23.96, -46.30, k=3)
+    assert [i for i, _ in vizinhos] == [1, 3, 2]
+    distancias = [d for _, d in vizinhos]
+    assert distancias == sorted(distancias)
+    assert distancias[0] == pytest.approx(spatial.haversine_km(-23.96, -46.30, [-23.95], [-46.33])[0])
+    assert distancias[0] < 5
+
+
+def test_mais_proximos_alem_da_primeira_caixa(conn):
+    # Manaus fica a mais de 10° de qualquer outro porto: a caixa precisa crescer
+    vizinhos = spatial.nearest(conn, -3.10, -60.00, k=3)
+    assert [i for i, _ in vizinhos] == [4, 1, 3]  # Santos (~2744 km) antes de Paranaguá (~2778 km)
+    assert vizinhos[0][1] == pytest.approx(0)
+    assert vizinhos[1][1] == pytest.approx(spatial.haversine_km(-3.10, -60.00, [-23.95], [-46.33])[0])
+    assert len(spatial.nearest(conn, 0, 0, k=50)) == 5  # k maior que o total
+
+
+def test_haversine_um_grau_de_meridiano():
+    assert spatial.haversine_km(-23.0, -46.0, [-24.0], [-46.0])[0] == pytest.approx(spatial.KM_POR_GRAU)
+
+
+def test_indice_acompanha_alteracao_e_exclusao(conn):
+    conn.execute('UPDATE cadastro SET latitude = -1.45, longitude = -48.50 WHERE id = 1')  # Santos -> Belém
+    conn.execute('UPDATE cadastro SET latitude = -3.72, longitude = -38.52 WHERE id = 6')  # ganhou coordenadas
+    conn.execute('DELETE FROM cadastro WHERE id = 2')
+    conn.execute('UPDATE cadastro SET latitude = NULL WHERE id = 5')
+    conn.commit()
+    assert _ids(conn, (-50, -27, -42, -22)) == [3]
+    assert _ids(conn, (-50, -5, -38, 0)) == [1, 6]
+    assert _ids(conn, (-180, -90, 180, 90)) == [1, 3, 4, 6]
+    assert [i for i, _ in spatial.nearest(conn, -23.96, -46.30, k=2)] == [3, 6]
+    if spatial.has_rtree(conn):
+        indexados = conn.execute('SELECT id, min_lat, min_lon FROM cadastro_rtree ORDER BY id').fetchall()
+        assert [(i, round(la, 2), round(lo, 2)) for i, la, lo in indexados] == [
+            (1, -1.45, -48.5), (3, -25.5, -48.5), (4, -3.1, -60.0), (6, -3.72, -38.52)]
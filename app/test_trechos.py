@@ -0,0 +1,44 @@
+import json
+import logging
+import tracemalloc
+
+import pytest
+
+import trechos
+
+
+def test_trechos_aninhados_com_memoria_e_erro(caplog, monkeypatch):
+    monkeypatch.setattr(trechos, 'MEMORIA', True)
+    assert not tracemalloc.is_tracing()
+    with caplog.at_level(logging.INFO, logger='trechos'):
+        with trechos.medir('teste', job='abc') as medicao:
+            assert tracemalloc.is_tracing()
+            with trechos.trecho('externo', linhas=3):
+                with trechos.trecho('interno') as t:
+                    bloco = bytearray(8 * 2**20)
+                    t['linhas'] = len(bloco)
+                del bloco
+            with pytest.raises(ValueError):
+                with trechos.trecho('falha'):
+                    raise ValueError('coluna ausente')
+    assert not tracemalloc.is_tracing()
+
+    interno, externo, falha = medicao.registros
+    assert (interno['trecho'], interno['linhas']) == ('interno', 8 * 2**20)
+    assert interno['memoria_pico_mb'] >= 8 and externo['memoria_pico_mb'] >= interno['memoria_pico_mb']
+    assert externo['parede_ms'] >= interno['parede_ms'] and externo['linhas'] == 3
+    assert falha['erro'] == 'coluna ausente'
+
+    linhas = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'trechos']
+    assert [(l['medicao'], l['job'], l['trecho']) for l in linhas] == [
+        ('teste', 'abc', 'interno'), ('teste', 'abc', 'externo'), ('teste', 'abc', 'falha')]
+    assert trechos.para_api([falha])[0]['error'] == 'coluna ausente'
+
+
+def test_trecho_fora_de_medicao_nao_registra():
+    with trechos.trecho('solto', linhas=1) as t:
+        pass
+    assert t == {'trecho': 'solto', 'linhas': 1}
+    with trechos.medir('sem memória') as medicao, trechos.trecho('etapa'):
+        assert not tracemalloc.is_tracing()  # padrão: IMPORT_TRACEMALLOC desligado
+    assert 'memoria_pico_mb' not in medicao.registros[0]
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import List, Optional
+
+# Trechos cronometrados de um processamento em etapas (a importação de uma
+# planilha): linhas, tempo de parede, tempo de CPU e pico de memória de cada
+# etapa, registrados como uma linha JSON por trecho (logger trechos).
+#
+# medir() abre a medição no contexto atual; trecho() em qualquer ponto do
+# caminho (importacao.py, db.py) entra nela, e não faz nada fora de uma medição.
+# O tempo de CPU é o da thread que executa o trecho: o trabalho nos processos
+# de paralelo.py aparece só no tempo de parede. O pico de memória vem do
+# tracemalloc, ligado enquanto houver medições abertas: é o acréscimo sobre a
+# memória do início do trecho, e inclui as alocações de outras threads do
+# processo no mesmo intervalo. Opt-in (IMPORT_TRACEMALLOC=1): rastrear cada
+# alocação deixa a importação ~4x mais lenta (openpyxl aloca muito).
+
+MEMORIA = bool(os.environ.get('IMPORT_TRACEMALLOC'))
+
+logger = logging.getLogger('trechos')
+
+_ativa: ContextVar[Optional['Medicao']] = ContextVar('trechos_ativa', default=None)
+_lock = threading.Lock()
+_medicoes_com_memoria = 0
+
+class Medicao:
+    """Trechos concluídos de uma medição, na ordem em que terminaram."""
+
+    def __init__(self, nome: str, memoria: bool, **contexto):
+        self.nome = nome
+        self.memoria = memoria
+        self.contexto = contexto
+        self.registros: List[dict] = []
+        self._abertos: List[list] = []  # [pico de memória já visto] de cada trecho aberto
+
+def _configurar_log() -> None:
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+def _ligar_memoria() -> bool:
+    global _medicoes_com_memoria
+    if not MEMORIA:
+        return False
+    with _lock:
+        if _medicoes_com_memoria == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _medicoes_com_memoria = 1
+        elif _medicoes_com_memoria:
+            _medicoes_com_memoria += 1
+        # tracemalloc já ligado por outra pessoa: só lemos
+    return tracemalloc.is_tracing()
+
+def _desligar_memoria() -> None:
+    global _medicoes_com_memoria
+    with _lock:
+        if _medicoes_com_memoria:
+            _medicoes_com_memoria -= 1
+            if _medicoes_com_memoria == 0:
+                tracemalloc.stop()
+
+@contextlib.contextmanager
+def medir(nome: str, **contexto):
+    """Abre uma medição; `contexto` (ex.: job=...) entra em cada linha de log."""
+    _configurar_log()
+    medicao = Medicao(nome, _ligar_memoria(), **contexto)
+    token = _ativa.set(medicao)
+    try:
+        yield medicao
+    finally:
+        _ativa.reset(token)
+        if medicao.memoria:
+            _desligar_memoria()
+
+@contextlib.contextmanager
+def trecho(nome: str, linhas: Optional[int] = None):
+    """Cronometra o bloco na medição ativa. Devolve o registro do trecho, que o
+    bloco pode completar (ex.: t['linhas'] = ... depois de ler a planilha)."""
+    medicao = _ativa.get()
+    registro = {'trecho': nome, 'linhas': linhas}
+    if medicao is None:
+        yield registro
+        return
+    pico = None
+    if medicao.memoria:
+        atual, pico_pai = tracemalloc.get_traced_memory()
+        for aberto in medicao._abertos:
+            aberto[0] = max(aberto[0], pico_pai)
+        tracemalloc.reset_peak()
+        pico = [atual]
+        medicao._abertos.append(pico)
+    parede, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield registro
+    except BaseException as e:
+        registro['erro'] = str(e) or type(e).__name__
+        raise
+    finally:
+        registro['parede_ms'] = round((time.perf_counter() - parede) * 1000, 2)
+        registro['cpu_ms'] = round((time.thread_time() - cpu) * 1000, 2)
+        if pico is not None:
+            medicao._abertos.pop()
+            pico_trecho = max(pico[0], tracemalloc.get_traced_memory()[1])
+            for aberto in medicao._abertos:
+                aberto[0] = max(aberto[0], pico_trecho)
+            registro['memoria_pico_mb'] = round((pico_trecho - atual) / 2**20, 2)
+        medicao.registros.append(registro)
+        logger.info(json.dumps({'medicao': medicao.nome, **medicao.contexto, **registro},
+                               ensure_ascii=False, default=str))
+
+def para_api(registros: List[dict]) -> List[dict]:
+    """Trechos no formato das APIs (camelCase)."""
+    return [{
+        'stage': r['trecho'],
+        'rows': r.get('linhas'),
+        'wallMs': r.get('parede_ms'),
+        'cpuMs': r.get('cpu_ms'),
+        'peakMemoryMb': r.get('memoria_pico_mb'),
+        'error': r.get('erro'),
+    } for r in registros]